@@ -105,6 +105,7 @@ add_library(metaspore_shared SHARED
     cpp/metaspore/ps_helper.cpp
     cpp/metaspore/sparse_feature_extractor.cpp
     cpp/metaspore/model_metric_buffer.cpp
+    cpp/metaspore/sparse_updater_kernels.cpp
     cpp/metaspore/tensor_utils.cpp
     cpp/metaspore/pybind_utils.cpp
     cpp/metaspore/ms_ps_python_bindings.cpp
@@ -142,5 +142,7 @@ if(BUILD_TRAIN_PKG)
     add_py_test(test_sparse_wdl_train_export sparse_wdl_export_demo.py)
     add_py_test(test_sparse_wdl_export sparse_wdl_export_test.py)
     add_py_test(test_sparse_wdl_grpc sparse_wdl_grpc_test.py)
+    add_py_test(test_sparse_storage_type sparse_storage_type_test.py)
+    add_py_test(test_sparse_updater_kernels sparse_updater_kernels_test.py)
     add_py_test(test_two_tower_retrieval_milvus two_tower_retrieval_milvus.py)
 endif()
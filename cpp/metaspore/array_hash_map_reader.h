@@ -23,6 +23,7 @@
 #include <metaspore/stack_trace_utils.h>
 #include <metaspore/string_utils.h>
 #include <sstream>
+#include <vector>
 
 namespace metaspore {
 
@@ -30,10 +31,11 @@ class ArrayHashMapReader {
   public:
     ArrayHashMapReader(SparseTensorMeta &meta, ArrayHashMap<uint64_t, uint8_t> &data,
                        Stream *stream, bool data_only, bool transform_key, std::string feature_name,
-                       const std::string &path)
+                       const std::string &path, bool encode_storage = false)
         : meta_(meta), data_(data), stream_(stream), data_only_(data_only),
           transform_key_(transform_key), feature_name_(feature_name),
-          feature_name_hash_(BKDRHashWithEqualPostfix(feature_name)), path_(path) {}
+          feature_name_hash_(BKDRHashWithEqualPostfix(feature_name)), path_(path),
+          encode_storage_(encode_storage) {}
 
     bool DetectBinaryMode(MapFileHeader &header) {
         void *const ptr = static_cast<void *>(&header);
@@ -97,6 +99,14 @@ class ArrayHashMapReader {
             throw std::runtime_error(serr);
         }
         const uint64_t key = ParseKey(lineno, key_and_value.at(0));
+        if (encode_storage_) {
+            // ``data_`` stores slices in reduced precision, parse the line
+            // into a full precision slice first.
+            slice_.assign(meta_.GetSliceTotalBytes(), 0);
+            ParseValues(lineno, key_and_value.at(1), slice_.data());
+            meta_.EncodeSlice(slice_.data(), data_.get_or_init(key));
+            return;
+        }
         uint8_t *values = data_.get_or_init(key);
         ParseValues(lineno, key_and_value.at(1), values);
     }
@@ -268,6 +278,8 @@ class ArrayHashMapReader {
     std::string buffer_;
     std::string read_buffer_;
     bool eof_reached_ = false;
+    bool encode_storage_;
+    std::vector<uint8_t> slice_;
 };
 
 } // namespace metaspore
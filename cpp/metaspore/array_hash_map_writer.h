@@ -20,13 +20,15 @@
 #include <cstdio>
 #include <metaspore/sparse_tensor_meta.h>
 #include <metaspore/stack_trace_utils.h>
+#include <vector>
 
 namespace metaspore {
 
 class ArrayHashMapWriter {
   public:
-    ArrayHashMapWriter(SparseTensorMeta &meta, ArrayHashMap<uint64_t, uint8_t> &data)
-        : meta_(meta), data_(data) {}
+    ArrayHashMapWriter(SparseTensorMeta &meta, ArrayHashMap<uint64_t, uint8_t> &data,
+                       bool decode_storage = false)
+        : meta_(meta), data_(data), decode_storage_(decode_storage) {}
 
     template <typename Func> void Write(Func write) {
         const DataType type = meta_.GetDataType();
@@ -56,7 +58,14 @@ class ArrayHashMapWriter {
     static constexpr char line_terminator = '\n';
 
     template <typename Func, typename TValue> void WriteData(Func write) {
-        data_.each([this, write](uint64_t i, uint64_t key, const uint8_t *values, uint64_t count) {
+        // Slices stored in reduced precision are decoded one at a time.
+        std::vector<uint8_t> slice(decode_storage_ ? meta_.GetSliceTotalBytes() : 0);
+        data_.each([this, write, &slice](uint64_t i, uint64_t key, const uint8_t *values,
+                                         uint64_t count) {
+            if (decode_storage_) {
+                meta_.DecodeSlice(values, slice.data());
+                values = slice.data();
+            }
             std::string sout;
             char buffer[buffer_size];
             Append(sout, buffer, key);
@@ -100,6 +109,7 @@ class ArrayHashMapWriter {
 
     SparseTensorMeta &meta_;
     ArrayHashMap<uint64_t, uint8_t> &data_;
+    bool decode_storage_;
 };
 
 } // namespace metaspore
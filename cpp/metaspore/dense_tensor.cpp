@@ -45,9 +45,11 @@ void DenseTensor::Dispose(std::function<void()> cb) {
 }
 
 void DenseTensor::Push(SmartArray<uint8_t> in, std::function<void()> cb, bool is_value,
-                       bool is_state) {
+                       bool is_state, bool float16) {
     const size_t name_hash = GetMeta().GetNameHash();
-    const size_t item_size = DataTypeToSize(GetMeta().GetDataType());
+    // When ``float16`` is true, ``in`` holds float16 values which servers
+    // convert back to the data type of the tensor.
+    const size_t item_size = float16 ? sizeof(uint16_t) : DataTypeToSize(GetMeta().GetDataType());
     const size_t slice_items =
         SliceElements(is_state ? GetMeta().GetStateShape() : GetMeta().GetDataShape());
     const size_t slice_length = item_size * slice_items;
@@ -57,6 +59,7 @@ void DenseTensor::Push(SmartArray<uint8_t> in, std::function<void()> cb, bool is
         {"name", GetMeta().GetName()},
         {"is_value", is_value},
         {"is_state", is_state},
+        {"float16", float16},
     };
     std::string command = json.dump();
     std::vector<PSMessage> reqs;
@@ -71,7 +74,7 @@ void DenseTensor::Push(SmartArray<uint8_t> in, std::function<void()> cb, bool is
         begin *= slice_length;
         end *= slice_length;
         SmartArray<uint8_t> k_in = in.Slice(begin, end);
-        req->AddTypedSlice(k_in, GetMeta().GetDataType());
+        req->AddTypedSlice(k_in, float16 ? DataType::UInt16 : GetMeta().GetDataType());
         reqs.push_back(req);
     }
     agent_->SendAllRequests(
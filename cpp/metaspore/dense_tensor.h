@@ -36,7 +36,7 @@ class DenseTensor {
     void Init(std::function<void()> cb);
     void Dispose(std::function<void()> cb);
     void Push(SmartArray<uint8_t> in, std::function<void()> cb, bool is_value = false,
-              bool is_state = false);
+              bool is_state = false, bool float16 = false);
     void Pull(std::function<void(SmartArray<uint8_t> out)> cb, bool is_state = false);
     void PushMeta(const DenseTensorMeta &meta, std::function<void()> cb);
     void PullMeta(std::function<void(DenseTensorMeta meta)> cb);
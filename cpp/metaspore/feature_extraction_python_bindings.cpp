@@ -23,6 +23,7 @@
 #include <metaspore/pybind_utils.h>
 #include <metaspore/stack_trace_utils.h>
 #include <stdexcept>
+#include <tuple>
 
 namespace py = pybind11;
 
@@ -65,7 +66,14 @@ void DefineFeatureExtractionBindings(pybind11::module &m) {
                 throw std::runtime_error(serr);
             }
             auto unwrapped_batch = *result;
-            auto [indices, offsets] = extractor.extract(unwrapped_batch);
+            std::vector<uint64_t> indices;
+            std::vector<uint64_t> offsets;
+            {
+                // Extraction does not touch Python objects; release the GIL
+                // so that several extractors can run in parallel threads.
+                py::gil_scoped_release gil;
+                std::tie(indices, offsets) = extractor.extract(unwrapped_batch);
+            }
             py::array indices_arr = metaspore::to_numpy_array(std::move(indices));
             py::array offsets_arr = metaspore::to_numpy_array(std::move(offsets));
             return py::make_tuple(indices_arr, offsets_arr);
@@ -92,8 +100,13 @@ void DefineFeatureExtractionBindings(pybind11::module &m) {
 
     py::class_<metaspore::HashUniquifier>(m, "HashUniquifier")
         .def_static("uniquify", [](py::array_t<uint64_t> items) {
-            std::vector<uint64_t> entries =
-                HashUniquifier::Uniquify(items.mutable_data(), items.size());
+            uint64_t *data = items.mutable_data();
+            const size_t size = items.size();
+            std::vector<uint64_t> entries;
+            {
+                py::gil_scoped_release gil;
+                entries = HashUniquifier::Uniquify(data, size);
+            }
             return metaspore::to_numpy_array(std::move(entries));
         });
 }
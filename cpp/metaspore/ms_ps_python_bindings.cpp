@@ -21,6 +21,7 @@
 #include <metaspore/ps_agent.h>
 #include <metaspore/ps_runner.h>
 #include <metaspore/pybind_utils.h>
+#include <metaspore/sparse_updater_kernels.h>
 #include <metaspore/tensor_store_python_bindings.h>
 
 namespace py = pybind11;
@@ -243,6 +244,42 @@ PYBIND11_MODULE(_metaspore, m) {
         .def_static("update_buffer", &metaspore::ModelMetricBuffer::UpdateBuffer)
         .def_static("compute_auc", &metaspore::ModelMetricBuffer::ComputeAUC);
 
+    // The arrays are not converted, so that the kernels never update a temporary copy
+    // of the parameters and states.
+    py::class_<metaspore::SparseUpdaterKernels>(m, "SparseUpdaterKernels")
+        .def_static("update_sgd", &metaspore::SparseUpdaterKernels::UpdateSGD<float>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("indices").noconvert(), py::arg("learning_rate"))
+        .def_static("update_sgd", &metaspore::SparseUpdaterKernels::UpdateSGD<double>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("indices").noconvert(), py::arg("learning_rate"))
+        .def_static("update_adagrad", &metaspore::SparseUpdaterKernels::UpdateAdaGrad<float>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("state").noconvert(), py::arg("indices").noconvert(),
+                    py::arg("learning_rate"), py::arg("float_stable_eps"), py::arg("l2"))
+        .def_static("update_adagrad", &metaspore::SparseUpdaterKernels::UpdateAdaGrad<double>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("state").noconvert(), py::arg("indices").noconvert(),
+                    py::arg("learning_rate"), py::arg("float_stable_eps"), py::arg("l2"))
+        .def_static("update_adam", &metaspore::SparseUpdaterKernels::UpdateAdam<float>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("state").noconvert(), py::arg("indices").noconvert(),
+                    py::arg("learning_rate"), py::arg("beta1"), py::arg("beta2"),
+                    py::arg("epsilon"))
+        .def_static("update_adam", &metaspore::SparseUpdaterKernels::UpdateAdam<double>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("state").noconvert(), py::arg("indices").noconvert(),
+                    py::arg("learning_rate"), py::arg("beta1"), py::arg("beta2"),
+                    py::arg("epsilon"))
+        .def_static("update_ftrl", &metaspore::SparseUpdaterKernels::UpdateFTRL<float>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("state").noconvert(), py::arg("indices").noconvert(), py::arg("l1"),
+                    py::arg("l2"), py::arg("alpha"), py::arg("beta"))
+        .def_static("update_ftrl", &metaspore::SparseUpdaterKernels::UpdateFTRL<double>,
+                    py::arg("param").noconvert(), py::arg("grad").noconvert(),
+                    py::arg("state").noconvert(), py::arg("indices").noconvert(), py::arg("l1"),
+                    py::arg("l2"), py::arg("alpha"), py::arg("beta"));
+
     py::class_<metaspore::InputStream, std::shared_ptr<metaspore::InputStream>>(m, "InputStream")
         .def(py::init<const std::string>())
         .def("read", [](metaspore::InputStream &stream, size_t size) {
@@ -121,7 +121,8 @@ void PSDefaultAgent::HandleRequest(PSMessage req) {
         const std::string &name = json["name"].string_value();
         const bool is_value = json["is_value"].bool_value();
         const bool is_state = json["is_state"].bool_value();
-        store_->DensePush(name, req, is_value, is_state);
+        const bool float16 = json["float16"].bool_value();
+        store_->DensePush(name, req, is_value, is_state, float16);
         PSAgent::HandleRequest(req);
         break;
     }
@@ -166,7 +167,8 @@ void PSDefaultAgent::HandleRequest(PSMessage req) {
     case PSDefaultAgentCommand::SparsePush: {
         const std::string &name = json["name"].string_value();
         const bool is_value = json["is_value"].bool_value();
-        store_->SparsePush(name, req, is_value);
+        const bool float16 = json["float16"].bool_value();
+        store_->SparsePush(name, req, is_value, float16);
         PSAgent::HandleRequest(req);
         break;
     }
@@ -211,7 +213,11 @@ void PSDefaultAgent::HandleRequest(PSMessage req) {
     case PSDefaultAgentCommand::SparseLoad: {
         const std::string &name = json["name"].string_value();
         const std::string &dir_path = json["dir_path"].string_value();
-        store_->SparseLoad(name, dir_path);
+        std::vector<std::string> delta_dir_paths;
+        for (const json11::Json &item : json["delta_dir_paths"].array_items())
+            delta_dir_paths.push_back(item.string_value());
+        const bool track_changes = json["track_changes"].bool_value();
+        store_->SparseLoad(name, dir_path, delta_dir_paths, track_changes);
         PSAgent::HandleRequest(req);
         break;
     }
@@ -219,7 +225,9 @@ void PSDefaultAgent::HandleRequest(PSMessage req) {
         const std::string &name = json["name"].string_value();
         const std::string &dir_path = json["dir_path"].string_value();
         const bool text_mode = json["text_mode"].bool_value();
-        store_->SparseSave(name, dir_path, text_mode);
+        const bool delta = json["delta"].bool_value();
+        const bool track_changes = json["track_changes"].bool_value();
+        store_->SparseSave(name, dir_path, text_mode, delta, track_changes);
         PSAgent::HandleRequest(req);
         break;
     }
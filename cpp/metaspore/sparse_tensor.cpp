@@ -59,10 +59,15 @@ void SparseTensor::Clear(std::function<void()> cb) {
 }
 
 void SparseTensor::Push(SmartArray<uint8_t> keys, SmartArray<uint8_t> in, std::function<void()> cb,
-                        bool is_value) {
+                        bool is_value, bool float16) {
     const size_t index_count = keys.size() / sizeof(uint64_t);
     const uint64_t *const indices = reinterpret_cast<uint64_t *>(keys.data());
     const uint8_t *source = in.data();
+    // When ``float16`` is true, ``in`` holds float16 values which servers
+    // convert back to the data type of the tensor.
+    const size_t item_size = DataTypeToSize(GetMeta().GetDataType());
+    const size_t slice_length = float16 ? GetMeta().GetSliceDataLength() / item_size * 2
+                                        : GetMeta().GetSliceDataLength();
     const size_t num_parts = GetMeta().GetPartitionCount();
     std::vector<std::vector<uint64_t>> part_keys(num_parts);
     std::vector<std::vector<uint8_t>> part_data(num_parts);
@@ -70,13 +75,14 @@ void SparseTensor::Push(SmartArray<uint8_t> keys, SmartArray<uint8_t> in, std::f
         const uint64_t key = indices[i];
         const size_t part = key % num_parts;
         part_keys.at(part).push_back(key);
-        VectorAppend(part_data.at(part), source, GetMeta().GetSliceDataLength());
-        source += GetMeta().GetSliceDataLength();
+        VectorAppend(part_data.at(part), source, slice_length);
+        source += slice_length;
     }
     json11::Json json = json11::Json::object{
         {"command", "SparsePush"},
         {"name", GetMeta().GetName()},
         {"is_value", is_value},
+        {"float16", float16},
     };
     std::string command = json.dump();
     std::vector<PSMessage> reqs;
@@ -88,7 +94,7 @@ void SparseTensor::Push(SmartArray<uint8_t> keys, SmartArray<uint8_t> in, std::f
         auto k_keys = SmartArray<uint64_t>::Wrap(std::move(part_keys.at(k)));
         auto k_in = SmartArray<uint8_t>::Wrap(std::move(part_data.at(k)));
         req->AddTypedSlice(k_keys);
-        req->AddTypedSlice(k_in, GetMeta().GetDataType());
+        req->AddTypedSlice(k_in, float16 ? DataType::UInt16 : GetMeta().GetDataType());
         reqs.push_back(req);
     }
     agent_->SendAllRequests(
@@ -285,7 +291,8 @@ void SparseTensor::PullMeta(std::function<void(SparseTensorMeta meta)> cb) {
     });
 }
 
-void SparseTensor::Load(const std::string &dir_path, std::function<void()> cb, bool keep_meta) {
+void SparseTensor::Load(const std::string &dir_path, std::function<void()> cb, bool keep_meta,
+                        const std::vector<std::string> &delta_dir_paths, bool track_changes) {
     std::string meta_path = GetSparseMetaPath(dir_path);
     std::string str = StreamReadAll(meta_path);
     SparseTensorMeta meta = SparseTensorMeta::FromJsonString(str);
@@ -301,7 +308,22 @@ void SparseTensor::Load(const std::string &dir_path, std::function<void()> cb, b
         throw std::runtime_error(serr);
     }
     const int old_part_count = meta.GetPartitionCount();
-    auto load_data_and_state = [this, dir_path, cb, old_part_count] {
+    if (!delta_dir_paths.empty() && old_part_count != GetMeta().GetPartitionCount()) {
+        std::string serr;
+        serr.append("Can not replay the delta checkpoints of sparse tensor '");
+        serr.append(GetMeta().GetName());
+        serr.append("' saved with ");
+        serr.append(std::to_string(old_part_count));
+        serr.append(" partitions into ");
+        serr.append(std::to_string(GetMeta().GetPartitionCount()));
+        serr.append(" partitions; load the model with the original server count ");
+        serr.append("and save a full checkpoint first.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    auto load_data_and_state = [this, dir_path, cb, old_part_count, delta_dir_paths,
+                                track_changes] {
         if (GetMeta().GetPartitionCount() == old_part_count) {
             // To support sparse tensors repartition, ``if self.agent.rank == 0:`` is not checked in
             // Python code, and we must check this in C++ explicitly.
@@ -309,12 +331,15 @@ void SparseTensor::Load(const std::string &dir_path, std::function<void()> cb, b
                 cb();
                 return;
             }
-            // Letting worker #0 to send the request is enough.
+            // Letting worker #0 to send the request is enough. Servers replay
+            // the delta checkpoints of their own partitions in parallel.
             PSMessage req = std::make_shared<Message>();
             json11::Json json = json11::Json::object{
                 {"command", "SparseLoad"},
                 {"name", GetMeta().GetName()},
                 {"dir_path", dir_path},
+                {"delta_dir_paths", delta_dir_paths},
+                {"track_changes", track_changes},
             };
             req->GetMessageMeta().SetReceiver(ServerGroup);
             req->GetMessageMeta().SetBody(json.dump());
@@ -340,8 +365,9 @@ void SparseTensor::Load(const std::string &dir_path, std::function<void()> cb, b
     }
 }
 
-void SparseTensor::Save(const std::string &dir_path, std::function<void()> cb, bool text_mode) {
-    PullMeta([this, dir_path, cb, text_mode](SparseTensorMeta meta) {
+void SparseTensor::Save(const std::string &dir_path, std::function<void()> cb, bool text_mode,
+                        bool delta, bool track_changes) {
+    PullMeta([this, dir_path, cb, text_mode, delta, track_changes](SparseTensorMeta meta) {
         std::string meta_path = GetSparseMetaPath(dir_path);
         std::string str = meta.ToJsonString();
         EnsureLocalDirectory(dir_path);
@@ -352,6 +378,8 @@ void SparseTensor::Save(const std::string &dir_path, std::function<void()> cb, b
             {"name", GetMeta().GetName()},
             {"dir_path", dir_path},
             {"text_mode", text_mode},
+            {"delta", delta},
+            {"track_changes", track_changes},
         };
         req->GetMessageMeta().SetReceiver(ServerGroup);
         req->GetMessageMeta().SetBody(json.dump());
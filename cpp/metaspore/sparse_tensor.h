@@ -22,6 +22,7 @@
 #include <metaspore/ps_agent.h>
 #include <metaspore/smart_array.h>
 #include <metaspore/sparse_tensor_meta.h>
+#include <vector>
 
 namespace metaspore {
 
@@ -38,7 +39,7 @@ class SparseTensor {
     void Dispose(std::function<void()> cb);
     void Clear(std::function<void()> cb);
     void Push(SmartArray<uint8_t> keys, SmartArray<uint8_t> in, std::function<void()> cb,
-              bool is_value = false);
+              bool is_value = false, bool float16 = false);
     void Pull(SmartArray<uint8_t> keys, std::function<void(SmartArray<uint8_t> out)> cb,
               bool read_only = false, bool nan_fill = false);
     void PushPartition(ArrayHashMap<uint64_t, uint8_t> &data, std::function<void()> cb,
@@ -47,8 +48,10 @@ class SparseTensor {
                        bool data_only = false, int index = -1, int count = -1);
     void PushMeta(const SparseTensorMeta &meta, std::function<void()> cb);
     void PullMeta(std::function<void(SparseTensorMeta meta)> cb);
-    void Load(const std::string &dir_path, std::function<void()> cb, bool keep_meta = false);
-    void Save(const std::string &dir_path, std::function<void()> cb, bool text_mode = false);
+    void Load(const std::string &dir_path, std::function<void()> cb, bool keep_meta = false,
+              const std::vector<std::string> &delta_dir_paths = {}, bool track_changes = false);
+    void Save(const std::string &dir_path, std::function<void()> cb, bool text_mode = false,
+              bool delta = false, bool track_changes = false);
     void Export(const std::string &dir_path, std::function<void()> cb);
     void ImportFrom(const std::string &meta_file_path, std::function<void()> cb,
                     bool data_only = false, bool skip_existing = false, bool transform_key = false,
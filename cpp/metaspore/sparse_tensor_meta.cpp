@@ -14,12 +14,15 @@
 // limitations under the License.
 //
 
+#include <algorithm>
+#include <cmath>
 #include <metaspore/pybind_utils.h>
 #include <metaspore/sparse_tensor_meta.h>
 #include <metaspore/stack_trace_utils.h>
 #include <metaspore/tensor_utils.h>
 #include <spdlog/spdlog.h>
 #include <stdexcept>
+#include <string.h>
 
 namespace metaspore {
 
@@ -68,6 +71,160 @@ void SparseTensorMeta::ComputeSliceInfo() {
     const size_t age_mask = age_size - 1;
     slice_age_offset_ = (age_offset + age_mask) & ~age_mask;
     slice_total_bytes_ = slice_age_offset_ + age_size;
+    if (!HasReducedStorage()) {
+        slice_storage_data_length_ = slice_data_length_;
+        slice_storage_state_offset_ = slice_data_length_;
+        slice_storage_age_offset_ = slice_age_offset_;
+        slice_storage_total_bytes_ = slice_total_bytes_;
+        return;
+    }
+    if (storage_type_ != "float16" && storage_type_ != "bfloat16" && storage_type_ != "int8") {
+        std::string serr;
+        serr.append("Can not compute slice support info for sparse tensor '");
+        serr.append(GetName());
+        serr.append("', as the storage type '");
+        serr.append(storage_type_);
+        serr.append("' is invalid; only float16, bfloat16 and int8 are supported.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    if (data_type_ != DataType::Float32 && data_type_ != DataType::Float64) {
+        std::string serr;
+        serr.append("Can not compute slice support info for sparse tensor '");
+        serr.append(GetName());
+        serr.append("', as storage type '");
+        serr.append(storage_type_);
+        serr.append("' requires data type float32 or float64, but ");
+        serr.append(NullableDataTypeToString(data_type_));
+        serr.append(" found.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    const size_t elements = TotalElements(slice_data_shape_);
+    if (storage_type_ == "int8")
+        slice_storage_data_length_ = sizeof(float) + elements;
+    else
+        slice_storage_data_length_ = sizeof(uint16_t) * elements;
+    const size_t item_mask = item_size - 1;
+    slice_storage_state_offset_ = (slice_storage_data_length_ + item_mask) & ~item_mask;
+    const size_t storage_age_offset = slice_storage_state_offset_ + slice_state_length_;
+    slice_storage_age_offset_ = (storage_age_offset + age_mask) & ~age_mask;
+    slice_storage_total_bytes_ = slice_storage_age_offset_ + age_size;
+}
+
+namespace {
+
+inline uint16_t FloatToBFloat16(float value) {
+    uint32_t bits;
+    memcpy(&bits, &value, sizeof(bits));
+    if (std::isnan(value))
+        return static_cast<uint16_t>((bits >> 16) | 0x0040);
+    // Round to nearest even.
+    bits += 0x7FFF + ((bits >> 16) & 1);
+    return static_cast<uint16_t>(bits >> 16);
+}
+
+inline float BFloat16ToFloat(uint16_t value) {
+    const uint32_t bits = static_cast<uint32_t>(value) << 16;
+    float result;
+    memcpy(&result, &bits, sizeof(result));
+    return result;
+}
+
+template <typename T>
+void EncodeData(const std::string &storage_type, const T *data, size_t n, uint8_t *storage) {
+    if (storage_type == "float16") {
+        EncodeFloat16(reinterpret_cast<const uint8_t *>(data), n, DataTypeToCode<T>::value,
+                      reinterpret_cast<uint16_t *>(storage));
+    } else if (storage_type == "bfloat16") {
+        uint16_t *out = reinterpret_cast<uint16_t *>(storage);
+        for (size_t i = 0; i < n; i++)
+            out[i] = FloatToBFloat16(static_cast<float>(data[i]));
+    } else {
+        float max_abs = 0.0f;
+        for (size_t i = 0; i < n; i++)
+            max_abs = std::max(max_abs, std::abs(static_cast<float>(data[i])));
+        const float scale = max_abs / 127.0f;
+        const float inv_scale = scale > 0.0f ? 1.0f / scale : 0.0f;
+        memcpy(storage, &scale, sizeof(scale));
+        int8_t *out = reinterpret_cast<int8_t *>(storage + sizeof(scale));
+        for (size_t i = 0; i < n; i++) {
+            const long q = std::lrint(static_cast<float>(data[i]) * inv_scale);
+            out[i] = static_cast<int8_t>(std::clamp(q, -127L, 127L));
+        }
+    }
+}
+
+template <typename T>
+void DecodeData(const std::string &storage_type, const uint8_t *storage, size_t n, T *data) {
+    if (storage_type == "float16") {
+        DecodeFloat16(reinterpret_cast<const uint16_t *>(storage), n, DataTypeToCode<T>::value,
+                      reinterpret_cast<uint8_t *>(data));
+    } else if (storage_type == "bfloat16") {
+        const uint16_t *in = reinterpret_cast<const uint16_t *>(storage);
+        for (size_t i = 0; i < n; i++)
+            data[i] = static_cast<T>(BFloat16ToFloat(in[i]));
+    } else {
+        float scale;
+        memcpy(&scale, storage, sizeof(scale));
+        const int8_t *in = reinterpret_cast<const int8_t *>(storage + sizeof(scale));
+        for (size_t i = 0; i < n; i++)
+            data[i] = static_cast<T>(in[i] * scale);
+    }
+}
+
+} // namespace
+
+void SparseTensorMeta::EncodeSliceData(const uint8_t *data, uint8_t *storage) const {
+    if (!HasReducedStorage()) {
+        memcpy(storage, data, slice_data_length_);
+        return;
+    }
+    const size_t item_size = DataTypeToSize(data_type_);
+    const size_t n = slice_data_length_ / item_size;
+    if (data_type_ == DataType::Float32)
+        EncodeData(storage_type_, reinterpret_cast<const float *>(data), n, storage);
+    else
+        EncodeData(storage_type_, reinterpret_cast<const double *>(data), n, storage);
+}
+
+void SparseTensorMeta::DecodeSliceData(const uint8_t *storage, uint8_t *data) const {
+    if (!HasReducedStorage()) {
+        memcpy(data, storage, slice_data_length_);
+        return;
+    }
+    const size_t item_size = DataTypeToSize(data_type_);
+    const size_t n = slice_data_length_ / item_size;
+    if (data_type_ == DataType::Float32)
+        DecodeData(storage_type_, storage, n, reinterpret_cast<float *>(data));
+    else
+        DecodeData(storage_type_, storage, n, reinterpret_cast<double *>(data));
+}
+
+void SparseTensorMeta::EncodeSlice(const uint8_t *slice, uint8_t *storage) const {
+    if (!HasReducedStorage()) {
+        memcpy(storage, slice, slice_total_bytes_);
+        return;
+    }
+    memset(storage, 0, slice_storage_total_bytes_);
+    EncodeSliceData(slice, storage);
+    memcpy(storage + slice_storage_state_offset_, slice + slice_data_length_,
+           slice_state_length_);
+    memcpy(storage + slice_storage_age_offset_, slice + slice_age_offset_, sizeof(int));
+}
+
+void SparseTensorMeta::DecodeSlice(const uint8_t *storage, uint8_t *slice) const {
+    if (!HasReducedStorage()) {
+        memcpy(slice, storage, slice_total_bytes_);
+        return;
+    }
+    memset(slice, 0, slice_total_bytes_);
+    DecodeSliceData(storage, slice);
+    memcpy(slice + slice_data_length_, storage + slice_storage_state_offset_,
+           slice_state_length_);
+    memcpy(slice + slice_age_offset_, storage + slice_storage_age_offset_, sizeof(int));
 }
 
 void SparseTensorMeta::SetInitializerByData(std::string data) {
@@ -201,6 +358,7 @@ json11::Json SparseTensorMeta::to_json() const {
         {"initializer_data", GetInitializerAsData()},
         {"updater_data", GetUpdaterAsData()},
         {"partition_count", partition_count_},
+        {"storage_type", storage_type_},
     };
 }
 
@@ -230,6 +388,8 @@ SparseTensorMeta SparseTensorMeta::FromJson(json11::Json json) {
     meta.SetInitializerByData(json["initializer_data"].string_value());
     meta.SetUpdaterByData(json["updater_data"].string_value());
     meta.SetPartitionCount(json["partition_count"].int_value());
+    // Absent in metas saved before reduced precision storage was supported.
+    meta.SetStorageType(json["storage_type"].string_value());
     meta.ComputeSliceInfo();
     return meta;
 }
@@ -250,7 +410,8 @@ bool SparseTensorMeta::operator==(const SparseTensorMeta &rhs) const {
            slice_data_shape_ == rhs.slice_data_shape_ &&
            slice_state_shape_ == rhs.slice_state_shape_ &&
            GetInitializerAsData() == rhs.GetInitializerAsData() &&
-           GetUpdaterAsData() == rhs.GetUpdaterAsData() && partition_count_ == rhs.partition_count_;
+           GetUpdaterAsData() == rhs.GetUpdaterAsData() && partition_count_ == rhs.partition_count_ &&
+           storage_type_ == rhs.storage_type_;
 }
 
 } // namespace metaspore
@@ -58,6 +58,11 @@ class SparseTensorMeta {
     int GetPartitionCount() const { return partition_count_; }
     void SetPartitionCount(int value) { partition_count_ = value; }
 
+    // Reduced precision type the partitions store slice data in, one of "float16",
+    // "bfloat16" and "int8"; empty means to store slice data as ``data_type``.
+    const std::string &GetStorageType() const { return storage_type_; }
+    void SetStorageType(std::string value) { storage_type_ = std::move(value); }
+
     void CheckSparseTensorMeta(int index) const;
     void ComputeSliceInfo();
 
@@ -67,6 +72,21 @@ class SparseTensorMeta {
     size_t GetSliceTotalBytes() const { return slice_total_bytes_; }
     size_t GetSliceDataStateBytes() const { return GetSliceAgeOffset(); }
 
+    // Slices are always transferred, updated and checkpointed in the layout above,
+    // while partitions keep them in the storage layout below, which differs only
+    // when a reduced precision storage type is specified. In the storage layout,
+    // an int8 slice begins with a float scale followed by the quantized data.
+    bool HasReducedStorage() const { return !storage_type_.empty(); }
+    size_t GetSliceStorageDataLength() const { return slice_storage_data_length_; }
+    size_t GetSliceStorageStateOffset() const { return slice_storage_state_offset_; }
+    size_t GetSliceStorageAgeOffset() const { return slice_storage_age_offset_; }
+    size_t GetSliceStorageTotalBytes() const { return slice_storage_total_bytes_; }
+
+    void EncodeSliceData(const uint8_t *data, uint8_t *storage) const;
+    void DecodeSliceData(const uint8_t *storage, uint8_t *data) const;
+    void EncodeSlice(const uint8_t *slice, uint8_t *storage) const;
+    void DecodeSlice(const uint8_t *storage, uint8_t *slice) const;
+
     void SetInitializerByData(std::string data);
     void SetUpdaterByData(std::string data);
 
@@ -96,10 +116,15 @@ class SparseTensorMeta {
     std::any initializer_object_;
     std::any updater_object_;
     int partition_count_ = -1;
+    std::string storage_type_;
     size_t slice_data_length_ = size_t(-1);
     size_t slice_state_length_ = size_t(-1);
     size_t slice_age_offset_ = size_t(-1);
     size_t slice_total_bytes_ = size_t(-1);
+    size_t slice_storage_data_length_ = size_t(-1);
+    size_t slice_storage_state_offset_ = size_t(-1);
+    size_t slice_storage_age_offset_ = size_t(-1);
+    size_t slice_storage_total_bytes_ = size_t(-1);
 };
 
 } // namespace metaspore
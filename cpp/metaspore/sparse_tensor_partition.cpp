@@ -14,6 +14,7 @@
 // limitations under the License.
 //
 
+#include <algorithm>
 #include <math.h>
 #include <metaspore/array_hash_map_reader.h>
 #include <metaspore/array_hash_map_writer.h>
@@ -34,13 +35,137 @@ void SparseTensorPartition::AllocateHashMap() {
 }
 
 void SparseTensorPartition::Clear() {
-    const size_t slice_bytes = GetMeta().GetSliceTotalBytes();
+    if (track_changes_)
+        for (uint64_t key : data_)
+            RecordRemovedKey(key);
+    const size_t slice_bytes = GetMeta().GetSliceStorageTotalBytes();
     ArrayHashMap<uint64_t, uint8_t> map(slice_bytes);
     data_.swap(map);
 }
 
+void SparseTensorPartition::EncodeHashMap(ArrayHashMap<uint64_t, uint8_t> &map) {
+    // Replace the stored slices with the full precision slices in ``map``.
+    Clear();
+    data_.reserve(map.size());
+    map.each([this](uint64_t i, uint64_t key, const uint8_t *values, uint64_t count) {
+        GetMeta().EncodeSlice(values, data_.get_or_init(key));
+    });
+}
+
+template <typename Func>
+void SparseTensorPartition::SerializeDecoded(Func write, uint64_t value_count_per_key) {
+    // Write ``data_`` in the layout ``ArrayHashMap::serialize`` gives for the
+    // full precision map, with the keys and hash index of ``data_``. Slices
+    // are decoded block by block, so that the full precision partition is
+    // never materialized.
+    MapFileHeader header;
+    header.fill_basic_fields(false);
+    header.key_type = static_cast<uint64_t>(DataTypeToCode<uint64_t>::value);
+    header.value_type = static_cast<uint64_t>(DataTypeToCode<uint8_t>::value);
+    header.key_count = data_.get_key_count();
+    header.bucket_count = data_.get_bucket_count();
+    header.value_count = value_count_per_key * header.key_count;
+    header.value_count_per_key = value_count_per_key;
+    write(static_cast<const void *>(&header), sizeof(header));
+    write(static_cast<const void *>(data_.get_keys_array()), header.key_count * sizeof(uint64_t));
+    const bool data_only = value_count_per_key == GetMeta().GetSliceDataLength();
+    const size_t storage_bytes = GetMeta().GetSliceStorageTotalBytes();
+    const uint64_t block_count = std::max<uint64_t>(1, kConversionBlockBytes / value_count_per_key);
+    std::vector<uint8_t> block(value_count_per_key * block_count);
+    const uint8_t *const values = data_.get_values_array();
+    for (uint64_t begin = 0; begin < header.key_count; begin += block_count) {
+        const uint64_t count = std::min(block_count, header.key_count - begin);
+        for (uint64_t i = 0; i < count; i++) {
+            const uint8_t *const storage = values + storage_bytes * (begin + i);
+            uint8_t *const slice = block.data() + value_count_per_key * i;
+            if (data_only)
+                GetMeta().DecodeSliceData(storage, slice);
+            else
+                GetMeta().DecodeSlice(storage, slice);
+        }
+        write(static_cast<const void *>(block.data()), value_count_per_key * count);
+    }
+    write(static_cast<const void *>(data_.get_next_array()), header.key_count * sizeof(uint32_t));
+    write(static_cast<const void *>(data_.get_first_array()),
+          header.bucket_count * sizeof(uint32_t));
+}
+
+template <typename Func>
+void SparseTensorPartition::DeserializeEncoded(const std::string &path, Func read,
+                                               MapFileHeader &header) {
+    // Read full precision slices into ``data_`` block by block, encoding
+    // them as they are read.
+    std::string hint;
+    hint.append("Fail to deserialize ArrayHashMap from \"");
+    hint.append(path);
+    hint.append("\"; ");
+    header.validate(header.is_optimized_mode, hint);
+    const size_t slice_bytes = GetMeta().GetSliceTotalBytes();
+    const size_t value_size = DataTypeToSize(static_cast<DataType>(header.value_type));
+    if (header.is_optimized_mode || header.value_count_per_key * value_size != slice_bytes) {
+        // Not in the layout ``Save`` writes, go through a full precision map.
+        ArrayHashMap<uint64_t, uint8_t> map(slice_bytes);
+        map.deserialize_with_header(path, std::move(read), header);
+        EncodeHashMap(map);
+        return;
+    }
+    std::vector<uint64_t> keys(header.key_count);
+    read(static_cast<void *>(keys.data()), keys.size() * sizeof(uint64_t), hint, "keys array");
+    data_.clear();
+    data_.reserve(header.bucket_count);
+    const uint64_t block_count = std::max<uint64_t>(1, kConversionBlockBytes / slice_bytes);
+    std::vector<uint8_t> block(slice_bytes * block_count);
+    for (uint64_t begin = 0; begin < header.key_count; begin += block_count) {
+        const uint64_t count = std::min(block_count, header.key_count - begin);
+        read(static_cast<void *>(block.data()), slice_bytes * count, hint, "values array");
+        for (uint64_t i = 0; i < count; i++) {
+            const uint64_t key = keys[begin + i];
+            if (data_.contains(key))
+                spdlog::info("duplicate: {}", key);
+            else
+                GetMeta().EncodeSlice(block.data() + slice_bytes * i, data_.get_or_init(key));
+        }
+    }
+}
+
+void SparseTensorPartition::UpdateReducedStorage(SmartArray<uint8_t> keys,
+                                                 SmartArray<uint8_t> in) {
+    // Updaters are given the touched slices decoded into a full precision
+    // blob, so that they are computed in ``data_type`` as usual; the
+    // updated slices are encoded back afterwards.
+    const size_t index_count = keys.size() / sizeof(uint64_t);
+    const uint64_t *const indices = reinterpret_cast<uint64_t *>(keys.data());
+    const size_t slice_bytes = GetMeta().GetSliceTotalBytes();
+    const size_t storage_bytes = GetMeta().GetSliceStorageTotalBytes();
+    uint8_t *const storage_blob = const_cast<uint8_t *>(data_.get_values_array());
+    const uint64_t *const all_keys = data_.get_keys_array();
+    SmartArray<uint8_t> param(slice_bytes * index_count);
+    std::vector<uint64_t> local_indices(index_count);
+    std::vector<uint64_t> local_keys(index_count);
+    for (size_t i = 0; i < index_count; i++) {
+        const uint64_t index = indices[i];
+        GetMeta().DecodeSlice(storage_blob + storage_bytes * index, param.data() + slice_bytes * i);
+        local_indices[i] = i;
+        local_keys[i] = all_keys[index];
+    }
+    auto local_indices_arr = SmartArray<uint64_t>::Wrap(std::move(local_indices));
+    auto local_keys_arr = SmartArray<uint64_t>::Wrap(std::move(local_keys));
+    SparseUpdater updater = GetMeta().GetUpdater();
+    updater(GetMeta().GetName(), param, in, local_indices_arr.Cast<uint8_t>(),
+            local_keys_arr.Cast<uint8_t>(), GetMeta());
+    for (size_t i = 0; i < index_count; i++) {
+        uint8_t *const target = storage_blob + storage_bytes * indices[i];
+        GetMeta().EncodeSlice(param.data() + slice_bytes * i, target);
+        int &age = *reinterpret_cast<int *>(target + GetMeta().GetSliceStorageAgeOffset());
+        age = 0;
+    }
+}
+
 void SparseTensorPartition::HandlePush(SmartArray<uint8_t> keys, SmartArray<uint8_t> in,
                                        bool is_value) {
+    if (track_changes_)
+        RecordChangedKeys(reinterpret_cast<const uint64_t *>(keys.data()),
+                          keys.size() / sizeof(uint64_t));
     TransformIndices(keys, false, false);
     const size_t index_count = keys.size() / sizeof(uint64_t);
     const uint64_t *const indices = reinterpret_cast<uint64_t *>(keys.data());
@@ -52,12 +177,14 @@ void SparseTensorPartition::HandlePush(SmartArray<uint8_t> keys, SmartArray<uint
         const uint8_t *source = in.data();
         for (size_t i = 0; i < index_count; i++) {
             const uint64_t index = indices[i];
-            uint8_t *const target = target_blob + GetMeta().GetSliceTotalBytes() * index;
-            memcpy(target, source, GetMeta().GetSliceDataLength());
+            uint8_t *const target = target_blob + GetMeta().GetSliceStorageTotalBytes() * index;
+            GetMeta().EncodeSliceData(source, target);
             source += GetMeta().GetSliceDataLength();
-            int &age = *reinterpret_cast<int *>(target + GetMeta().GetSliceAgeOffset());
+            int &age = *reinterpret_cast<int *>(target + GetMeta().GetSliceStorageAgeOffset());
             age = 0;
         }
+    } else if (GetMeta().HasReducedStorage()) {
+        UpdateReducedStorage(keys, in);
     } else {
         uint8_t *const all_keys_data =
             reinterpret_cast<uint8_t *>(const_cast<uint64_t *>(data_.get_keys_array()));
@@ -85,13 +212,14 @@ SmartArray<uint8_t> SparseTensorPartition::HandlePull(SmartArray<uint8_t> keys,
     const uint8_t *const source_blob = data_.get_values_array();
     for (size_t i = 0; i < index_count; i++) {
         const uint64_t index = indices[i];
-        const uint8_t *const source = source_blob + GetMeta().GetSliceTotalBytes() * index;
+        const uint8_t *const source =
+            source_blob + GetMeta().GetSliceStorageTotalBytes() * index;
         if (index == kNotFoundIndex && nan_fill)
             FillNaN(target, GetMeta().GetSliceDataLength(), GetMeta().GetDataType());
         else if (index == kNotFoundIndex || index == kPaddingIndex)
             memset(target, 0, GetMeta().GetSliceDataLength());
         else
-            memcpy(target, source, GetMeta().GetSliceDataLength());
+            GetMeta().DecodeSliceData(source, target);
         target += GetMeta().GetSliceDataLength();
     }
     return std::move(out);
@@ -119,20 +247,33 @@ void SparseTensorPartition::TransformIndices(SmartArray<uint8_t> keys, bool pull
                 indices[i] = data_.find_or_init(indices[i]);
         }
         if (data_.size() != old_size) {
+            const size_t new_count = data_.size() - old_size;
+            if (track_changes_)
+                RecordChangedKeys(data_.get_keys_array() + old_size, new_count);
+            const size_t storage_bytes = GetMeta().GetSliceStorageTotalBytes();
             uint8_t *const values = const_cast<uint8_t *>(data_.get_values_array());
-            uint8_t *const blob_data = values + GetMeta().GetSliceTotalBytes() * old_size;
-            const size_t blob_size = GetMeta().GetSliceTotalBytes() * (data_.size() - old_size);
+            uint8_t *const blob_data = values + storage_bytes * old_size;
             SparseInitializer initializer = GetMeta().GetInitializer();
             if (!initializer)
-                memset(blob_data, 0, blob_size);
+                memset(blob_data, 0, storage_bytes * new_count);
             else {
                 uint8_t *const all_keys =
                     reinterpret_cast<uint8_t *>(const_cast<uint64_t *>(data_.get_keys_array()));
                 uint8_t *const blob_keys_data = all_keys + sizeof(uint64_t) * old_size;
-                const size_t blob_keys_size = sizeof(uint64_t) * (data_.size() - old_size);
-                auto blob = SmartArray<uint8_t>::Ref(blob_data, blob_size);
+                const size_t blob_keys_size = sizeof(uint64_t) * new_count;
                 auto blob_keys = SmartArray<uint8_t>::Ref(blob_keys_data, blob_keys_size);
-                initializer(GetMeta().GetName(), blob, blob_keys, GetMeta());
+                if (!GetMeta().HasReducedStorage()) {
+                    auto blob = SmartArray<uint8_t>::Ref(blob_data, storage_bytes * new_count);
+                    initializer(GetMeta().GetName(), blob, blob_keys, GetMeta());
+                } else {
+                    // Initialize in full precision, then encode the new slices.
+                    const size_t slice_bytes = GetMeta().GetSliceTotalBytes();
+                    SmartArray<uint8_t> blob(slice_bytes * new_count);
+                    initializer(GetMeta().GetName(), blob, blob_keys, GetMeta());
+                    for (size_t i = 0; i < new_count; i++)
+                        GetMeta().EncodeSlice(blob.data() + slice_bytes * i,
+                                              blob_data + storage_bytes * i);
+                }
             }
         }
     }
@@ -150,15 +291,19 @@ void SparseTensorPartition::HandlePushPartition(SmartArray<uint8_t> keys, SmartA
         bool is_new;
         uint8_t *target = data_.get_or_init(key, is_new);
         if (is_new || !skip_existing) {
-            memcpy(target, source, vec_length);
+            if (track_changes_)
+                RecordChangedKeys(&key, 1);
             if (data_only) {
+                GetMeta().EncodeSliceData(source, target);
                 // When only the data part of the embedding vector is imported,
                 // we set the rest of the embedding vector (state part and age)
                 // to zeros. We do this to make it consistent with the behavior
                 // of initializers.
-                memset(target + GetMeta().GetSliceDataLength(), 0,
-                       GetMeta().GetSliceTotalBytes() - GetMeta().GetSliceDataLength());
-            }
+                memset(target + GetMeta().GetSliceStorageDataLength(), 0,
+                       GetMeta().GetSliceStorageTotalBytes() -
+                           GetMeta().GetSliceStorageDataLength());
+            } else
+                GetMeta().EncodeSlice(source, target);
         }
         source += vec_length;
     }
@@ -180,8 +325,14 @@ SmartArray<uint8_t> SparseTensorPartition::HandlePullPartition(bool data_only, i
         const uint64_t key = indices[i];
         if (key % count == index) {
             indices.push_back(key);
-            const uint8_t *const source = values_array + GetMeta().GetSliceTotalBytes() * i;
-            VectorAppend(values, source, vec_length);
+            const uint8_t *const source =
+                values_array + GetMeta().GetSliceStorageTotalBytes() * i;
+            const size_t offset = values.size();
+            values.resize(offset + vec_length);
+            if (data_only)
+                GetMeta().DecodeSliceData(source, values.data() + offset);
+            else
+                GetMeta().DecodeSlice(source, values.data() + offset);
         }
     }
     auto indices_out = SmartArray<uint64_t>::Wrap(std::move(indices));
@@ -207,8 +358,8 @@ void SparseTensorPartition::HandlePushMeta(const SparseTensorMeta &meta) {
 
 const SparseTensorMeta &SparseTensorPartition::HandlePullMeta() { return meta_; }
 
-void SparseTensorPartition::Load(const std::string &dir_path) {
-    std::string path = GetSparsePath(dir_path);
+void SparseTensorPartition::ReadHashMap(const std::string &path,
+                                        ArrayHashMap<uint64_t, uint8_t> &map) {
     auto stream = Stream::Create(path.c_str(), "r", true);
     if (!stream) {
         std::string serr;
@@ -224,40 +375,44 @@ void SparseTensorPartition::Load(const std::string &dir_path) {
         throw std::runtime_error(serr);
     }
     std::unique_ptr<Stream> stream_guard(stream);
-    ArrayHashMapReader reader(GetMeta(), data_, stream, false, false, "", path);
+    // Checkpoints are always in the full precision layout, so slices read
+    // into ``data_`` stored in reduced precision are encoded on the fly.
+    const bool encode = &map == &data_ && GetMeta().HasReducedStorage();
+    ArrayHashMapReader reader(GetMeta(), map, stream, false, false, "", path, encode);
     MapFileHeader header;
     if (reader.DetectBinaryMode(header)) {
         uint64_t offset = sizeof(header);
-        data_.deserialize_with_header(
-            path,
-            [stream, &offset](void *ptr, size_t size, const std::string &hint,
-                              const std::string &what) {
-                const size_t nread = stream->Read(ptr, size);
-                if (nread != size) {
-                    std::string serr;
-                    serr.append(hint);
-                    serr.append("incomplete ");
-                    serr.append(what);
-                    serr.append(", ");
-                    serr.append(std::to_string(size));
-                    serr.append(" bytes expected, but only ");
-                    serr.append(std::to_string(nread));
-                    serr.append(" are read successfully. offset = ");
-                    serr.append(std::to_string(offset));
-                    serr.append("\n\n");
-                    serr.append(GetStackTrace());
-                    spdlog::error(serr);
-                    throw std::runtime_error(serr);
-                }
-            },
-            header);
+        auto read = [stream, &offset](void *ptr, size_t size, const std::string &hint,
+                                      const std::string &what) {
+            const size_t nread = stream->Read(ptr, size);
+            if (nread != size) {
+                std::string serr;
+                serr.append(hint);
+                serr.append("incomplete ");
+                serr.append(what);
+                serr.append(", ");
+                serr.append(std::to_string(size));
+                serr.append(" bytes expected, but only ");
+                serr.append(std::to_string(nread));
+                serr.append(" are read successfully. offset = ");
+                serr.append(std::to_string(offset));
+                serr.append("\n\n");
+                serr.append(GetStackTrace());
+                spdlog::error(serr);
+                throw std::runtime_error(serr);
+            }
+        };
+        if (encode)
+            DeserializeEncoded(path, read, header);
+        else
+            map.deserialize_with_header(path, read, header);
     } else {
         reader.Read();
     }
 }
 
-void SparseTensorPartition::Save(const std::string &dir_path, bool text_mode) {
-    std::string path = GetSparsePath(dir_path);
+void SparseTensorPartition::WriteHashMap(const std::string &path,
+                                         ArrayHashMap<uint64_t, uint8_t> &map, bool text_mode) {
     auto stream = Stream::Create(path.c_str(), "w", true);
     if (!stream) {
         std::string serr;
@@ -273,33 +428,168 @@ void SparseTensorPartition::Save(const std::string &dir_path, bool text_mode) {
         throw std::runtime_error(serr);
     }
     std::unique_ptr<Stream> stream_guard(stream);
+    // Slices of ``data_`` stored in reduced precision are decoded on the fly,
+    // so that checkpoints are always in the full precision layout.
+    const bool decode = &map == &data_ && GetMeta().HasReducedStorage();
     if (text_mode) {
-        ArrayHashMapWriter writer(GetMeta(), data_);
+        ArrayHashMapWriter writer(GetMeta(), map, decode);
         writer.Write([stream](const char *ptr, size_t size) { stream->Write(ptr, size); });
     } else {
         const size_t slice_bytes = GetMeta().GetSliceTotalBytes();
-        data_.serialize(
-            path,
-            [stream](const void *ptr, size_t size) {
-                // ArrayHashMap can be huge (several gigabytes), writing directly
-                // may cause the executor memory to increase substantially, so we
-                // write the data block by block. A better solution would be refining
-                // the implementation of WriteBuffer::Write.
-                const size_t MaxBlockSize = 5 * 1024 * 1024;
-                const char *buffer = static_cast<const char *>(ptr);
-                while (size > 0) {
-                    size_t n = MaxBlockSize;
-                    if (n > size)
-                        n = size;
-                    stream->Write(buffer, n);
-                    buffer += n;
-                    size -= n;
-                }
-            },
-            slice_bytes);
+        auto write = [stream](const void *ptr, size_t size) {
+            // ArrayHashMap can be huge (several gigabytes), writing directly
+            // may cause the executor memory to increase substantially, so we
+            // write the data block by block. A better solution would be refining
+            // the implementation of WriteBuffer::Write.
+            const size_t MaxBlockSize = 5 * 1024 * 1024;
+            const char *buffer = static_cast<const char *>(ptr);
+            while (size > 0) {
+                size_t n = MaxBlockSize;
+                if (n > size)
+                    n = size;
+                stream->Write(buffer, n);
+                buffer += n;
+                size -= n;
+            }
+        };
+        if (decode)
+            SerializeDecoded(write, slice_bytes);
+        else
+            map.serialize(path, write, slice_bytes);
     }
 }
 
+void SparseTensorPartition::Load(const std::string &dir_path,
+                                 const std::vector<std::string> &delta_dir_paths,
+                                 bool track_changes) {
+    std::string path = GetSparsePath(dir_path);
+    ReadHashMap(path, data_);
+    for (const std::string &delta_dir_path : delta_dir_paths)
+        LoadDelta(delta_dir_path);
+    ResetChanges(track_changes);
+}
+
+void SparseTensorPartition::LoadDelta(const std::string &dir_path) {
+    std::string path = GetSparseRemovedPath(dir_path);
+    auto stream = Stream::Create(path.c_str(), "r", true);
+    if (!stream) {
+        std::string serr;
+        serr.append("Fail to load removed keys of partition ");
+        serr.append(std::to_string(GetPartitionIndex()));
+        serr.append(" of sparse tensor '");
+        serr.append(GetMeta().GetName());
+        serr.append("' from '");
+        serr.append(path);
+        serr.append("'.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    std::unique_ptr<Stream> stream_guard(stream);
+    uint64_t header[2];
+    std::vector<uint64_t> removed_keys;
+    bool complete = stream->Read(header, sizeof(header)) == sizeof(header);
+    if (complete) {
+        removed_keys.resize(header[1]);
+        const size_t size = sizeof(uint64_t) * removed_keys.size();
+        complete = size == 0 || stream->Read(removed_keys.data(), size) == size;
+    }
+    if (!complete) {
+        std::string serr;
+        serr.append("Incomplete removed keys of partition ");
+        serr.append(std::to_string(GetPartitionIndex()));
+        serr.append(" of sparse tensor '");
+        serr.append(GetMeta().GetName());
+        serr.append("' in '");
+        serr.append(path);
+        serr.append("'.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    // Replay the delta: advance the ages as ``PruneOld`` did, drop the
+    // removed keys and overwrite the changed slices, which carry their
+    // own ages.
+    const int prune_old_count = static_cast<int>(header[0]);
+    if (prune_old_count > 0)
+        data_.each([prune_old_count, this](uint64_t i, uint64_t key, const uint8_t *values,
+                                           uint64_t count) {
+            uint8_t *const ptr = const_cast<uint8_t *>(values);
+            int &age = *reinterpret_cast<int *>(ptr + GetMeta().GetSliceStorageAgeOffset());
+            age += prune_old_count;
+        });
+    if (!removed_keys.empty()) {
+        std::unordered_set<uint64_t> removed(removed_keys.begin(), removed_keys.end());
+        data_.prune([&removed](uint64_t i, int64_t key, const uint8_t *values,
+                               uint64_t value_count) { return removed.count(key) > 0; });
+    }
+    ArrayHashMap<uint64_t, uint8_t> delta(GetMeta().GetSliceTotalBytes());
+    ReadHashMap(GetSparseDeltaPath(dir_path), delta);
+    data_.reserve(data_.size() + delta.size());
+    delta.each([this](uint64_t i, uint64_t key, const uint8_t *values, uint64_t count) {
+        GetMeta().EncodeSlice(values, data_.get_or_init(key));
+    });
+}
+
+void SparseTensorPartition::Save(const std::string &dir_path, bool text_mode, bool delta,
+                                 bool track_changes) {
+    if (delta) {
+        SaveDelta(dir_path);
+        return;
+    }
+    std::string path = GetSparsePath(dir_path);
+    WriteHashMap(path, data_, text_mode);
+    ResetChanges(track_changes);
+}
+
+void SparseTensorPartition::SaveDelta(const std::string &dir_path) {
+    if (!track_changes_) {
+        std::string serr;
+        serr.append("Changes of partition ");
+        serr.append(std::to_string(GetPartitionIndex()));
+        serr.append(" of sparse tensor '");
+        serr.append(GetMeta().GetName());
+        serr.append("' are not tracked; a full checkpoint must be saved or loaded ");
+        serr.append("with change tracking before saving deltas.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    // Deltas are in the full precision layout and binary mode, as checkpoints.
+    ArrayHashMap<uint64_t, uint8_t> delta(GetMeta().GetSliceTotalBytes());
+    delta.reserve(changed_keys_.size());
+    const size_t storage_bytes = GetMeta().GetSliceStorageTotalBytes();
+    const uint8_t *const values = data_.get_values_array();
+    for (uint64_t key : changed_keys_) {
+        const int64_t index = data_.find(key);
+        if (index >= 0)
+            GetMeta().DecodeSlice(values + storage_bytes * index, delta.get_or_init(key));
+    }
+    WriteHashMap(GetSparseDeltaPath(dir_path), delta, false);
+    std::string path = GetSparseRemovedPath(dir_path);
+    auto stream = Stream::Create(path.c_str(), "w", true);
+    if (!stream) {
+        std::string serr;
+        serr.append("Fail to save removed keys of partition ");
+        serr.append(std::to_string(GetPartitionIndex()));
+        serr.append(" of sparse tensor '");
+        serr.append(GetMeta().GetName());
+        serr.append("' to '");
+        serr.append(path);
+        serr.append("'.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    std::unique_ptr<Stream> stream_guard(stream);
+    std::vector<uint64_t> removed_keys(removed_keys_.begin(), removed_keys_.end());
+    const uint64_t header[2] = {prune_old_count_, removed_keys.size()};
+    stream->Write(header, sizeof(header));
+    if (!removed_keys.empty())
+        stream->Write(removed_keys.data(), sizeof(uint64_t) * removed_keys.size());
+    ResetChanges(true);
+}
+
 void SparseTensorPartition::Export(const std::string &dir_path) {
     std::string path = GetSparseExportPath(dir_path);
     auto stream = Stream::Create(path.c_str(), "w", true);
@@ -318,19 +608,30 @@ void SparseTensorPartition::Export(const std::string &dir_path) {
     }
     std::unique_ptr<Stream> stream_guard(stream);
     const size_t data_length = GetMeta().GetSliceDataLength();
-    data_.serialize(
-        path, [stream](const void *ptr, size_t size) { stream->Write(ptr, size); }, data_length);
+    auto write = [stream](const void *ptr, size_t size) { stream->Write(ptr, size); };
+    if (GetMeta().HasReducedStorage())
+        SerializeDecoded(write, data_length);
+    else
+        data_.serialize(path, write, data_length);
 }
 
 template <typename T> void SparseTensorPartition::DoPruneSmall(double epsilon) {
     // Only the data part is considered.
     const size_t m = GetMeta().GetSliceDataLength() / sizeof(T);
+    std::vector<T> buffer(GetMeta().HasReducedStorage() ? m : 0);
     data_.prune(
-        [epsilon, m, this](uint64_t i, int64_t key, const uint8_t *values, uint64_t value_count) {
-            const T *const param = reinterpret_cast<const T *>(values);
+        [epsilon, m, &buffer, this](uint64_t i, int64_t key, const uint8_t *values,
+                                    uint64_t value_count) {
+            const T *param = reinterpret_cast<const T *>(values);
+            if (GetMeta().HasReducedStorage()) {
+                GetMeta().DecodeSliceData(values, reinterpret_cast<uint8_t *>(buffer.data()));
+                param = buffer.data();
+            }
             for (uint64_t k = 0; k < m; k++)
                 if (fabs(param[k]) > epsilon)
                     return false;
+            if (track_changes_)
+                RecordRemovedKey(key);
             return true;
         });
 }
@@ -357,15 +658,42 @@ void SparseTensorPartition::PruneSmall(double epsilon) {
 }
 
 void SparseTensorPartition::PruneOld(int max_age) {
+    // Delta checkpoints record the number of calls, so that the ages of
+    // the keys not in the deltas are advanced when they are replayed.
+    if (track_changes_)
+        prune_old_count_++;
     data_.prune(
         [max_age, this](uint64_t i, int64_t key, const uint8_t *values, uint64_t value_count) {
             uint8_t *const ptr = const_cast<uint8_t *>(values);
-            int &age = *reinterpret_cast<int *>(ptr + GetMeta().GetSliceAgeOffset());
+            int &age = *reinterpret_cast<int *>(ptr + GetMeta().GetSliceStorageAgeOffset());
             ++age;
-            return age > max_age;
+            if (age <= max_age)
+                return false;
+            if (track_changes_)
+                RecordRemovedKey(key);
+            return true;
         });
 }
 
+void SparseTensorPartition::RecordChangedKeys(const uint64_t *keys, size_t count) {
+    for (size_t i = 0; i < count; i++) {
+        changed_keys_.insert(keys[i]);
+        removed_keys_.erase(keys[i]);
+    }
+}
+
+void SparseTensorPartition::RecordRemovedKey(uint64_t key) {
+    changed_keys_.erase(key);
+    removed_keys_.insert(key);
+}
+
+void SparseTensorPartition::ResetChanges(bool track_changes) {
+    track_changes_ = track_changes;
+    prune_old_count_ = 0;
+    std::unordered_set<uint64_t>().swap(changed_keys_);
+    std::unordered_set<uint64_t>().swap(removed_keys_);
+}
+
 std::string SparseTensorPartition::GetSparsePath(const std::string &dir_path) const {
     std::string file_name =
         fmt::format("{}__sparse_{}.dat", GetMeta().GetName(), GetPartitionIndex());
@@ -373,6 +701,20 @@ std::string SparseTensorPartition::GetSparsePath(const std::string &dir_path) co
     return file_path;
 }
 
+std::string SparseTensorPartition::GetSparseDeltaPath(const std::string &dir_path) const {
+    std::string file_name =
+        fmt::format("{}__sparse_delta_{}.dat", GetMeta().GetName(), GetPartitionIndex());
+    std::string file_path = JoinPath(dir_path, file_name);
+    return file_path;
+}
+
+std::string SparseTensorPartition::GetSparseRemovedPath(const std::string &dir_path) const {
+    std::string file_name =
+        fmt::format("{}__sparse_removed_{}.dat", GetMeta().GetName(), GetPartitionIndex());
+    std::string file_path = JoinPath(dir_path, file_name);
+    return file_path;
+}
+
 std::string SparseTensorPartition::GetSparseExportPath(const std::string &dir_path) const {
     std::string file_name =
         fmt::format("part_{}_{}.dat", GetMeta().GetPartitionCount(), GetPartitionIndex());
@@ -18,6 +18,8 @@
 
 #include <common/hashmap/array_hash_map.h>
 #include <metaspore/sparse_tensor_meta.h>
+#include <unordered_set>
+#include <vector>
 
 namespace metaspore {
 
@@ -42,8 +44,9 @@ class SparseTensorPartition {
                                             SmartArray<uint8_t> &keys);
     void HandlePushMeta(const SparseTensorMeta &meta);
     const SparseTensorMeta &HandlePullMeta();
-    void Load(const std::string &dir_path);
-    void Save(const std::string &dir_path, bool text_mode);
+    void Load(const std::string &dir_path, const std::vector<std::string> &delta_dir_paths,
+              bool track_changes);
+    void Save(const std::string &dir_path, bool text_mode, bool delta, bool track_changes);
     void Export(const std::string &dir_path);
     void PruneSmall(double epsilon);
     void PruneOld(int max_age);
@@ -52,15 +55,39 @@ class SparseTensorPartition {
     template <typename T> void DoPruneSmall(double epsilon);
 
     void TransformIndices(SmartArray<uint8_t> keys, bool pull, bool read_only);
+    void UpdateReducedStorage(SmartArray<uint8_t> keys, SmartArray<uint8_t> in);
+    void EncodeHashMap(ArrayHashMap<uint64_t, uint8_t> &map);
+    template <typename Func> void SerializeDecoded(Func write, uint64_t value_count_per_key);
+    template <typename Func>
+    void DeserializeEncoded(const std::string &path, Func read, MapFileHeader &header);
+    void ReadHashMap(const std::string &path, ArrayHashMap<uint64_t, uint8_t> &map);
+    void WriteHashMap(const std::string &path, ArrayHashMap<uint64_t, uint8_t> &map,
+                      bool text_mode);
+    void LoadDelta(const std::string &dir_path);
+    void SaveDelta(const std::string &dir_path);
+    void RecordChangedKeys(const uint64_t *keys, size_t count);
+    void RecordRemovedKey(uint64_t key);
+    void ResetChanges(bool track_changes);
     std::string GetSparsePath(const std::string &dir_path) const;
+    std::string GetSparseDeltaPath(const std::string &dir_path) const;
+    std::string GetSparseRemovedPath(const std::string &dir_path) const;
     std::string GetSparseExportPath(const std::string &dir_path) const;
 
     static constexpr uint64_t kPaddingKey = 0;
     static constexpr uint64_t kPaddingIndex = uint64_t(-2);
     static constexpr uint64_t kNotFoundIndex = uint64_t(-1);
+    // Slices converted between the stored and the full precision layouts
+    // at a time when saving, loading or exporting reduced storage.
+    static constexpr uint64_t kConversionBlockBytes = 4 * 1024 * 1024;
     SparseTensorMeta meta_;
     int partition_index_ = -1;
     ArrayHashMap<uint64_t, uint8_t> data_;
+    // Keys changed and removed since the last checkpoint, recorded only
+    // when delta checkpoints are enabled.
+    bool track_changes_ = false;
+    uint64_t prune_old_count_ = 0;
+    std::unordered_set<uint64_t> changed_keys_;
+    std::unordered_set<uint64_t> removed_keys_;
 };
 
 } // namespace metaspore
@@ -0,0 +1,229 @@
+//
+// Copyright 2022 DMetaSoul
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+//
+
+#include <algorithm>
+#include <cmath>
+#include <metaspore/sparse_updater_kernels.h>
+#include <metaspore/stack_trace_utils.h>
+#include <spdlog/spdlog.h>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <vector>
+
+namespace metaspore {
+
+namespace {
+
+// Rows handled by one thread at least, below which spawning threads costs
+// more than it saves.
+constexpr size_t MinRowsPerThread = 4096;
+constexpr size_t MaxThreadCount = 8;
+
+struct RowView {
+    uint8_t *data;
+    size_t row_stride;
+    size_t cols;
+};
+
+template <typename T>
+RowView GetRowView(pybind11::array_t<T> &arr, const char *name, size_t rows) {
+    if (arr.ndim() != 2) {
+        std::string serr;
+        serr.append(name);
+        serr.append(" must be 2-D array; got ");
+        serr.append(std::to_string(arr.ndim()));
+        serr.append("-D array.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    if (arr.strides(1) != static_cast<pybind11::ssize_t>(sizeof(T))) {
+        std::string serr;
+        serr.append("columns of ");
+        serr.append(name);
+        serr.append(" must be contiguous.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    if (static_cast<size_t>(arr.shape(0)) < rows) {
+        std::string serr;
+        serr.append(name);
+        serr.append(" has too few rows; expect at least ");
+        serr.append(std::to_string(rows));
+        serr.append(", found ");
+        serr.append(std::to_string(arr.shape(0)));
+        serr.append(".\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    RowView view;
+    view.data = reinterpret_cast<uint8_t *>(arr.mutable_data());
+    view.row_stride = static_cast<size_t>(arr.strides(0));
+    view.cols = static_cast<size_t>(arr.shape(1));
+    return view;
+}
+
+template <typename T> T *GetRow(const RowView &view, uint64_t row) {
+    return reinterpret_cast<T *>(view.data + view.row_stride * row);
+}
+
+template <typename Func> void ParallelForRows(size_t count, Func func) {
+    const size_t hardware = std::max<size_t>(1, std::thread::hardware_concurrency());
+    const size_t thread_count =
+        std::min({hardware, MaxThreadCount, std::max<size_t>(1, count / MinRowsPerThread)});
+    if (thread_count <= 1) {
+        func(0, count);
+        return;
+    }
+    std::vector<std::thread> threads;
+    threads.reserve(thread_count - 1);
+    const size_t chunk = (count + thread_count - 1) / thread_count;
+    for (size_t t = 1; t < thread_count; t++) {
+        const size_t begin = std::min(count, chunk * t);
+        const size_t end = std::min(count, begin + chunk);
+        threads.emplace_back(func, begin, end);
+    }
+    func(0, std::min(count, chunk));
+    for (std::thread &thread : threads)
+        thread.join();
+}
+
+// Apply ``update(param_row, grad_row, state_row, cols)`` to each indexed row.
+template <typename T, typename Update>
+void UpdateRows(pybind11::array_t<T> &param, pybind11::array_t<T> &grad,
+                pybind11::array_t<T> *state, pybind11::array_t<uint64_t> &indices,
+                size_t states_per_param, Update update) {
+    const size_t count = static_cast<size_t>(indices.size());
+    if (count == 0)
+        return;
+    const uint64_t *const index_data = indices.data();
+    uint64_t max_index = 0;
+    for (size_t i = 0; i < count; i++)
+        max_index = std::max(max_index, index_data[i]);
+    const RowView param_view = GetRowView(param, "param", max_index + 1);
+    const RowView grad_view = GetRowView(grad, "grad", count);
+    RowView state_view{};
+    if (state)
+        state_view = GetRowView(*state, "state", max_index + 1);
+    const size_t cols = param_view.cols;
+    if (grad_view.cols != cols || (state && state_view.cols != cols * states_per_param)) {
+        std::string serr;
+        serr.append("param, grad and state of the sparse updater have mismatched columns.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+    pybind11::gil_scoped_release gil;
+    ParallelForRows(count, [&](size_t begin, size_t end) {
+        for (size_t i = begin; i < end; i++) {
+            const uint64_t index = index_data[i];
+            T *const p = GetRow<T>(param_view, index);
+            const T *const g = GetRow<T>(grad_view, i);
+            T *const s = state ? GetRow<T>(state_view, index) : nullptr;
+            update(p, g, s, cols);
+        }
+    });
+}
+
+} // namespace
+
+template <typename T>
+void SparseUpdaterKernels::UpdateSGD(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                                     pybind11::array_t<uint64_t> indices, T learning_rate) {
+    UpdateRows<T>(param, grad, nullptr, indices, 0,
+                  [=](T *p, const T *g, T *, size_t cols) {
+                      for (size_t j = 0; j < cols; j++)
+                          p[j] -= learning_rate * g[j];
+                  });
+}
+
+template <typename T>
+void SparseUpdaterKernels::UpdateAdaGrad(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                                         pybind11::array_t<T> state,
+                                         pybind11::array_t<uint64_t> indices, T learning_rate,
+                                         T float_stable_eps, T l2) {
+    UpdateRows<T>(param, grad, &state, indices, 1, [=](T *p, const T *g, T *s, size_t cols) {
+        T *const square_sum = s;
+        for (size_t j = 0; j < cols; j++) {
+            const T grad_tmp = g[j] + l2 * p[j];
+            square_sum[j] += grad_tmp * grad_tmp;
+            p[j] -= learning_rate * grad_tmp / std::sqrt(square_sum[j] + float_stable_eps);
+        }
+    });
+}
+
+template <typename T>
+void SparseUpdaterKernels::UpdateAdam(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                                      pybind11::array_t<T> state,
+                                      pybind11::array_t<uint64_t> indices, T learning_rate,
+                                      T beta1, T beta2, T epsilon) {
+    UpdateRows<T>(param, grad, &state, indices, 2, [=](T *p, const T *g, T *s, size_t cols) {
+        T *const m = s;
+        T *const v = s + cols;
+        for (size_t j = 0; j < cols; j++) {
+            m[j] = beta1 * m[j] + (1 - beta1) * g[j];
+            v[j] = beta2 * v[j] + (1 - beta2) * g[j] * g[j];
+            p[j] -= learning_rate * m[j] / (std::sqrt(v[j]) + epsilon);
+        }
+    });
+}
+
+template <typename T>
+void SparseUpdaterKernels::UpdateFTRL(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                                      pybind11::array_t<T> state,
+                                      pybind11::array_t<uint64_t> indices, T l1, T l2, T alpha,
+                                      T beta) {
+    UpdateRows<T>(param, grad, &state, indices, 2, [=](T *p, const T *g, T *s, size_t cols) {
+        T *const n = s;
+        T *const z = s + cols;
+        for (size_t j = 0; j < cols; j++) {
+            const T grad_square = g[j] * g[j];
+            const T sigma = (std::sqrt(n[j] + grad_square) - std::sqrt(n[j])) / alpha;
+            z[j] += g[j] - sigma * p[j];
+            n[j] += grad_square;
+            if (std::abs(z[j]) <= l1)
+                p[j] = 0;
+            else {
+                const T sign = z[j] > 0 ? T(1) : T(-1);
+                p[j] = -(z[j] - sign * l1) / ((beta + std::sqrt(n[j])) / alpha + l2);
+            }
+        }
+    });
+}
+
+#undef MS_SPARSE_UPDATER_KERNELS_INSTANTIATE
+#define MS_SPARSE_UPDATER_KERNELS_INSTANTIATE(T)                                                   \
+    template void SparseUpdaterKernels::UpdateSGD<T>(                                              \
+        pybind11::array_t<T>, pybind11::array_t<T>, pybind11::array_t<uint64_t>, T);              \
+    template void SparseUpdaterKernels::UpdateAdaGrad<T>(                                          \
+        pybind11::array_t<T>, pybind11::array_t<T>, pybind11::array_t<T>,                         \
+        pybind11::array_t<uint64_t>, T, T, T);                                                     \
+    template void SparseUpdaterKernels::UpdateAdam<T>(                                             \
+        pybind11::array_t<T>, pybind11::array_t<T>, pybind11::array_t<T>,                         \
+        pybind11::array_t<uint64_t>, T, T, T, T);                                                  \
+    template void SparseUpdaterKernels::UpdateFTRL<T>(                                             \
+        pybind11::array_t<T>, pybind11::array_t<T>, pybind11::array_t<T>,                         \
+        pybind11::array_t<uint64_t>, T, T, T, T); /**/
+
+MS_SPARSE_UPDATER_KERNELS_INSTANTIATE(float)
+MS_SPARSE_UPDATER_KERNELS_INSTANTIATE(double)
+
+#undef MS_SPARSE_UPDATER_KERNELS_INSTANTIATE
+
+} // namespace metaspore
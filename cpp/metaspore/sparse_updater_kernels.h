@@ -0,0 +1,57 @@
+//
+// Copyright 2022 DMetaSoul
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+//
+
+#pragma once
+
+#include <pybind11/numpy.h>
+#include <stdint.h>
+
+//
+// ``sparse_updater_kernels.h`` defines fused kernels of the built-in sparse
+// updaters. Each kernel updates the parameter and state rows selected by
+// ``indices`` in a single pass, splitting the rows among several threads.
+//
+// ``param`` and ``state`` are the 2-D row views of a sparse tensor partition,
+// whose rows may be strided but whose columns must be contiguous; ``grad``
+// holds one row per index. Indices are expected to be unique, which is the
+// case for pushes of uniquified keys.
+//
+
+namespace metaspore {
+
+class SparseUpdaterKernels {
+  public:
+    template <typename T>
+    static void UpdateSGD(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                          pybind11::array_t<uint64_t> indices, T learning_rate);
+
+    template <typename T>
+    static void UpdateAdaGrad(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                              pybind11::array_t<T> state, pybind11::array_t<uint64_t> indices,
+                              T learning_rate, T float_stable_eps, T l2);
+
+    template <typename T>
+    static void UpdateAdam(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                           pybind11::array_t<T> state, pybind11::array_t<uint64_t> indices,
+                           T learning_rate, T beta1, T beta2, T epsilon);
+
+    template <typename T>
+    static void UpdateFTRL(pybind11::array_t<T> param, pybind11::array_t<T> grad,
+                           pybind11::array_t<T> state, pybind11::array_t<uint64_t> indices, T l1,
+                           T l2, T alpha, T beta);
+};
+
+} // namespace metaspore
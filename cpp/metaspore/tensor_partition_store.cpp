@@ -17,6 +17,7 @@
 #include <metaspore/io.h>
 #include <metaspore/stack_trace_utils.h>
 #include <metaspore/tensor_partition_store.h>
+#include <metaspore/tensor_utils.h>
 #include <spdlog/spdlog.h>
 #include <stdexcept>
 
@@ -71,7 +72,7 @@ void TensorPartitionStore::DenseDispose(const std::string &name) {
 }
 
 void TensorPartitionStore::DensePush(const std::string &name, PSMessage req, bool is_value,
-                                     bool is_state) {
+                                     bool is_state, bool float16) {
     auto it = dense_store_.find(name);
     if (it == dense_store_.end()) {
         std::string serr;
@@ -83,7 +84,9 @@ void TensorPartitionStore::DensePush(const std::string &name, PSMessage req, boo
         throw std::runtime_error(serr);
     }
     DenseTensorPartition &part = it->second;
-    SmartArray<uint8_t> in = req->GetTypedSlice(0, part.GetMeta().GetDataType());
+    const DataType type = part.GetMeta().GetDataType();
+    SmartArray<uint8_t> in = float16 ? DecodeFloat16Array(req->GetTypedSlice<uint16_t>(0), type)
+                                     : req->GetTypedSlice(0, type);
     part.HandlePush(in, is_value, is_state);
 }
 
@@ -203,7 +206,8 @@ void TensorPartitionStore::SparseClear(const std::string &name) {
     part.Clear();
 }
 
-void TensorPartitionStore::SparsePush(const std::string &name, PSMessage req, bool is_value) {
+void TensorPartitionStore::SparsePush(const std::string &name, PSMessage req, bool is_value,
+                                      bool float16) {
     auto it = sparse_store_.find(name);
     if (it == sparse_store_.end()) {
         std::string serr;
@@ -216,7 +220,9 @@ void TensorPartitionStore::SparsePush(const std::string &name, PSMessage req, bo
     }
     SparseTensorPartition &part = it->second;
     SmartArray<uint8_t> keys = req->GetTypedSlice<uint64_t>(0).Cast<uint8_t>();
-    SmartArray<uint8_t> in = req->GetTypedSlice(1, part.GetMeta().GetDataType());
+    const DataType type = part.GetMeta().GetDataType();
+    SmartArray<uint8_t> in = float16 ? DecodeFloat16Array(req->GetTypedSlice<uint16_t>(1), type)
+                                     : req->GetTypedSlice(1, type);
     part.HandlePush(keys, in, is_value);
 }
 
@@ -314,7 +320,9 @@ PSMessage TensorPartitionStore::SparsePullMeta(const std::string &name) {
     return res;
 }
 
-void TensorPartitionStore::SparseLoad(const std::string &name, const std::string &dir_path) {
+void TensorPartitionStore::SparseLoad(const std::string &name, const std::string &dir_path,
+                                      const std::vector<std::string> &delta_dir_paths,
+                                      bool track_changes) {
     auto it = sparse_store_.find(name);
     if (it == sparse_store_.end()) {
         std::string serr;
@@ -326,11 +334,11 @@ void TensorPartitionStore::SparseLoad(const std::string &name, const std::string
         throw std::runtime_error(serr);
     }
     SparseTensorPartition &part = it->second;
-    part.Load(dir_path);
+    part.Load(dir_path, delta_dir_paths, track_changes);
 }
 
 void TensorPartitionStore::SparseSave(const std::string &name, const std::string &dir_path,
-                                      bool text_mode) {
+                                      bool text_mode, bool delta, bool track_changes) {
     auto it = sparse_store_.find(name);
     if (it == sparse_store_.end()) {
         std::string serr;
@@ -343,7 +351,7 @@ void TensorPartitionStore::SparseSave(const std::string &name, const std::string
     }
     SparseTensorPartition &part = it->second;
     EnsureLocalDirectory(dir_path);
-    part.Save(dir_path, text_mode);
+    part.Save(dir_path, text_mode, delta, track_changes);
 }
 
 void TensorPartitionStore::SparseExport(const std::string &name, const std::string &dir_path) {
@@ -21,6 +21,7 @@
 #include <metaspore/ps_agent.h>
 #include <metaspore/sparse_tensor_partition.h>
 #include <unordered_map>
+#include <vector>
 
 namespace metaspore {
 
@@ -34,7 +35,8 @@ class TensorPartitionStore {
 
     void DenseInit(const DenseTensorMeta &meta);
     void DenseDispose(const std::string &name);
-    void DensePush(const std::string &name, PSMessage req, bool is_value, bool is_state);
+    void DensePush(const std::string &name, PSMessage req, bool is_value, bool is_state,
+                   bool float16);
     PSMessage DensePull(const std::string &name, bool is_state);
     void DensePushMeta(const std::string &name, const DenseTensorMeta &meta);
     PSMessage DensePullMeta(const std::string &name);
@@ -42,15 +44,17 @@ class TensorPartitionStore {
     void SparseInit(const SparseTensorMeta &meta);
     void SparseDispose(const std::string &name);
     void SparseClear(const std::string &name);
-    void SparsePush(const std::string &name, PSMessage req, bool is_value);
+    void SparsePush(const std::string &name, PSMessage req, bool is_value, bool float16);
     PSMessage SparsePull(const std::string &name, PSMessage req, bool read_only, bool nan_fill);
     void SparsePushPartition(const std::string &name, PSMessage req, bool data_only,
                              bool skip_existing);
     PSMessage SparsePullPartition(const std::string &name, bool data_only, int index, int count);
     void SparsePushMeta(const std::string &name, const SparseTensorMeta &meta);
     PSMessage SparsePullMeta(const std::string &name);
-    void SparseLoad(const std::string &name, const std::string &dir_path);
-    void SparseSave(const std::string &name, const std::string &dir_path, bool text_mode);
+    void SparseLoad(const std::string &name, const std::string &dir_path,
+                    const std::vector<std::string> &delta_dir_paths, bool track_changes);
+    void SparseSave(const std::string &name, const std::string &dir_path, bool text_mode,
+                    bool delta, bool track_changes);
     void SparseExport(const std::string &name, const std::string &dir_path);
     void SparsePruneSmall(const std::string &name, double epsilon);
     void SparsePruneOld(const std::string &name, int max_age);
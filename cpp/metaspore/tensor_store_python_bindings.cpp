@@ -19,6 +19,7 @@
 #include <metaspore/pybind_utils.h>
 #include <metaspore/sparse_tensor.h>
 #include <metaspore/tensor_store_python_bindings.h>
+#include <pybind11/stl.h>
 
 namespace py = pybind11;
 
@@ -111,7 +112,7 @@ void DefineTensorStoreBindings(pybind11::module &m) {
              })
         .def("push",
              [](metaspore::DenseTensor &self, py::array in, py::object cb, bool is_value,
-                bool is_state) {
+                bool is_state, bool float16) {
                  auto in_obj = metaspore::make_shared_pyobject(in);
                  void *in_data_ptr = const_cast<void *>(in.data(0));
                  uint8_t *in_data = static_cast<uint8_t *>(in_data_ptr);
@@ -125,7 +126,7 @@ void DefineTensorStoreBindings(pybind11::module &m) {
                          py::gil_scoped_acquire gil;
                          (*func)();
                      },
-                     is_value, is_state);
+                     is_value, is_state, float16);
              })
         .def("pull",
              [](metaspore::DenseTensor &self, py::object cb, bool is_state) {
@@ -222,6 +223,12 @@ void DefineTensorStoreBindings(pybind11::module &m) {
                 std::string data = metaspore::serialize_pyobject(value);
                 self.GetMeta().SetUpdaterByData(std::move(data));
             })
+        .def_property(
+            "storage_type",
+            [](const metaspore::SparseTensor &self) { return self.GetMeta().GetStorageType(); },
+            [](metaspore::SparseTensor &self, std::string value) {
+                self.GetMeta().SetStorageType(std::move(value));
+            })
         .def_property(
             "partition_count",
             [](const metaspore::SparseTensor &self) { return self.GetMeta().GetPartitionCount(); },
@@ -261,7 +268,7 @@ void DefineTensorStoreBindings(pybind11::module &m) {
              })
         .def("push",
              [](metaspore::SparseTensor &self, py::array keys, py::array in, py::object cb,
-                bool is_value) {
+                bool is_value, bool float16) {
                  auto keys_obj = metaspore::make_shared_pyobject(keys);
                  auto in_obj = metaspore::make_shared_pyobject(in);
                  void *keys_data_ptr = const_cast<void *>(keys.data(0));
@@ -280,7 +287,7 @@ void DefineTensorStoreBindings(pybind11::module &m) {
                          py::gil_scoped_acquire gil;
                          (*func)();
                      },
-                     is_value);
+                     is_value, float16);
              })
         .def("pull",
              [](metaspore::SparseTensor &self, py::array keys, py::object cb, bool read_only,
@@ -311,7 +318,7 @@ void DefineTensorStoreBindings(pybind11::module &m) {
              })
         .def("load",
              [](metaspore::SparseTensor &self, const std::string &dir_path, py::object cb,
-                bool keep_meta) {
+                bool keep_meta, std::vector<std::string> delta_dir_paths, bool track_changes) {
                  auto func = metaspore::make_shared_pyobject(cb);
                  py::gil_scoped_release gil;
                  self.Load(
@@ -320,11 +327,11 @@ void DefineTensorStoreBindings(pybind11::module &m) {
                          py::gil_scoped_acquire gil;
                          (*func)();
                      },
-                     keep_meta);
+                     keep_meta, delta_dir_paths, track_changes);
              })
         .def("save",
              [](metaspore::SparseTensor &self, const std::string &dir_path, py::object cb,
-                bool text_mode) {
+                bool text_mode, bool delta, bool track_changes) {
                  auto func = metaspore::make_shared_pyobject(cb);
                  py::gil_scoped_release gil;
                  self.Save(
@@ -333,7 +340,7 @@ void DefineTensorStoreBindings(pybind11::module &m) {
                          py::gil_scoped_acquire gil;
                          (*func)();
                      },
-                     text_mode);
+                     text_mode, delta, track_changes);
              })
         .def("export",
              [](metaspore::SparseTensor &self, const std::string &dir_path, py::object cb) {
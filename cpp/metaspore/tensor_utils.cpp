@@ -14,6 +14,7 @@
 // limitations under the License.
 //
 
+#include <immintrin.h>
 #include <limits>
 #include <metaspore/pybind_utils.h>
 #include <metaspore/stack_trace_utils.h>
@@ -95,6 +96,50 @@ void FillNaN(uint8_t *buffer, size_t size, DataType type) {
     }
 }
 
+static void CheckFloat16DataType(DataType type) {
+    if (type != DataType::Float32 && type != DataType::Float64) {
+        std::string serr;
+        serr.append("DataType must be float32 or float64 to convert from or to float16; ");
+        serr.append(DataTypeToString(type));
+        serr.append(" is invalid.\n\n");
+        serr.append(GetStackTrace());
+        spdlog::error(serr);
+        throw std::runtime_error(serr);
+    }
+}
+
+template <typename T> void EncodeFloat16Values(const T *in, size_t count, uint16_t *out) {
+    for (size_t i = 0; i < count; i++)
+        out[i] = _cvtss_sh(static_cast<float>(in[i]), _MM_FROUND_TO_NEAREST_INT);
+}
+
+template <typename T> void DecodeFloat16Values(const uint16_t *in, size_t count, T *out) {
+    for (size_t i = 0; i < count; i++)
+        out[i] = static_cast<T>(_cvtsh_ss(in[i]));
+}
+
+void EncodeFloat16(const uint8_t *in, size_t count, DataType type, uint16_t *out) {
+    CheckFloat16DataType(type);
+    if (type == DataType::Float32)
+        EncodeFloat16Values(reinterpret_cast<const float *>(in), count, out);
+    else
+        EncodeFloat16Values(reinterpret_cast<const double *>(in), count, out);
+}
+
+void DecodeFloat16(const uint16_t *in, size_t count, DataType type, uint8_t *out) {
+    CheckFloat16DataType(type);
+    if (type == DataType::Float32)
+        DecodeFloat16Values(in, count, reinterpret_cast<float *>(out));
+    else
+        DecodeFloat16Values(in, count, reinterpret_cast<double *>(out));
+}
+
+SmartArray<uint8_t> DecodeFloat16Array(SmartArray<uint16_t> in, DataType type) {
+    SmartArray<uint8_t> out(DataTypeToSize(type) * in.size());
+    DecodeFloat16(in.data(), in.size(), type, out.data());
+    return out;
+}
+
 void MakeInitializerReady(pybind11::object initializer) { fixup_attributes(initializer); }
 
 void MakeUpdaterReady(pybind11::object updater) { fixup_attributes(updater); }
@@ -17,6 +17,7 @@
 #pragma once
 
 #include <common/hashmap/data_types.h>
+#include <metaspore/smart_array.h>
 #include <pybind11/pybind11.h>
 #include <stdint.h>
 #include <string>
@@ -29,6 +30,9 @@ size_t TotalElements(const std::vector<size_t> &shape);
 std::string ShapeToString(const std::vector<size_t> &shape);
 std::vector<size_t> ShapeFromString(const std::string &str);
 void FillNaN(uint8_t *buffer, size_t size, DataType type);
+void EncodeFloat16(const uint8_t *in, size_t count, DataType type, uint16_t *out);
+void DecodeFloat16(const uint16_t *in, size_t count, DataType type, uint8_t *out);
+SmartArray<uint8_t> DecodeFloat16Array(SmartArray<uint16_t> in, DataType type);
 void MakeInitializerReady(pybind11::object initializer);
 void MakeUpdaterReady(pybind11::object udpater);
 
@@ -18,44 +18,18 @@
 # wrong RUNPATH set in _metaspore.so.
 import pyarrow
 
+from importlib import import_module as _import_module
+from importlib.util import find_spec as _find_spec
+
 from ._metaspore import NodeRole
 from ._metaspore import ActorConfig
 from ._metaspore import PSRunner
 
-from .embedding import EmbeddingSumConcat
-from .embedding import EmbeddingRangeSum
-from .embedding import EmbeddingLookup
-
-from .cast import Cast
-
-from .initializer import TensorInitializer
-from .initializer import DefaultTensorInitializer
-from .initializer import ZeroTensorInitializer
-from .initializer import OneTensorInitializer
-from .initializer import NormalTensorInitializer
-from .initializer import XavierTensorInitializer
-
-from .updater import TensorUpdater
-from .updater import NoOpUpdater
-from .updater import SGDTensorUpdater
-from .updater import AdaGradTensorUpdater
-from .updater import AdamTensorUpdater
-from .updater import AdamWTensorUpdater
-from .updater import FTRLTensorUpdater
-from .updater import EMATensorUpdater
-
-from .agent import Agent
-from .model import Model
-from .model import SparseModel
-from .metric import ModelMetric
-from .metric import BasicModelMetric
-from .metric import BinaryClassificationModelMetric
-from .distributed_trainer import DistributedTrainer
-from .experiment import Experiment
+from ._metaspore import get_metaspore_version
+__version__ = get_metaspore_version()
+del get_metaspore_version
 
-try:
-    import pyspark
-except ImportError:
+if _find_spec('pyspark') is None:
     # Use findspark to simplify running job locally.
     try:
         import findspark
@@ -63,58 +37,120 @@ except ImportError:
     except:
         pass
 
-try:
-    import pyspark
-except ImportError:
-    pass
-else:
-    # PySpark may not be available at this point,
-    # we import the classes in estimator only when
-    # PySpark is ready.
-
-    from .estimator import PyTorchAgent
-    from .estimator import PyTorchLauncher
-    from .estimator import PyTorchModel
-    from .estimator import PyTorchEstimator
-
-    from .two_tower_ranking import TwoTowerRankingModule
-    from .two_tower_ranking import TwoTowerRankingAgent
-    from .two_tower_ranking import TwoTowerRankingLauncher
-    from .two_tower_ranking import TwoTowerRankingModel
-    from .two_tower_ranking import TwoTowerRankingEstimator
-
-    from .swing_retrieval import SwingModel
-    from .swing_retrieval import SwingEstimator
-
-try:
-    import pyspark
-    import faiss
-    import pymilvus
-except ImportError:
-    pass
-else:
-    from .two_tower_retrieval import TwoTowerRetrievalModule
-    from .two_tower_retrieval import TwoTowerIndexBuilder
-    from .two_tower_retrieval import TwoTowerFaissIndexBuilder
-    from .two_tower_retrieval import TwoTowerMilvusIndexBuilder
-    from .two_tower_retrieval import TwoTowerIndexBuildingAgent
-    from .two_tower_retrieval import TwoTowerIndexRetrievalAgent
-    from .two_tower_retrieval import TwoTowerRetrievalLauncher
-    from .two_tower_retrieval import TwoTowerRetrievalModel
-    from .two_tower_retrieval import TwoTowerRetrievalEstimator
-
-from ._metaspore import get_metaspore_version
-__version__ = get_metaspore_version()
-del get_metaspore_version
-
-from . import nn
-from . import input
-from . import output
-from . import spark
-from . import s3_utils
-from . import feature_group
-from . import patching_pickle
-from . import demo
-
-patching_pickle._patch_lookup_module_and_qualname()
-patching_pickle._patch_getsourcelines()
+# The other attributes are imported on first access, so that processes
+# using only part of the package, such as serving and command line tools,
+# do not pay for importing PyTorch, PySpark, Faiss and Milvus.
+_lazy_attributes = dict()
+_lazy_requirements = dict()
+_lazy_submodules = frozenset((
+    'nn',
+    'input',
+    'output',
+    'spark',
+    's3_utils',
+    'feature_group',
+    'patching_pickle',
+    'demo',
+))
+
+def _register_lazy_attributes(module_name, names, requirements=()):
+    for name in names:
+        _lazy_attributes[name] = module_name
+    if requirements:
+        _lazy_requirements[module_name] = requirements
+
+_register_lazy_attributes('.embedding', (
+    'EmbeddingSumConcat',
+    'EmbeddingRangeSum',
+    'EmbeddingLookup',
+))
+_register_lazy_attributes('.embedding_cache', ('EmbeddingCache',))
+_register_lazy_attributes('.cast', ('Cast',))
+_register_lazy_attributes('.initializer', (
+    'TensorInitializer',
+    'DefaultTensorInitializer',
+    'ZeroTensorInitializer',
+    'OneTensorInitializer',
+    'NormalTensorInitializer',
+    'XavierTensorInitializer',
+))
+_register_lazy_attributes('.updater', (
+    'TensorUpdater',
+    'NoOpUpdater',
+    'SGDTensorUpdater',
+    'AdaGradTensorUpdater',
+    'AdamTensorUpdater',
+    'AdamWTensorUpdater',
+    'FTRLTensorUpdater',
+    'EMATensorUpdater',
+))
+_register_lazy_attributes('.agent', ('Agent',))
+_register_lazy_attributes('.model', ('Model', 'SparseModel'))
+_register_lazy_attributes('.metric', (
+    'ModelMetric',
+    'BasicModelMetric',
+    'BinaryClassificationModelMetric',
+))
+_register_lazy_attributes('.gradient_compressor', ('GradientCompressor',))
+_register_lazy_attributes('.distributed_trainer', ('DistributedTrainer',))
+_register_lazy_attributes('.experiment', ('Experiment',))
+
+# The estimators are available only when PySpark is.
+_register_lazy_attributes('.estimator', (
+    'PyTorchAgent',
+    'PyTorchLauncher',
+    'PyTorchModel',
+    'PyTorchEstimator',
+), ('pyspark',))
+_register_lazy_attributes('.two_tower_ranking', (
+    'TwoTowerRankingModule',
+    'TwoTowerRankingAgent',
+    'TwoTowerRankingLauncher',
+    'TwoTowerRankingModel',
+    'TwoTowerRankingEstimator',
+), ('pyspark',))
+_register_lazy_attributes('.swing_retrieval', (
+    'SwingModel',
+    'SwingEstimator',
+), ('pyspark',))
+_register_lazy_attributes('.two_tower_retrieval', (
+    'TwoTowerRetrievalModule',
+    'TwoTowerIndexBuilder',
+    'TwoTowerFaissIndexBuilder',
+    'TwoTowerMilvusIndexBuilder',
+    'TwoTowerIndexBuildingAgent',
+    'TwoTowerIndexRetrievalAgent',
+    'TwoTowerRetrievalLauncher',
+    'TwoTowerRetrievalModel',
+    'TwoTowerRetrievalEstimator',
+), ('pyspark', 'faiss', 'pymilvus'))
+
+def _is_submodule(name):
+    # Submodules not listed above, such as ``embedding`` or ``updater``, are
+    # attributes too once imported; import them on access as well.
+    if name.startswith('__'):
+        return False
+    return _find_spec('.' + name, __name__) is not None
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        value = _import_module('.' + name, __name__)
+    else:
+        module_name = _lazy_attributes.get(name)
+        if module_name is None:
+            if not _is_submodule(name):
+                raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+            return _import_module('.' + name, __name__)
+        requirements = _lazy_requirements.get(module_name, ())
+        missing = [req for req in requirements if _find_spec(req) is None]
+        if missing:
+            message = f"module {__name__!r} has no attribute {name!r}; "
+            message += f"it requires {', '.join(missing)}"
+            raise AttributeError(message)
+        module = _import_module(module_name, __name__)
+        value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes) | _lazy_submodules)
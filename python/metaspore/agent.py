@@ -26,6 +26,7 @@ from ._metaspore import Message
 from ._metaspore import PSRunner
 from ._metaspore import PSDefaultAgent
 from .metric import BinaryClassificationModelMetric
+from .step_profiler import StepProfiler
 from .network_utils import get_available_endpoint
 from .url_utils import use_s3a
 
@@ -350,6 +351,8 @@ class Agent(object):
     def stop_workers(self):
         rdd = self.spark_context.parallelize(range(self.worker_count), self.worker_count)
         rdd.barrier().mapPartitions(self._worker_stop).collect()
+        # Report the profiles of the last, possibly incomplete, round.
+        self.report_step_profile()
 
     def load_dataset(self, dataset_path):
         from pyspark.sql import functions as F
@@ -431,10 +434,56 @@ class Agent(object):
         def push_metric_callback(req, res):
             self.clear_metric()
         self.send_request(req, push_metric_callback)
+        self.push_step_profile()
 
     def clear_metric(self):
         self._metric.clear()
 
+    @property
+    def step_profiler(self):
+        return getattr(self, '_Agent__step_profiler', None)
+
+    @step_profiler.setter
+    def step_profiler(self, value):
+        if value is not None and not isinstance(value, StepProfiler):
+            raise TypeError(f"step_profiler must be StepProfiler; {value!r} is invalid")
+        self.__step_profiler = value
+
+    def push_step_profile(self):
+        profiler = self.step_profiler
+        # Message slices can not be empty, transfer bytes recorded before
+        # any phase are pushed with the next profile.
+        if profiler is None or not profiler.phase_names:
+            return
+        # Profiles are snapshotted and cleared right away, as steps
+        # may still be recorded before the response arrives.
+        names, states = profiler.get_states(clear=True)
+        body = dict(command='PushStepProfile', phases=names)
+        req = Message()
+        req.body = json.dumps(body)
+        req.receiver = 0 << 4 | 8 | 1
+        for state in states:
+            req.add_slice(state)
+        def push_step_profile_callback(req, res):
+            pass
+        self.send_request(req, push_step_profile_callback)
+
+    @property
+    def _step_profile(self):
+        profile = getattr(self, '_Agent__step_profile', None)
+        if profile is None:
+            profile = StepProfiler()
+            self.__step_profile = profile
+            self.__step_profile_push_count = 0
+        return profile
+
+    def report_step_profile(self):
+        profile = self._step_profile
+        if not profile.is_empty:
+            print(profile.format())
+        profile.clear()
+        self.__step_profile_push_count = 0
+
     def handle_request(self, req):
         body = json.loads(req.body)
         command = body.get('command')
@@ -451,4 +500,18 @@ class Agent(object):
             res = Message()
             self.send_response(req, res)
             return
+        if command == 'PushStepProfile':
+            states = ()
+            for i in range(req.slice_count):
+                states += req.get_slice(i),
+            # Profiles of the workers are merged and reported once per
+            # round of pushes, instead of printing one line per worker.
+            accum = self._step_profile
+            accum.merge_states(body['phases'], states)
+            self.__step_profile_push_count += 1
+            if self.__step_profile_push_count >= self.worker_count:
+                self.report_step_profile()
+            res = Message()
+            self.send_response(req, res)
+            return
         super().handle_request(req)
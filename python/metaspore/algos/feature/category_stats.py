@@ -0,0 +1,149 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy
+import pandas as pd
+import pyspark.sql.functions as F
+from pyspark.sql import SparkSession
+
+KEY_SEP = u'\u0001'
+
+def category_key(columns, fold_col=None):
+    ''' string key of the categories of columns, null if any column is null
+
+    Args
+      - columns: category column names
+      - fold_col: if specified, prefix the key with the fold of out-of-fold encoding
+    '''
+
+    parts = []
+    if fold_col is not None:
+        parts.append(F.col(fold_col).cast('string'))
+    for column in columns:
+        if parts:
+            parts.append(F.lit(KEY_SEP))
+        parts.append(F.col(column).cast('string'))
+    return parts[0] if len(parts) == 1 else F.concat(*parts)
+
+def assign_folds(dataset, num_folds, seed=0, fold_col='__fold'):
+    ''' add the fold column of out-of-fold encoding, derived from the row content
+        so that it is stable when the dataset is recomputed
+    '''
+
+    fold = F.pmod(F.xxhash64(*[F.col(c) for c in dataset.columns], F.lit(seed)), F.lit(num_folds))
+    return dataset.withColumn(fold_col, fold.cast('int'))
+
+def aggregate_category_stats(dataset, keys, label_col, fold_col=None):
+    ''' aggregate the label statistics of several category columns in one pass
+
+    Args
+      - dataset: pyspark dataframe
+      - keys: dict of encoding name to the list of its category columns
+      - label_col: label column
+      - fold_col: if specified, aggregate the statistics per fold
+
+    Returns a pair of dicts. The first maps each encoding name to a dict of
+    category key to (rows, label_count, label_sum); the second maps the
+    encoding names to the totals over all rows. With fold_col, the dict
+    keys are (fold, category key) and (fold, name) pairs respectively.
+    '''
+
+    names = list(keys)
+    # one entry per encoding and one for the totals, exploded so that a
+    # single groupBy computes the statistics of all the columns
+    entries = [F.struct(F.lit(i).alias('index'), category_key(keys[name]).alias('key'))
+               for i, name in enumerate(names)]
+    entries.append(F.struct(F.lit(len(names)).alias('index'), F.lit('').alias('key')))
+    columns = [F.explode(F.array(*entries)).alias('entry'), F.col(label_col).alias('label')]
+    selected_columns = ['entry.index', 'entry.key', 'label']
+    group_columns = ['index', 'key']
+    if fold_col is not None:
+        columns.append(F.col(fold_col).alias('fold'))
+        selected_columns.append('fold')
+        group_columns.append('fold')
+    grouped = dataset.select(*columns)\
+                     .select(*selected_columns)\
+                     .filter(F.col('key').isNotNull())\
+                     .groupBy(*group_columns)\
+                     .agg(F.count(F.lit(1)).alias('rows'),
+                          F.count('label').alias('label_count'),
+                          F.sum('label').alias('label_sum'))
+    stats = {name: {} for name in names}
+    totals = {}
+    for row in grouped.collect():
+        value = (row['rows'], row['label_count'], row['label_sum'] or 0)
+        fold = row['fold'] if fold_col is not None else None
+        if row['index'] == len(names):
+            for name in names:
+                totals[name if fold_col is None else (fold, name)] = value
+        else:
+            stats[names[row['index']]][row['key'] if fold_col is None else (fold, row['key'])] = value
+    return stats, totals
+
+def sum_folds(stats):
+    ''' sum the per fold statistics of aggregate_category_stats '''
+
+    result = {}
+    for (fold, key), value in stats.items():
+        current = result.get(key, (0, 0, 0))
+        result[key] = tuple(x + y for x, y in zip(current, value))
+    return result
+
+def out_of_fold(stats, summed):
+    ''' statistics of the other folds of each (fold, key) pair '''
+
+    return {(fold, key): tuple(x - y for x, y in zip(summed[key], value))
+            for (fold, key), value in stats.items()}
+
+def fold_mapping(mapping):
+    ''' convert the (fold, key) pairs of mapping to the keys of category_key with fold_col '''
+
+    return {f'{fold}{KEY_SEP}{key}': value for (fold, key), value in mapping.items()}
+
+def _get_lookup_table(mapping_br):
+    # Python workers reuse the broadcast object across tasks, so the index
+    # is built once per worker and kept next to the broadcast value. The
+    # trailing NaN is what position -1 of missing keys picks.
+    table = getattr(mapping_br, '_lookup_table', None)
+    if table is None:
+        mapping = mapping_br.value
+        index = pd.Index(list(mapping.keys()))
+        values = numpy.array(list(mapping.values()) + [numpy.nan], dtype=numpy.float64)
+        table = index, values
+        mapping_br._lookup_table = table
+    return table
+
+def lookup_category_values(dataset, output_column, key, mapping, data_type='double'):
+    ''' add output_column by looking up the key column in mapping,
+        broadcast as a hash map instead of being inlined in the plan
+
+    Args
+      - dataset: pyspark dataframe
+      - output_column: the generated column
+      - key: category key column expression
+      - mapping: dict of category key to value, missing keys give null
+      - data_type: data type of output_column
+    '''
+
+    spark = SparkSession.builder.getOrCreate()
+    mapping_br = spark.sparkContext.broadcast(mapping)
+
+    @F.pandas_udf('double')
+    def lookup(keys: pd.Series) -> pd.Series:
+        index, values = _get_lookup_table(mapping_br)
+        return pd.Series(values[index.get_indexer(keys)], index=keys.index)
+
+    return dataset.withColumn(output_column, lookup(key).cast(data_type))
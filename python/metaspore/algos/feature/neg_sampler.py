@@ -16,7 +16,10 @@
 
 import time
 import numpy as np
+import pandas as pd
+from pyspark import TaskContext
 from pyspark.sql.functions import lit, col, pow
+from pyspark.sql.types import StructType, StructField
 
 def gen_sample_prob(dataset, group_by, alpha=0.75):
     ''' generate the sample probabilities of the dataset using:
@@ -36,26 +39,67 @@ def gen_sample_prob(dataset, group_by, alpha=0.75):
     print('Debug -- neg_sampler.gen_sample_prob cost time:', time.time() - start)
     return item_weight
 
-def sample(user_id, user_item_list, item_list, dist_list, negative_sample):
-    ''' Sample negative list for a user through numpy
+def build_alias_table(dist_list):
+    ''' Build the alias table of a discrete distribution with Vose's method,
+        so that each draw costs O(1) whatever the number of items
 
     Args
-      - user_id: user id
-      - user_item_list: item list that use have iteractions
-      - item_list: item total list
       - dist_list: item sampling probabilities
+    '''
+
+    n = len(dist_list)
+    prob = np.asarray(dist_list, dtype='float64') * n
+    alias = np.arange(n, dtype='int64')
+    small = list(np.flatnonzero(prob < 1.0))
+    large = list(np.flatnonzero(prob >= 1.0))
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        alias[s] = l
+        prob[l] -= 1.0 - prob[s]
+        if prob[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    # the remaining entries are 1.0 up to rounding errors
+    prob[small] = 1.0
+    prob[large] = 1.0
+    return prob, alias
+
+def sample(rng, user_codes, item_index, prob, alias, negative_sample, sampling_strategy, in_batch_ratio):
+    ''' Sample negative items for a batch of users through numpy
+
+    Args
+      - rng: numpy random generator
+      - user_codes: sorted user codes of the positive samples
+      - item_index: item indices of the positive samples
+      - prob, alias: alias table of the item sampling probabilities
       - negative_sample: how many negative samples for one positive sample
+      - sampling_strategy: 'popularity', 'uniform' or 'mixed'
+      - in_batch_ratio: the ratio of in-batch negatives of the 'mixed' strategy
     '''
 
-    # sample negative list
-    candidate_list = np.random.default_rng().choice(list(item_list), size=len(user_item_list)*negative_sample, \
-                                    replace=True, p=list(dist_list)).tolist()
-    # remove the positive sample from the sampling result
-    candidate_list = list(set(candidate_list)-set(user_item_list))
-    # sample trigger list
-    trigger_list = np.random.default_rng().choice(list(user_item_list), size=len(candidate_list), \
-                                    replace=True).tolist()
-    return list(zip(trigger_list, candidate_list))
+    num_items = len(prob)
+    size = len(user_codes) * negative_sample
+    # draw the candidates of the users, each user getting negative_sample draws per positive
+    candidate_users = np.repeat(user_codes, negative_sample)
+    candidates = rng.integers(0, num_items, size=size)
+    if sampling_strategy != 'uniform':
+        candidates = np.where(rng.random(size) < prob[candidates], candidates, alias[candidates])
+    if sampling_strategy == 'mixed':
+        in_batch = rng.random(size) < in_batch_ratio
+        candidates[in_batch] = item_index[rng.integers(0, len(item_index), size=int(in_batch.sum()))]
+    # remove the duplicated candidates and the positive samples of each user
+    positive_keys = user_codes * num_items + item_index
+    candidate_keys = np.unique(candidate_users * num_items + candidates)
+    candidate_keys = candidate_keys[~np.isin(candidate_keys, positive_keys)]
+    candidate_users = candidate_keys // num_items
+    candidates = candidate_keys % num_items
+    # sample trigger items among the positive samples of each user
+    counts = np.bincount(user_codes, minlength=user_codes[-1] + 1)
+    starts = np.cumsum(counts) - counts
+    triggers = starts[candidate_users] + (rng.random(len(candidates)) * counts[candidate_users]).astype('int64')
+    return candidate_users, item_index[triggers], candidates
 
 def negative_sampling(spark,
                       dataset,
@@ -64,7 +108,11 @@ def negative_sampling(spark,
                       time_column,
                       negative_item_column,
                       negative_sample=3,
-                      reserve_other_columns=[]):
+                      reserve_other_columns=[],
+                      sampling_strategy='popularity',
+                      alpha=0.75,
+                      in_batch_ratio=0.5,
+                      seed=None):
     ''' negative sampling on original dataset
 
     Args
@@ -75,32 +123,74 @@ def negative_sampling(spark,
       time_column: timestamp for positive sample
       negative_item_column: negative item id column
       negative_sample: how many negative samples for one positive sample
+      sampling_strategy: 'popularity' samples items by their discounted frequencies,
+        'uniform' samples all items evenly, 'mixed' replaces in_batch_ratio of the
+        popularity negatives by the positive items of the same batch
+      alpha: discounting factor of the popularity distribution
+      in_batch_ratio: the ratio of in-batch negatives of the 'mixed' strategy
+      seed: base seed of the per-partition random generators
     '''
 
+    if sampling_strategy not in ('popularity', 'uniform', 'mixed'):
+        raise ValueError(f"sampling_strategy must be one of: 'popularity', 'uniform', 'mixed'; "
+                         f"{sampling_strategy!r} is invalid")
     # sampling distribution
-    item_weight = gen_sample_prob(dataset, item_column)
+    item_weight = gen_sample_prob(dataset, item_column, alpha)
     # unzip a list of tupples
     items_dist = item_weight.select(item_column, 'sampling_prob')\
                             .rdd.map(lambda x: (x[0], x[1])).collect()
-    zipped_dist = [list(t) for t in zip(*items_dist)]
-    item_list, dist_list = zipped_dist[0], zipped_dist[1]
+    item_list = np.array([x[0] for x in items_dist])
+    dist_list = np.array([x[1] for x in items_dist], dtype='float64')
+    # sort the items, so that executors find their indices with np.searchsorted
+    order = np.argsort(item_list, kind='stable')
+    item_list = item_list[order]
     # normlazation
-    dist_list = np.asarray(dist_list).astype('float64')
-    dist_list = list(dist_list / np.sum(dist_list))
+    dist_list = dist_list[order] / np.sum(dist_list)
+    prob, alias = build_alias_table(dist_list)
     print('Debug -- neg_sampler.negative_sampling item_list.size:', len(item_list))
-    print('Debug -- neg_sampler.negative_sampling dist_list.size:', len(dist_list))
     # broadcast
-    item_list_br = spark.sparkContext.broadcast(item_list)
-    dist_list_br = spark.sparkContext.broadcast(dist_list)
+    table_br = spark.sparkContext.broadcast((item_list, prob, alias))
+
+    def sample_batch(rng, batch):
+        item_list, prob, alias = table_br.value
+        user_codes, users = pd.factorize(batch[user_column], sort=True)
+        item_index = np.searchsorted(item_list, batch[item_column].values)
+        candidate_users, triggers, candidates = sample(rng, user_codes, item_index, prob, alias,
+                                                       negative_sample, sampling_strategy, in_batch_ratio)
+        return pd.DataFrame({user_column: users.values[candidate_users],
+                             negative_item_column: item_list[triggers],
+                             item_column: item_list[candidates]})
+
+    def sample_partition(iterator):
+        partition_id = TaskContext.get().partitionId()
+        rng = np.random.default_rng(None if seed is None else [seed, partition_id])
+        pending = None
+        for batch in iterator:
+            if pending is not None:
+                batch = pd.concat([pending, batch], ignore_index=True)
+            if len(batch) == 0:
+                continue
+            # rows are sorted by user, keep the last user for the next batch
+            # as its positive samples may continue there
+            tail = batch[user_column] == batch[user_column].iloc[-1]
+            pending = batch[tail]
+            batch = batch[~tail]
+            if len(batch) > 0:
+                yield sample_batch(rng, batch)
+        if pending is not None and len(pending) > 0:
+            yield sample_batch(rng, pending)
+
     # generate sampling dataframe
     start = time.time()
-    sampling_df = dataset.select(user_column, item_column).distinct().rdd\
-        .map(lambda x: (x[user_column], [x[item_column]]))\
-        .reduceByKey(lambda x, y: x + y)\
-        .map(lambda x: (x[0], sample(x[0], x[1], item_list_br.value, dist_list_br.value, negative_sample)))\
-        .flatMapValues(lambda x: x)\
-        .map(lambda x: (x[0], x[1][0], x[1][1]))\
-        .toDF([user_column, negative_item_column, item_column])
+    user_type = dataset.schema[user_column].dataType
+    item_type = dataset.schema[item_column].dataType
+    schema = StructType([StructField(user_column, user_type),
+                         StructField(negative_item_column, item_type),
+                         StructField(item_column, item_type)])
+    sampling_df = dataset.select(user_column, item_column).distinct()\
+        .repartition(user_column)\
+        .sortWithinPartitions(user_column)\
+        .mapInPandas(sample_partition, schema)
     # generate timestamp by table join
     user_join_cond = col('t1.{}'.format(user_column))==col('t2.{}'.format(user_column))
     item_join_cond = col('t1.{}'.format(negative_item_column))==col('t2.{}'.format(item_column))
@@ -15,8 +15,8 @@
 #
 
 import time
-from functools import reduce
 from pyspark.sql import functions as F
+from pyspark.sql import Window
 
 def gen_user_bhv_seq(spark,
                      dataset,
@@ -26,7 +26,8 @@ def gen_user_bhv_seq(spark,
                      item_seq_column = 'user_bhv_item_seq',
                      last_item_column = 'user_bhv_last_item',
                      max_len=10,
-                     sep=u'\u0001'):
+                     sep=u'\u0001',
+                     item_seq_array_column=None):
     ''' generate sparese features for MovieLens-1M dataset
 
     Args
@@ -39,38 +40,25 @@ def gen_user_bhv_seq(spark,
       - item_last_column: generated last item of user behavoir
       - max_len: length of user sequences
       - sep: seperator char
+      - item_seq_array_column: if specified, also generate the item sequence as an array column
     '''
 
-    def gen_bhv_seq_by_user(kv_pairs, max_len, sep):
-        ''' generte user behaviour sequence features
-
-        Args
-        - kv_pairs: [item_id, timestamp]
-        - max_len: maximum user behavior sequence length
-        - seq: squence splitter
-        '''
-        # sort by timestatamp
-        kv_pairs.sort(key=lambda x: x[1])
-        # get recent list
-        recent_items = []
-        for i in range(0, len(kv_pairs)):
-            current, hist_time = kv_pairs[i]
-            # get last max_len items
-            hist_list = [0] if i == 0 else reduce(lambda x, y:x+y, map(lambda x:[x[0]], kv_pairs[max(0, i-max_len):i]))
-            last_item = str(hist_list[-1])
-            hist_list = str.join(sep, map(str, hist_list))
-            recent_items.append((current, hist_list, last_item, hist_time))
-        return recent_items
-
     start = time.time()
-    # generate user recent behaviors features
-    hist_item_list_df = dataset.rdd\
-        .map(lambda x: (x[user_column], [(x[item_coulmn], x[time_column])]))\
-        .reduceByKey(lambda x, y: x + y)\
-        .map(lambda x: (x[0], gen_bhv_seq_by_user(x[1], max_len, sep)))\
-        .flatMapValues(lambda x: x)\
-        .map(lambda x: (x[0], x[1][0], x[1][1], x[1][2], x[1][3]))\
-        .toDF([user_column, item_coulmn, item_seq_column, last_item_column, time_column])
+    # the window of each event covers the max_len previous events of the user
+    window = Window.partitionBy(user_column).orderBy(time_column).rowsBetween(-max_len, -1)
+    hist_list = F.collect_list(F.col(item_coulmn).cast('string')).over(window)
+    # the first event of a user has the placeholder history [0]
+    hist_list = F.when(F.size(hist_list) == 0, F.array(F.lit('0'))).otherwise(hist_list)
+    hist_item_list_df = dataset.select(user_column, item_coulmn, time_column)\
+        .withColumn(item_seq_array_column or '__hist_list', hist_list)
+    hist_list = F.col(item_seq_array_column or '__hist_list')
+    hist_item_list_df = hist_item_list_df\
+        .withColumn(item_seq_column, F.array_join(hist_list, sep))\
+        .withColumn(last_item_column, F.element_at(hist_list, -1))
+    columns = [user_column, item_coulmn, item_seq_column, last_item_column, time_column]
+    if item_seq_array_column is not None:
+        columns.append(item_seq_array_column)
+    hist_item_list_df = hist_item_list_df.select(columns)
 
     print('Debug -- generate sequential features cost time:', time.time() - start)
     return hist_item_list_df
@@ -14,22 +14,75 @@
 # limitations under the License.
 #
 
+import re
 import functools
 
-from pyspark.sql import functions as F
+from pyspark.sql.types import IntegralType
+from .category_stats import category_key, assign_folds, aggregate_category_stats, \
+                           sum_folds, out_of_fold, fold_mapping, lookup_category_values
 
-def gen_numerical_features(dataset, label_col, cate_cols_list, combine_sep='#'):
+def _compute_cr(value, prior, smoothing):
+    rows, label_count, label_sum = value
+    if smoothing is None:
+        return label_sum / label_count if label_count > 0 else None
+    if label_count + smoothing <= 0:
+        return None
+    return (label_sum + smoothing * prior) / (label_count + smoothing)
+
+def gen_numerical_features(dataset, label_col, cate_cols_list, combine_sep='#',
+                           smoothing=None, num_folds=None, seed=0):
+    ''' generate the conversion rate (_cr) and positive count (_pv) features of
+        categories and combined categories, aggregated in one pass and looked up
+        through broadcast hash maps
+
+    Args
+      - dataset: pyspark dataframe
+      - label_col: label column
+      - cate_cols_list: lists of category columns, combined columns joined by combine_sep
+      - smoothing: if specified, blend the conversion rates with the global rate
+        with the weight of smoothing samples
+      - num_folds: if specified, encode the rows of each fold with the statistics
+        of the other folds to avoid label leakage
+      - seed: seed of the fold assignment
+    '''
+
+    keys = {}
+    for cols in cate_cols_list:
+        for col in cols:
+            col_list = col.split(combine_sep)
+            keys['_'.join(col_list)] = col_list
+    fold_col = None
+    if num_folds is not None:
+        fold_col = '__fold'
+        dataset = assign_folds(dataset, num_folds, seed, fold_col)
+    stats, totals = aggregate_category_stats(dataset, keys, label_col, fold_col)
+    pv_type = 'bigint' if isinstance(dataset.schema[label_col].dataType, IntegralType) else 'double'
+    for name, col_list in keys.items():
+        if fold_col is None:
+            name_stats = stats[name]
+            total = totals.get(name, (0, 0, 0))
+        else:
+            summed = sum_folds(stats[name])
+            name_stats = out_of_fold(stats[name], summed)
+            total = sum_folds({(fold, None): value for (fold, n), value in totals.items() if n == name})
+            total = total.get(None, (0, 0, 0))
+        prior = total[2] / total[1] if total[1] > 0 else 0.0
+        cr_mapping = {key: _compute_cr(value, prior, smoothing) for key, value in name_stats.items()}
+        pv_mapping = {key: value[2] for key, value in name_stats.items()}
+        if fold_col is not None:
+            cr_mapping = fold_mapping(cr_mapping)
+            pv_mapping = fold_mapping(pv_mapping)
+        key = category_key(col_list, fold_col)
+        dataset = lookup_category_values(dataset, name + '_cr', key, cr_mapping)
+        dataset = lookup_category_values(dataset, name + '_pv', key, pv_mapping, pv_type)
     features = []
     features_list = []
     for cols in cate_cols_list:
         for col in cols:
             col_list = col.split(combine_sep)
-            df_cr_pv = dataset.groupBy(*col_list)\
-                .agg((F.sum(label_col) / F.count(label_col)).alias('_'.join(col_list) + '_cr'),
-                      F.sum(label_col).alias('_'.join(col_list) + '_pv'))
-            dataset = dataset.join(df_cr_pv, on=col_list, how='left_outer')
-            df_cr_pv = df_cr_pv.select(df_cr_pv.colRegex("`^user_id$|^item_id$|^.*_(cr|pv)$`"))
-            features = features + [f.name for f in df_cr_pv.schema.fields]
+            name = '_'.join(col_list)
+            fields = col_list + [name + '_cr', name + '_pv']
+            features = features + [f for f in fields if re.match(r'^user_id$|^item_id$|^.*_(cr|pv)$', f)]
         features_list.append(features)
         features = []
     dataset = dataset.select(
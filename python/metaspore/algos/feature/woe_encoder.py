@@ -14,40 +14,81 @@
 # limitations under the License.
 #
 
-import pyspark.sql.functions as F
+import math
+from .category_stats import category_key, assign_folds, aggregate_category_stats, \
+                           sum_folds, out_of_fold, fold_mapping, lookup_category_values
 
 class WoeEncoder(object):
-    def __init__(self, colunms_to_woe, label_col, bad_label_value=1.0, output_suffix='_woe'):
+    def __init__(self, colunms_to_woe, label_col, bad_label_value=1.0, output_suffix='_woe',
+                 smoothing=None, num_folds=None, seed=0):
+        if bad_label_value not in (0, 1):
+            raise ValueError(f"bad_label_value must be 1.0 or 0.0; {bad_label_value!r} is invalid")
+        if num_folds is not None and (not isinstance(num_folds, int) or num_folds < 2):
+            raise TypeError(f"num_folds must be integer greater than 1; {num_folds!r} is invalid")
         self.colunms_to_woe = colunms_to_woe
         self.label_col = label_col
         self.bad_label_value = bad_label_value
         self.output_suffix = output_suffix
+        self.smoothing = smoothing
+        self.num_folds = num_folds
+        self.seed = seed
         self.data = {}
 
-    def fit(self, dataframe):
-        total_bad = dataframe.filter(F.col(self.label_col) == self.bad_label_value).count()
-        total_good = dataframe.filter(F.col(self.label_col) != self.bad_label_value).count()
-        for colunm_to_woe in self.colunms_to_woe:
-            df = dataframe.groupBy(F.col(colunm_to_woe)).agg(F.count(colunm_to_woe).alias('total_in_bucket'), F.sum(self.label_col).alias('label_sum'))
-            if self.bad_label_value == 1:
-                df = df.withColumnRenamed('label_sum', 'bad_in_bucket')
-                df = df.withColumn('good_in_bucket', df.total_in_bucket - df.bad_in_bucket)
-            elif self.bad_label_value == 0:
-                df = df.withColumnRenamed('label_sum', 'good_in_bucket')
-                df = df.withColumn('bad_in_bucket', df.total_in_bucket - df.good_in_bucket)
-            else:
-                raise Exception('bad_label_value must be 1.0 or 0.0, but current value is: ', bad_label_value)
-            df = df.withColumn('bad_in_bucket_fixed', F.when(df.bad_in_bucket > 0, df.bad_in_bucket).otherwise(0.5))
-            df = df.withColumn('good_in_bucket_fixed', F.when(df.good_in_bucket > 0, df.good_in_bucket).otherwise(0.5))
-            df = df.withColumn('woe', F.log((df.bad_in_bucket_fixed / total_bad) / (df.good_in_bucket_fixed / total_good)))
+    def _compute_woe(self, value, total):
+        rows, label_count, label_sum = value
+        if self.bad_label_value == 1:
+            bad, good = label_sum, rows - label_sum
+            total_bad, total_good = total[2], total[1] - total[2]
+        else:
+            bad, good = rows - label_sum, label_sum
+            total_bad, total_good = total[1] - total[2], total[2]
+        if self.smoothing is None:
+            bad = bad if bad > 0 else 0.5
+            good = good if good > 0 else 0.5
+        else:
+            bad += self.smoothing
+            good += self.smoothing
+            total_bad += self.smoothing
+            total_good += self.smoothing
+        if total_bad <= 0 or total_good <= 0:
+            return None
+        return math.log((bad / total_bad) / (good / total_good))
 
-            col_dict = {row[colunm_to_woe]:row['woe'] for row in df.collect()}
-            self.data[colunm_to_woe] = col_dict
+    def _compute_woe_dict(self, stats, totals):
+        return {key: self._compute_woe(value, totals) for key, value in stats.items()}
 
+    def fit(self, dataframe):
+        keys = {column: [column] for column in self.colunms_to_woe}
+        stats, totals = aggregate_category_stats(dataframe, keys, self.label_col)
+        for colunm_to_woe in self.colunms_to_woe:
+            self.data[colunm_to_woe] = self._compute_woe_dict(stats[colunm_to_woe], totals.get(colunm_to_woe, (0, 0, 0)))
         return self.data
 
     def transform(self, dataframe):
         for colunm_to_woe in self.colunms_to_woe:
-            dataframe = dataframe.withColumn(colunm_to_woe + self.output_suffix, F.coalesce(*[F.when(F.col(colunm_to_woe) == key, F.lit(value)) for key, value in self.data[colunm_to_woe].items()]))
-
+            dataframe = lookup_category_values(dataframe, colunm_to_woe + self.output_suffix,
+                                               category_key([colunm_to_woe]), self.data[colunm_to_woe])
         return dataframe
+
+    def fit_transform(self, dataframe):
+        ''' fit and transform the dataframe; with num_folds, the rows of each fold are
+            encoded with the statistics of the other folds to avoid label leakage
+        '''
+        if self.num_folds is None:
+            self.fit(dataframe)
+            return self.transform(dataframe)
+        fold_col = '__fold'
+        dataframe = assign_folds(dataframe, self.num_folds, self.seed, fold_col)
+        keys = {column: [column] for column in self.colunms_to_woe}
+        stats, totals = aggregate_category_stats(dataframe, keys, self.label_col, fold_col)
+        for colunm_to_woe in self.colunms_to_woe:
+            fold_totals = {(fold, None): value for (fold, name), value in totals.items() if name == colunm_to_woe}
+            summed = sum_folds(stats[colunm_to_woe])
+            summed_total = sum_folds(fold_totals).get(None, (0, 0, 0))
+            self.data[colunm_to_woe] = self._compute_woe_dict(summed, summed_total)
+            oof_totals = out_of_fold(fold_totals, {None: summed_total})
+            mapping = {(fold, key): self._compute_woe(value, oof_totals[(fold, None)])
+                       for (fold, key), value in out_of_fold(stats[colunm_to_woe], summed).items()}
+            dataframe = lookup_category_values(dataframe, colunm_to_woe + self.output_suffix,
+                                               category_key([colunm_to_woe], fold_col), fold_mapping(mapping))
+        return dataframe.drop(fold_col)
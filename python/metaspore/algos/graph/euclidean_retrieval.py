@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 
+import numpy
 import pyspark.ml.base
 import pyspark.sql.functions as F
 from pyspark.sql import Window
@@ -21,6 +22,7 @@ from pyspark.sql.functions import col
 from pyspark.sql.types import LongType
 from pyspark.ml.feature import BucketedRandomProjectionLSH, CountVectorizer, MinMaxScaler, VectorAssembler
 from pyspark.sql.types import FloatType
+from .similarity_top_k import compute_top_k_similarity
 
 class EuclideanModel(pyspark.ml.base.Model):
     def __init__(self,
@@ -79,6 +81,8 @@ class EuclideanEstimator(pyspark.ml.base.Estimator):
                 value_column_name='value',
                 item_score_delimiter=':',
                 item_score_pair_delimiter=';',
+                exact_similarity=False,
+                similarity_metric='euclidean',
                 debug=False):
         super().__init__()
         self.user_id_column_name = user_id_column_name
@@ -92,6 +96,8 @@ class EuclideanEstimator(pyspark.ml.base.Estimator):
         self.value_column_name = value_column_name
         self.item_score_delimiter = item_score_delimiter
         self.item_score_pair_delimiter = item_score_pair_delimiter
+        self.exact_similarity = exact_similarity
+        self.similarity_metric = similarity_metric
         self.debug = debug
             
     def _filter_dataset(self, dataset):
@@ -130,6 +136,8 @@ class EuclideanEstimator(pyspark.ml.base.Estimator):
         cv = CountVectorizer(inputCol='user_list', outputCol='features')
         model_cv = cv.fit(relationship_data)
         cv_result = model_cv.transform(relationship_data)
+        if self.exact_similarity:
+            return self._euclidean_exact_transform(cv_result, dataset.schema['item_id'].dataType)
         mh = BucketedRandomProjectionLSH(inputCol='features', outputCol='hashes', bucketLength=self.euclidean_bucket_length)
         model_mh = mh.fit(cv_result)
         euclidean_dist_table = model_mh.approxSimilarityJoin(cv_result, cv_result, threshold=self.euclidean_distance_threshold, distCol='euclidean_dist')\
@@ -159,6 +167,26 @@ class EuclideanEstimator(pyspark.ml.base.Estimator):
             recall_result.show(10)
         return recall_result
       
+    ## compute the exact top k neighbors on the sparse user count vectors
+    def _euclidean_exact_transform(self, cv_result, item_type):
+        rows = cv_result.select('item_id', 'features').collect()
+        ids = [row['item_id'] for row in rows]
+        lengths = [len(row['features'].indices) for row in rows]
+        indptr = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=indptr[1:])
+        indices = numpy.concatenate([row['features'].indices for row in rows]).astype(numpy.int64)
+        values = numpy.concatenate([row['features'].values for row in rows])
+        recall_result = compute_top_k_similarity(ids, (indptr, indices, values),
+                                                 self.max_recommendation_count,
+                                                 item_type,
+                                                 metric=self.similarity_metric,
+                                                 key_column_name=self.key_column_name,
+                                                 value_column_name=self.value_column_name)
+        if self.debug:
+            print('Debug --- euclidean result:')
+            recall_result.show(10)
+        return recall_result
+
     def _fit(self, dataset):
         dataset = self._filter_dataset(dataset)
         dataset = self._preprocess_dataset(dataset)
@@ -19,6 +19,9 @@ import pyspark.sql.functions as F
 from pyspark.sql import Window
 from pyspark.sql.functions import col
 from pyspark.sql.types import LongType
+from pyspark.sql.types import DoubleType
+from pyspark.sql.types import StructType
+from pyspark.sql.types import StructField
 from pyspark.ml.feature import CountVectorizer, MinHashLSH
 
 
@@ -78,14 +81,29 @@ class JaccardEstimator(pyspark.ml.base.Estimator):
                 value_column_name='value',
                 item_score_delimiter=':',
                 item_score_pair_delimiter=';',
+                exact=False,
+                min_jaccard_similarity=None,
+                lsh_num_bands=20,
+                lsh_rows_per_band=5,
+                lsh_seed=0,
                 debug=False):
         super().__init__()
+        # The band id is kept in the top 8 bits of the band tokens.
+        if not isinstance(lsh_num_bands, int) or not 0 < lsh_num_bands <= 256:
+            raise ValueError(f"lsh_num_bands must be integer between 1 and 256; {lsh_num_bands!r} is invalid")
+        if not isinstance(lsh_rows_per_band, int) or lsh_rows_per_band <= 0:
+            raise ValueError(f"lsh_rows_per_band must be positive integer; {lsh_rows_per_band!r} is invalid")
         self.user_id_column_name = user_id_column_name
         self.item_id_column_name = item_id_column_name
         self.behavior_column_name = behavior_column_name
         self.behavior_filter_value = behavior_filter_value
         self.max_recommendation_count = max_recommendation_count
         self.jaccard_distance_threshold=jaccard_distance_threshold
+        self.exact = exact
+        self.min_jaccard_similarity = min_jaccard_similarity
+        self.lsh_num_bands = lsh_num_bands
+        self.lsh_rows_per_band = lsh_rows_per_band
+        self.lsh_seed = lsh_seed
         self.key_column_name = key_column_name
         self.value_column_name = value_column_name
         self.item_score_delimiter = item_score_delimiter
@@ -119,8 +137,184 @@ class JaccardEstimator(pyspark.ml.base.Estimator):
         
         return model
     
+    ## represent the users of each item by 64-bit hashes, ordered by
+    ## ascending user frequency so that prefixes hold the rarest users
+    def _jaccard_compute_item_sets(self, dataset):
+        pairs = dataset.filter(F.col('user_id').isNotNull() & F.col('item_id').isNotNull()) \
+                       .select('item_id', F.xxhash64(F.col('user_id')).alias('user')) \
+                       .distinct()
+        user_freq = pairs.groupBy('user').agg(F.count(F.lit(1)).alias('freq'))
+        item_sets = pairs.join(user_freq, on='user') \
+                         .groupBy('item_id') \
+                         .agg(F.array_sort(F.collect_list(F.struct('freq', 'user'))).alias('users')) \
+                         .select('item_id', F.col('users.user').alias('users'), F.size('users').alias('size'))
+        return item_sets
+
+    ## prefix filtering: two sets with jaccard >= t share a user
+    ## among the first |x| - ceil(t * |x|) + 1 users of each of them
+    def _jaccard_prefix_tokens(self, item_sets):
+        t = self.min_jaccard_similarity
+        prefix_length = (F.col('size') - F.ceil(F.col('size') * t) + 1).cast('int')
+        tokens = item_sets.select('item_id', 'size', F.explode(F.slice(F.col('users'), 1, prefix_length)).alias('token'))
+        return tokens
+
+    ## lsh banding: items whose minhash signatures agree on all rows of some band
+    def _jaccard_band_tokens(self, item_sets):
+        num_bands = self.lsh_num_bands
+        rows_per_band = self.lsh_rows_per_band
+        seed = self.lsh_seed
+        item_type = item_sets.schema['item_id'].dataType
+        schema = StructType([StructField('item_id', item_type),
+                             StructField('size', LongType()),
+                             StructField('token', LongType())])
+
+        def compute_band_tokens(iterator):
+            import numpy
+            import pandas
+            prime = numpy.uint64(4294967311)
+            rng = numpy.random.default_rng(seed)
+            count = num_bands * rows_per_band
+            a = rng.integers(1, 1 << 31, count, dtype=numpy.uint64)
+            b = rng.integers(0, 1 << 31, count, dtype=numpy.uint64)
+            multipliers = rng.integers(1, 1 << 63, rows_per_band, dtype=numpy.uint64) | numpy.uint64(1)
+            band_ids = numpy.arange(num_bands, dtype=numpy.uint64) << numpy.uint64(56)
+            for batch in iterator:
+                items, sizes, tokens = [], [], []
+                for item, users, size in zip(batch['item_id'], batch['users'], batch['size']):
+                    x = numpy.asarray(users, dtype=numpy.int64).view(numpy.uint64)
+                    x = (x ^ (x >> numpy.uint64(32))) & numpy.uint64(0xFFFFFFFF)
+                    signature = numpy.full(count, numpy.iinfo(numpy.uint64).max, dtype=numpy.uint64)
+                    for start in range(0, len(x), 4096):
+                        chunk = x[start:start + 4096]
+                        hashes = (a[:, None] * chunk[None, :] + b[:, None]) % prime
+                        numpy.minimum(signature, hashes.min(axis=1), out=signature)
+                    # Wrapping uint64 arithmetic combines the rows of each band.
+                    keys = (signature.reshape(num_bands, rows_per_band) * multipliers).sum(axis=1)
+                    keys = (keys >> numpy.uint64(8)) | band_ids
+                    items.append(numpy.full(num_bands, item, dtype=object))
+                    sizes.append(numpy.full(num_bands, size, dtype=numpy.int64))
+                    tokens.append(keys.view(numpy.int64))
+                if items:
+                    yield pandas.DataFrame({'item_id': numpy.concatenate(items),
+                                            'size': numpy.concatenate(sizes),
+                                            'token': numpy.concatenate(tokens)})
+
+        return item_sets.mapInPandas(compute_band_tokens, schema)
+
+    ## generate the candidate pairs of items sharing a token, pruned by
+    ## the size bound t * |y| <= |x| <= |y| / t when t is specified
+    def _jaccard_compute_candidates(self, tokens):
+        t = self.min_jaccard_similarity
+        item_type = tokens.schema['item_id'].dataType
+        schema = StructType([StructField('item_id_i', item_type),
+                             StructField('item_id_j', item_type)])
+        groups = tokens.groupBy('token') \
+                       .agg(F.collect_list(F.struct('item_id', 'size')).alias('items')) \
+                       .filter(F.size('items') > 1)
+
+        def generate_pairs(iterator):
+            import numpy
+            import pandas
+            for batch in iterator:
+                out_i, out_j = [], []
+                for items in batch['items']:
+                    ids = numpy.array([x['item_id'] for x in items])
+                    sizes = numpy.array([x['size'] for x in items], dtype=numpy.float64)
+                    order = numpy.argsort(sizes, kind='stable')
+                    ids = ids[order]
+                    sizes = sizes[order]
+                    m = len(ids)
+                    if t is None:
+                        hi = numpy.full(m, m)
+                    else:
+                        hi = numpy.searchsorted(sizes, sizes / t, side='right')
+                    counts = numpy.maximum(hi - numpy.arange(1, m + 1), 0)
+                    total = int(counts.sum())
+                    if total == 0:
+                        continue
+                    offsets = numpy.cumsum(counts) - counts
+                    i = numpy.repeat(numpy.arange(m), counts)
+                    j = numpy.arange(total) - numpy.repeat(offsets, counts) + i + 1
+                    x, y = ids[i], ids[j]
+                    swap = x > y
+                    out_i.append(numpy.where(swap, y, x))
+                    out_j.append(numpy.where(swap, x, y))
+                if out_i:
+                    yield pandas.DataFrame({'item_id_i': numpy.concatenate(out_i),
+                                            'item_id_j': numpy.concatenate(out_j)})
+
+        return groups.mapInPandas(generate_pairs, schema).distinct()
+
+    ## compute the exact similarity of the candidates with sorted set intersections
+    def _jaccard_compute_exact_similarity(self, candidates, item_sets):
+        t = self.min_jaccard_similarity
+        item_type = item_sets.schema['item_id'].dataType
+        schema = StructType([StructField('item_id_i', item_type),
+                             StructField('item_id_j', item_type),
+                             StructField('jaccard_sim', DoubleType())])
+        sets_i = item_sets.select(F.col('item_id').alias('item_id_i'), F.col('users').alias('users_i'))
+        sets_j = item_sets.select(F.col('item_id').alias('item_id_j'), F.col('users').alias('users_j'))
+        joined = candidates.join(sets_i, on='item_id_i').join(sets_j, on='item_id_j')
+
+        def intersect(iterator):
+            import numpy
+            import pandas
+            for batch in iterator:
+                inter = numpy.fromiter((len(numpy.intersect1d(x, y, assume_unique=True))
+                                        for x, y in zip(batch['users_i'], batch['users_j'])),
+                                       dtype=numpy.float64, count=len(batch))
+                size_i = batch['users_i'].map(len).to_numpy(dtype=numpy.float64)
+                size_j = batch['users_j'].map(len).to_numpy(dtype=numpy.float64)
+                yield pandas.DataFrame({'item_id_i': batch['item_id_i'],
+                                        'item_id_j': batch['item_id_j'],
+                                        'jaccard_sim': inter / (size_i + size_j - inter)})
+
+        similarity = joined.mapInPandas(intersect, schema).filter(F.col('jaccard_sim') > 0)
+        if t is not None:
+            similarity = similarity.filter(F.col('jaccard_sim') >= t)
+        ## candidates are unordered pairs, emit both directions
+        similarity = similarity.unionByName(similarity.select(F.col('item_id_j').alias('item_id_i'),
+                                                              F.col('item_id_i').alias('item_id_j'),
+                                                              'jaccard_sim'))
+        return similarity
+
+    ## compute the item similarity exactly on pruned candidates
+    def _jaccard_exact_transform(self, dataset):
+        if self.min_jaccard_similarity is not None and not 0 < self.min_jaccard_similarity <= 1:
+            raise ValueError("min_jaccard_similarity must be in (0, 1]")
+        item_sets = self._jaccard_compute_item_sets(dataset)
+        if self.min_jaccard_similarity is not None:
+            tokens = self._jaccard_prefix_tokens(item_sets)
+        else:
+            tokens = self._jaccard_band_tokens(item_sets)
+        candidates = self._jaccard_compute_candidates(tokens)
+        if self.debug:
+            print('Debug --- jaccard candidates:')
+            candidates.show(10)
+        return self._jaccard_compute_exact_similarity(candidates, item_sets)
+
     ## compute the item similarity
     def _jaccard_transform(self, dataset):
+        if self.exact:
+            jaccard_sim_table = self._jaccard_exact_transform(dataset)
+        else:
+            jaccard_sim_table = self._jaccard_approx_transform(dataset)
+
+        w = Window.partitionBy('item_id_i').orderBy(F.desc('jaccard_sim'))
+        recall_result = jaccard_sim_table.withColumn('rn',F.row_number()\
+                            .over(w))\
+                            .filter(f'rn <= %d' % self.max_recommendation_count)\
+                            .groupby('item_id_i')\
+                            .agg(F.collect_list(F.struct(F.col('item_id_j').alias('item_id'), F.col('jaccard_sim').alias('score'))).alias(self.value_column_name))\
+                            .withColumnRenamed('item_id_i', self.key_column_name)
+
+        if self.debug:
+            print('Debug --- jaccard result:')
+            recall_result.show(10)
+        return recall_result
+
+    ## compute the item similarity with MinHashLSH
+    def _jaccard_approx_transform(self, dataset):
         relationship_data = dataset.groupBy(F.col('item_id'))\
                                 .agg(F.collect_list(F.col('user_id'))\
                                 .alias('user_list'))
@@ -137,19 +331,7 @@ class JaccardEstimator(pyspark.ml.base.Estimator):
         jaccard_sim_table = jaccard_dist_table.withColumn('jaccard_sim', 1-F.col('jaccard_dist')).drop('jaccard_dist')\
                                               .filter(F.col('jaccard_sim') != 0)\
                                               .filter(F.col('item_id_i') != F.col('item_id_j'))
-        
-        w = Window.partitionBy('item_id_i').orderBy(F.desc('jaccard_sim'))
-        recall_result = jaccard_sim_table.withColumn('rn',F.row_number()\
-                            .over(w))\
-                            .filter(f'rn <= %d' % self.max_recommendation_count)\
-                            .groupby('item_id_i')\
-                            .agg(F.collect_list(F.struct(F.col('item_id_j').alias('item_id'), F.col('jaccard_sim').alias('score'))).alias(self.value_column_name))\
-                            .withColumnRenamed('item_id_i', self.key_column_name)
-
-        if self.debug:
-            print('Debug --- jaccard result:')
-            recall_result.show(10)
-        return recall_result
+        return jaccard_sim_table
     
     def _fit(self, dataset):
         dataset = self._filter_dataset(dataset)
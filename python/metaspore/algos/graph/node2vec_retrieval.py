@@ -14,13 +14,18 @@
 # limitations under the License.
 #
 
+import random
+import logging
+import numpy
 import pyspark.ml.base
 import pyspark.sql.functions as F
 from pyspark.sql import Window
 from pyspark.sql.types import Row
-from pyspark.sql.functions import udf
 from pyspark.sql.types import StringType, ArrayType, FloatType, StructType, StructField
 from pyspark.ml.feature import Word2Vec, BucketedRandomProjectionLSH, VectorAssembler, MinMaxScaler
+from .similarity_top_k import compute_top_k_similarity
+
+logger = logging.getLogger(__name__)
 
 class Node2VecModel(pyspark.ml.base.Model):
     def __init__(self,
@@ -81,6 +86,8 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
                  random_walk_Z=1.0,
                  random_walk_steps=10,
                  walk_times=8,
+                 random_walk_seed=None,
+                 max_csr_graph_edge_count=1 << 24,
                  key_column_name='key',
                  value_column_name='value',
                  vertex_score_delimiter=':',
@@ -92,6 +99,8 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
                  w2v_num_partitions=1,
                  euclid_bucket_length=100,
                  euclid_distance_threshold=10,
+                 exact_similarity=False,
+                 similarity_metric='euclidean',
                  debug=False):
         super().__init__()
         self.source_vertex_column_name = source_vertex_column_name
@@ -107,6 +116,8 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
         self.random_walk_Z = random_walk_Z
         self.random_walk_steps = random_walk_steps
         self.walk_times = walk_times
+        self.random_walk_seed = random_walk_seed
+        self.max_csr_graph_edge_count = max_csr_graph_edge_count
         self.key_column_name = key_column_name
         self.value_column_name = value_column_name
         self.vertex_score_delimiter = vertex_score_delimiter
@@ -121,6 +132,8 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
         self.w2v_num_partitions = w2v_num_partitions
         self.euclid_bucket_length = euclid_bucket_length
         self.euclid_distance_threshold = euclid_distance_threshold
+        self.exact_similarity = exact_similarity
+        self.similarity_metric = similarity_metric
         
 
     @staticmethod
@@ -155,13 +168,8 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
 
     @staticmethod
     def draw_alias(p, a):
-        from random import Random
-        from time import time
-        from math import floor
-
-        rdg = Random(time())
-        idx = floor(rdg.random() * len(p))
-        return idx if rdg.random() < p[idx] else a[idx]
+        idx = int(random.random() * len(p))
+        return idx if random.random() < p[idx] else a[idx]
     
     @staticmethod
     def verify(weights, p, a, sample_numb = 10000):
@@ -251,11 +259,41 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
             self.vertices_lookup.show(10, False)
             self.vertices_lookup.printSchema()
     
+    ## pack the vertices lookup into CSR arrays: the neighbors of vertex v
+    ## and their alias tables are at [offsets[v], offsets[v + 1]); the graph
+    ## is collected to the driver and broadcast, taking about 32 bytes per
+    ## edge besides the vertex names on the driver and every executor
+    def _build_csr_graph(self):
+        rows = self.vertices_lookup.collect()
+        sources = numpy.array([str(row['src']) for row in rows])
+        neighbors = [numpy.array([str(x) for x in row['attributes']['neighbors']]) for row in rows]
+        vertices = numpy.unique(numpy.concatenate([sources] + neighbors))
+        n = len(vertices)
+        source_indices = numpy.searchsorted(vertices, sources)
+        degrees = numpy.zeros(n, dtype=numpy.int64)
+        degrees[source_indices] = [len(x) for x in neighbors]
+        offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(degrees, out=offsets[1:])
+        edge_count = int(offsets[-1])
+        targets = numpy.zeros(edge_count, dtype=numpy.int64)
+        prob = numpy.ones(edge_count, dtype=numpy.float64)
+        alias = numpy.zeros(edge_count, dtype=numpy.int64)
+        for row, index, names in zip(rows, source_indices, neighbors):
+            begin, end = offsets[index], offsets[index + 1]
+            targets[begin:end] = numpy.searchsorted(vertices, names)
+            prob[begin:end] = row['attributes']['p']
+            alias[begin:end] = row['attributes']['a']
+        # Sorted (src, dst) keys, to test edge existence with binary search.
+        edge_keys = numpy.repeat(numpy.arange(n, dtype=numpy.int64), degrees) * n + targets
+        edge_keys.sort()
+        return dict(vertices=vertices, degrees=degrees, offsets=offsets, targets=targets,
+                    prob=prob, alias=alias, edge_keys=edge_keys)
+
     def _init_edges_lookup_df(self, edges):
         random_walk_p, random_walk_q, random_walk_Z = self.random_walk_p, self.random_walk_q, self.random_walk_Z
         def _setup_edges(row):
             src, dst, attributes = row['src'], row['dst'], row['attributes']
-            dst_neighbors, src_neighbors = attributes['dst_neighbors'], attributes['src_neighbors']
+            dst_neighbors, src_neighbors = attributes['dst_neighbors'], set(attributes['src_neighbors'])
 
             new_dst_neighbors = []
             pq_weights = []
@@ -271,34 +309,16 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
                 new_dst_neighbors.append(neighbor_dst)
 
             p, a = Node2VecEstimator.setup_alias(pq_weights)
-
             new_attributes = Row(dst_neighbors=new_dst_neighbors, p=p, a=a)
 
             return src, dst, new_attributes
-        
-        
-        if self.debug:
-            print('Debug - edges:')
-            edges.show(10, False)
-        
+
         df = edges.alias('t1').join(edges.alias('t2'), on=(F.col('t1.dst')==F.col('t2.src')), how='inner'). \
                     select('t1.*', \
                            F.col('t2.dst').alias('next_dst'), \
                            F.col('t2.weight').alias('next_weight'))
-        if self.debug:
-            print('Debug - dst of dst:')
-            df.show(10, False)
-        
         src_neighbors = edges.groupBy(F.col('src')).agg(F.collect_list(F.col('dst')).alias('src_neighbors'))
-        if self.debug:
-            print('Debug - src_neighbors:')
-            src_neighbors.show(10, False)
-        
         df = df.join(src_neighbors, on='src', how='leftouter')
-        if self.debug:
-            print('Debug - join src_neighbors:')
-            df.show(10, False)
-        
         df = df.groupBy([F.col('src'), F.col('dst')]).agg(F.struct(F.collect_list(F.struct(F.col('next_dst').alias('dst'),\
                                                                                    F.col('next_weight').alias('weight'))\
                                                                                   ).alias('dst_neighbors'),
@@ -308,52 +328,136 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
             print('Debug - attributes of edges:')
             df.show(10, False)
             df.printSchema()
-        
+
         self.edges_lookup = df.rdd.map(lambda row: _setup_edges(row)).toDF(['src', 'dst', 'attributes'])
         if self.debug:
             print('Debug - edges_lookup:')
             self.edges_lookup.show(10, False)
             self.edges_lookup.printSchema()
-    
-    def _random_walk(self):
-        def _first_step(row):
-            src, attributes = row['src'], row['attributes']
 
-            next_index = Node2VecEstimator.draw_alias(attributes['p'], attributes['a'])
-            next_vertex = attributes['neighbors'][next_index]
+    ## walk the graph with joins when it has more edges than can be collected:
+    ## the second-order alias tables of every edge are precomputed in the edges
+    ## lookup, which each step joins on the last edge of the walks; this is
+    ## slower and random_walk_seed does not apply to it
+    def _distributed_random_walk(self, edges):
+        self._init_edges_lookup_df(edges)
+        walk_length = self.random_walk_steps
+        walk_times = self.walk_times
 
-            return src, [src, next_vertex]
+        def _first_steps(row):
+            src, attributes = row['src'], row['attributes']
+            for _ in range(walk_times):
+                if walk_length < 2:
+                    yield src, [src]
+                    continue
+                next_index = Node2VecEstimator.draw_alias(attributes['p'], attributes['a'])
+                yield src, [src, attributes['neighbors'][next_index]]
 
-        def _next_step(path, attributes):    
+        def _next_step(path, attributes):
+            # Walks reaching a vertex without out-edges stop there.
             if attributes is not None:
                 next_index = Node2VecEstimator.draw_alias(attributes['p'], attributes['a'])
-                next_vertex = attributes['dst_neighbors'][next_index]
-                path.append(next_vertex)
-
+                path.append(attributes['dst_neighbors'][next_index])
             return path
-        
-        def _get_walk_df():       
-            walk_df = self.vertices_lookup.rdd.map(lambda row: _first_step(row)).toDF(['origin', 'path'])                                    
-            next_step_udf = udf(lambda path, attributes: _next_step(path, attributes), ArrayType(StringType()))
-            for i in range(self.random_walk_steps - 2):
-                walk_df = walk_df.withColumn('src', F.element_at(F.col('path'), -2))
-                walk_df = walk_df.withColumn('dst', F.element_at(F.col('path'), -1))  
-                walk_df = walk_df.join(self.edges_lookup, on=['src', 'dst'], how='leftouter')
-                walk_df = walk_df.select('origin', next_step_udf('path', 'attributes').alias('path'))
-            return walk_df
-        
-        total_walk_df = _get_walk_df()
-        for i in range(self.walk_times-1):
-            walk_df = _get_walk_df()
-            total_walk_df.union(walk_df)
-            
+
+        schema = StructType([StructField('origin', StringType()),
+                             StructField('path', ArrayType(StringType()))])
+        walk_df = self.vertices_lookup.rdd.flatMap(_first_steps) \
+                      .map(lambda x: (str(x[0]), [str(v) for v in x[1]])).toDF(schema)
+        next_step_udf = F.udf(_next_step, ArrayType(StringType()))
+        edges_lookup = self.edges_lookup.select(F.col('src').cast(StringType()).alias('src'),
+                                                F.col('dst').cast(StringType()).alias('dst'),
+                                                F.col('attributes'))
+        for _ in range(walk_length - 2):
+            walk_df = walk_df.withColumn('src', F.element_at(F.col('path'), -2))
+            walk_df = walk_df.withColumn('dst', F.element_at(F.col('path'), -1))
+            walk_df = walk_df.join(edges_lookup, on=['src', 'dst'], how='leftouter')
+            walk_df = walk_df.select('origin', next_step_udf('path', 'attributes').alias('path'))
+        return walk_df
+
+    def _random_walk(self, edges):
+        edge_count = self.vertices_lookup.select(F.sum(F.size('attributes.neighbors'))).first()[0] or 0
+        if edge_count > self.max_csr_graph_edge_count:
+            logger.warning('Node2Vec - the graph has %d edges, more than max_csr_graph_edge_count %d; '
+                           'falling back to the distributed random walk', edge_count, self.max_csr_graph_edge_count)
+            total_walk_df = self._distributed_random_walk(edges)
+            if self.debug:
+                print('Debug - walk_df:')
+                total_walk_df.show(10, False)
+                total_walk_df.printSchema()
+            return total_walk_df
+        graph = self._build_csr_graph()
+        broadcast_graph = self.vertices_lookup.rdd.context.broadcast(graph)
+        walk_length = self.random_walk_steps
+        walk_times = self.walk_times
+        seed = self.random_walk_seed
+        # Unnormalized node2vec biases; random_walk_Z scales all of them
+        # and does not change the transition probabilities.
+        return_bias = 1.0 / self.random_walk_p
+        in_out_bias = 1.0 / self.random_walk_q
+        max_bias = max(return_bias, 1.0, in_out_bias)
+
+        def walk(iterator):
+            from pyspark import TaskContext
+            import pandas
+            g = broadcast_graph.value
+            vertices, degrees, offsets = g['vertices'], g['degrees'], g['offsets']
+            targets, prob, alias, edge_keys = g['targets'], g['prob'], g['alias'], g['edge_keys']
+            n = len(vertices)
+            rng = numpy.random.default_rng(None if seed is None else (seed, TaskContext.get().partitionId()))
+
+            def draw(current):
+                # Batched first-order alias sampling over the out-edges of ``current``.
+                degree = degrees[current]
+                k = numpy.minimum((rng.random(len(current)) * degree).astype(numpy.int64), degree - 1)
+                edge = offsets[current] + k
+                k = numpy.where(rng.random(len(current)) < prob[edge], k, alias[edge])
+                return targets[offsets[current] + k]
+
+            def has_edge(src, dst):
+                keys = src * n + dst
+                pos = numpy.minimum(numpy.searchsorted(edge_keys, keys), len(edge_keys) - 1)
+                return edge_keys[pos] == keys
+
+            for batch in iterator:
+                starts = numpy.searchsorted(vertices, batch['src'].astype(str).to_numpy())
+                starts = numpy.repeat(starts, walk_times)
+                paths = numpy.full((len(starts), walk_length), -1, dtype=numpy.int64)
+                paths[:, 0] = starts
+                active = numpy.flatnonzero(degrees[starts] > 0)
+                if walk_length > 1 and len(active) > 0:
+                    paths[active, 1] = draw(starts[active])
+                for step in range(2, walk_length):
+                    active = active[degrees[paths[active, step - 1]] > 0]
+                    # Second-order steps sample by rejection: a first-order draw x
+                    # from v, coming from t, is accepted with probability
+                    # bias(t, x) / max_bias, which is exact for node2vec.
+                    pending = active
+                    while len(pending) > 0:
+                        previous = paths[pending, step - 2]
+                        current = paths[pending, step - 1]
+                        proposal = draw(current)
+                        bias = numpy.where(has_edge(previous, proposal), 1.0,
+                                           numpy.where(proposal == previous, return_bias, in_out_bias))
+                        accepted = rng.random(len(pending)) * max_bias < bias
+                        paths[pending[accepted], step] = proposal[accepted]
+                        pending = pending[~accepted]
+                lengths = (paths >= 0).sum(axis=1)
+                names = vertices[numpy.maximum(paths, 0)]
+                yield pandas.DataFrame({'origin': names[:, 0],
+                                        'path': [list(names[i, :lengths[i]]) for i in range(len(paths))]})
+
+        schema = StructType([StructField('origin', StringType()),
+                             StructField('path', ArrayType(StringType()))])
+        total_walk_df = self.vertices_lookup.select('src').mapInPandas(walk, schema)
+
         if self.debug:
             print('Debug - walk_df:')
             total_walk_df.show(10, False)
             total_walk_df.printSchema()
-            
+
         return total_walk_df
-    
+
     def _word2vec(self, random_walk_paths):
         word2Vec = Word2Vec(vectorSize=self.w2v_vector_size, inputCol="path", outputCol="model", \
                             windowSize=self.w2v_window_size, minCount=self.w2v_min_count, \
@@ -365,18 +469,30 @@ class Node2VecEstimator(pyspark.ml.base.Estimator):
     def _node2vec_transform(self, edges):
         # 1. Initialize lookup dataframe
         self._init_vertices_lookup_df(edges)
-        self._init_edges_lookup_df(edges)
         
         # 2. Start random walk
-        random_walk_paths = self._random_walk()
+        random_walk_paths = self._random_walk(edges)
         
         # 3. Call Word2Vec
         node_vectors = self._word2vec(random_walk_paths)
         
         return node_vectors
     
+    ## compute the exact top k neighbors with blocked matrix products
+    def _get_exact_i2i_df(self, embedding_table):
+        rows = embedding_table.collect()
+        words = [row['word'] for row in rows]
+        matrix = numpy.array([row['vector'].toArray() for row in rows], dtype=numpy.float32)
+        return compute_top_k_similarity(words, matrix, self.max_recommendation_count,
+                                        StringType(),
+                                        metric=self.similarity_metric,
+                                        key_column_name=self.key_column_name,
+                                        value_column_name=self.value_column_name)
+
     def _get_i2i_df(self, embedding_table):
-        
+        if self.exact_similarity:
+            return self._get_exact_i2i_df(embedding_table)
+
         mh = BucketedRandomProjectionLSH(inputCol='vector', outputCol='hashes', bucketLength=self.euclid_bucket_length)
         model_mh = mh.fit(embedding_table)
         # calculate the distance
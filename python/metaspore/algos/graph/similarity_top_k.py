@@ -0,0 +1,160 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy
+from pyspark.sql import SparkSession
+from pyspark.sql.types import ArrayType, FloatType, StructType, StructField
+
+def _merge_top_k(best_index, best_score, index, score, k):
+    # Keep the ``k`` largest scores of each row, sorted in descending order.
+    if best_index is not None:
+        index = numpy.concatenate((best_index, index), axis=1)
+        score = numpy.concatenate((best_score, score), axis=1)
+    if score.shape[1] > k:
+        part = numpy.argpartition(-score, k - 1, axis=1)[:, :k]
+        index = numpy.take_along_axis(index, part, axis=1)
+        score = numpy.take_along_axis(score, part, axis=1)
+    order = numpy.argsort(-score, axis=1, kind='stable')
+    return numpy.take_along_axis(index, order, axis=1), numpy.take_along_axis(score, order, axis=1)
+
+def _distance_to_score(squared_distance):
+    return 1.0 / (1.0 + numpy.sqrt(numpy.maximum(squared_distance, 0.0)))
+
+def _dense_top_k(matrix, norms, start, stop, k, metric, item_block_size):
+    queries = matrix[start:stop]
+    rows = numpy.arange(stop - start)
+    best_index = best_score = None
+    for item_start in range(0, len(matrix), item_block_size):
+        items = matrix[item_start:item_start + item_block_size]
+        dots = queries @ items.T
+        if metric == 'cosine':
+            denominator = norms[start:stop, None] * norms[None, item_start:item_start + len(items)]
+            score = numpy.divide(dots, denominator, out=numpy.zeros_like(dots), where=denominator > 0)
+        else:
+            squared = norms[start:stop, None] ** 2 + norms[None, item_start:item_start + len(items)] ** 2 - 2 * dots
+            score = _distance_to_score(squared)
+        index = numpy.broadcast_to(numpy.arange(item_start, item_start + len(items)), score.shape)
+        # Exclude the query item itself.
+        self_column = rows + start - item_start
+        inside = (self_column >= 0) & (self_column < len(items))
+        score[rows[inside], self_column[inside]] = -numpy.inf
+        best_index, best_score = _merge_top_k(best_index, best_score, index, score, k)
+    return best_index, best_score
+
+def _sparse_top_k(graph, norms, query, k, metric, fallback):
+    # Accumulate the dot products of the query with the items sharing a
+    # dimension with it through the inverted index, so that the cost is
+    # proportional to the postings touched rather than to the item count.
+    indptr, indices, values, post_indptr, post_items, post_values = graph
+    dims = indices[indptr[query]:indptr[query + 1]]
+    weights = values[indptr[query]:indptr[query + 1]]
+    lengths = post_indptr[dims + 1] - post_indptr[dims]
+    total = int(lengths.sum())
+    offsets = numpy.cumsum(lengths) - lengths
+    positions = numpy.repeat(post_indptr[dims], lengths) + numpy.arange(total) - numpy.repeat(offsets, lengths)
+    items, inverse = numpy.unique(post_items[positions], return_inverse=True)
+    dots = numpy.bincount(inverse, weights=post_values[positions] * numpy.repeat(weights, lengths),
+                          minlength=len(items))
+    if metric == 'euclidean':
+        # Items sharing no dimension are ranked by their norms only.
+        extra = numpy.setdiff1d(fallback, items, assume_unique=True)
+        items = numpy.concatenate((items, extra))
+        dots = numpy.concatenate((dots, numpy.zeros(len(extra))))
+        score = _distance_to_score(norms[query] ** 2 + norms[items] ** 2 - 2 * dots)
+    else:
+        denominator = norms[query] * norms[items]
+        score = numpy.divide(dots, denominator, out=numpy.zeros_like(dots), where=denominator > 0)
+    score[items == query] = -numpy.inf
+    return _merge_top_k(None, None, items[None, :], score[None, :], k)
+
+def compute_top_k_similarity(ids,
+                             vectors,
+                             k,
+                             id_type,
+                             metric='euclidean',
+                             key_column_name='key',
+                             value_column_name='value',
+                             block_size=256,
+                             item_block_size=None,
+                             max_block_memory=64 << 20,
+                             num_partitions=None):
+    """Compute the exact top ``k`` most similar items of every item.
+
+    ``vectors`` is either a dense ``(n, d)`` NumPy matrix or a CSR triple
+    ``(indptr, indices, values)`` of ``n`` sparse rows. The matrix is
+    broadcast, and each task scores a block of ``block_size`` queries
+    against all items with blocked matrix products. Unless specified,
+    ``item_block_size`` is derived from ``max_block_memory``, the bytes
+    of the temporary score arrays of a block, which take about 16 bytes
+    per query and item pair. The cosine metric scores by cosine
+    similarity; the euclidean metric by ``1 / (1 + distance)``. Return a DataFrame of ``key_column_name`` and
+    ``value_column_name``, the latter an array of ``(item_id, score)``.
+    """
+    if metric not in ('euclidean', 'cosine'):
+        raise ValueError(f"metric must be one of: 'euclidean', 'cosine'; {metric!r} is invalid")
+    if item_block_size is None:
+        item_block_size = max(k + 1, max_block_memory // (16 * block_size))
+    spark = SparkSession.builder.getOrCreate()
+    ids = numpy.asarray(ids)
+    n = len(ids)
+    if isinstance(vectors, tuple):
+        indptr, indices, values = (numpy.asarray(x) for x in vectors)
+        values = values.astype(numpy.float64)
+        dimension = int(indices.max()) + 1 if len(indices) else 0
+        rows = numpy.repeat(numpy.arange(n), numpy.diff(indptr))
+        order = numpy.argsort(indices, kind='stable')
+        post_indptr = numpy.zeros(dimension + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(indices, minlength=dimension), out=post_indptr[1:])
+        graph = (indptr, indices, values, post_indptr, rows[order], values[order])
+        norms = numpy.sqrt(numpy.bincount(rows, weights=values ** 2, minlength=n))
+        fallback = numpy.sort(numpy.argsort(norms, kind='stable')[:k + 1])
+        matrix = None
+    else:
+        matrix = numpy.ascontiguousarray(vectors, dtype=numpy.float32)
+        norms = numpy.linalg.norm(matrix, axis=1)
+        graph = fallback = None
+    broadcast = spark.sparkContext.broadcast((ids, matrix, graph, norms, fallback))
+
+    def top_k(iterator):
+        import pandas
+        ids, matrix, graph, norms, fallback = broadcast.value
+        for batch in iterator:
+            for start in batch['id']:
+                stop = min(start + block_size, n)
+                if matrix is not None:
+                    index, score = _dense_top_k(matrix, norms, start, stop, k, metric, item_block_size)
+                    results = zip(index, score)
+                else:
+                    results = (_sparse_top_k(graph, norms, q, k, metric, fallback) for q in range(start, stop))
+                    results = ((i[0], s[0]) for i, s in results)
+                keys, values = [], []
+                for query, (index, score) in zip(range(start, stop), results):
+                    valid = numpy.isfinite(score)
+                    if metric == 'cosine':
+                        valid &= score > 0
+                    keys.append(ids[query].item())
+                    values.append([{'item_id': ids[i].item(), 'score': float(s)}
+                                   for i, s in zip(index[valid], score[valid])])
+                yield pandas.DataFrame({key_column_name: keys, value_column_name: values})
+
+    schema = StructType([StructField(key_column_name, id_type),
+                         StructField(value_column_name, ArrayType(StructType([
+                             StructField('item_id', id_type),
+                             StructField('score', FloatType())])))])
+    if num_partitions is None:
+        num_partitions = spark.sparkContext.defaultParallelism
+    blocks = spark.range(0, n, block_size, numPartitions=num_partitions)
+    return blocks.mapInPandas(top_k, schema)
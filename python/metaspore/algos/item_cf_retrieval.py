@@ -19,6 +19,9 @@ import pyspark.sql.functions as F
 from pyspark.sql import Window
 from pyspark.sql.functions import col
 from pyspark.sql.types import LongType
+from pyspark.sql.types import DoubleType
+from pyspark.sql.types import StructType
+from pyspark.sql.types import StructField
 
 
 class ItemCFModel(pyspark.ml.base.Model):
@@ -76,6 +79,9 @@ class ItemCFEstimator(pyspark.ml.base.Estimator):
                 value_column_name='value',
                 item_score_delimiter=':',
                 item_score_pair_delimiter=';',
+                streaming=False,
+                max_user_history_length=None,
+                history_sample_seed=0,
                 debug=False):
         super().__init__()
         self.user_id_column_name = user_id_column_name
@@ -87,8 +93,14 @@ class ItemCFEstimator(pyspark.ml.base.Estimator):
         self.value_column_name = value_column_name
         self.item_score_delimiter = item_score_delimiter
         self.item_score_pair_delimiter = item_score_pair_delimiter
+        self.streaming = streaming
+        self.max_user_history_length = max_user_history_length
+        self.history_sample_seed = history_sample_seed
         self.debug = debug
 
+    # Number of item pairs buffered by a task before pre-aggregating them.
+    max_pending_pairs = 1 << 22
+
     def _filter_dataset(self, dataset):
         if self.behavior_column_name is None and self.behavior_filter_value is None:
             return dataset
@@ -145,6 +157,86 @@ class ItemCFEstimator(pyspark.ml.base.Estimator):
 
         return crossing_weight
 
+    ## generate the pairs of each user's items within partitions, weighted by w_u^2,
+    ## instead of self-joining the dataset; pairs are pre-aggregated by each task,
+    ## and histories longer than max_user_history_length, if set, are sampled, in
+    ## which case the results differ from those of the join
+    def _cf_compute_streaming_inner_product(self, dataset):
+        histories = dataset.filter(F.col('user_id').isNotNull() & F.col('item_id').isNotNull()) \
+                        .groupBy('user_id') \
+                        .agg(F.collect_set(F.col('item_id')).alias('items'),
+                             F.count(F.col('item_id')).cast(LongType()).alias('item_count'))
+        item_type = dataset.schema['item_id'].dataType
+        schema = StructType([StructField('item_id_i', item_type),
+                             StructField('item_id_j', item_type),
+                             StructField('weight', DoubleType())])
+        max_history_length = self.max_user_history_length
+        seed = self.history_sample_seed
+        max_pending_pairs = self.max_pending_pairs
+
+        def generate_pairs(iterator):
+            import numpy
+            import pandas
+            from pyspark import TaskContext
+            rng = numpy.random.default_rng((seed, TaskContext.get().partitionId()))
+            pending_i, pending_j, pending_w = [], [], []
+            pending_count = 0
+            def aggregate():
+                df = pandas.DataFrame({'item_id_i': numpy.concatenate(pending_i),
+                                       'item_id_j': numpy.concatenate(pending_j),
+                                       'weight': numpy.concatenate(pending_w)})
+                return df.groupby(['item_id_i', 'item_id_j'], sort=False, as_index=False)['weight'].sum()
+            for batch in iterator:
+                for items, item_count in zip(batch['items'], batch['item_count']):
+                    items = numpy.asarray(items)
+                    if max_history_length is not None and len(items) > max_history_length:
+                        items = rng.choice(items, max_history_length, replace=False)
+                    m = len(items)
+                    if m < 2:
+                        continue
+                    # Pairs are generated by blocks of rows of the m x m pair
+                    # matrix, skipping its diagonal, so that pending pairs stay
+                    # bounded by max_pending_pairs within a long history too.
+                    block_rows = max(1, max_pending_pairs // (m - 1))
+                    for start in range(0, m, block_rows):
+                        rows = numpy.arange(start, min(start + block_rows, m))
+                        i = numpy.repeat(rows, m - 1)
+                        j = numpy.tile(numpy.arange(m - 1), len(rows))
+                        j += j >= i
+                        pending_i.append(items[i])
+                        pending_j.append(items[j])
+                        pending_w.append(numpy.full(len(i), 1.0 / item_count))
+                        pending_count += len(i)
+                        if pending_count >= max_pending_pairs:
+                            yield aggregate()
+                            pending_i, pending_j, pending_w = [], [], []
+                            pending_count = 0
+            if pending_count > 0:
+                yield aggregate()
+
+        inner_product = histories.mapInPandas(generate_pairs, schema) \
+                        .groupby('item_id_i', 'item_id_j') \
+                        .agg(F.sum(F.col('weight')).alias('weight_sum'))
+
+        return inner_product
+
+    ## keep at most max_recommendation_count pairs per item_id_i, so that
+    ## the global window only ranks the pruned candidates
+    def _cf_prune_top_k(self, similarity):
+        k = self.max_recommendation_count
+
+        def prune(iterator):
+            import pandas
+            kept = None
+            for batch in iterator:
+                df = batch if kept is None else pandas.concat([kept, batch], ignore_index=True)
+                kept = df.sort_values('weight', ascending=False, kind='stable') \
+                         .groupby('item_id_i', sort=False).head(k)
+            if kept is not None:
+                yield kept
+
+        return similarity.repartition('item_id_i').mapInPandas(prune, similarity.schema)
+
     ## compute l2_norm = \sqrt{\sum_{u \in U_i} w_u^2}
     def _cf_compute_item_l2_norm(self, dataset, user_weight):
         item_l2_norm = dataset.alias('t1').join(user_weight.alias('t2'), on=(F.col('t1.user_id')==F.col('t2.user_id'))) \
@@ -162,10 +254,11 @@ class ItemCFEstimator(pyspark.ml.base.Estimator):
             print('Debug --- user bhv_count:')
             user_weight.show(10)
 
-        crossing_weight = self._cf_compute_crossing_weight(dataset, user_weight)
-        if self.debug:
-            print('Debug --- crossing weight matrix:')
-            crossing_weight.show(10)
+        if not self.streaming:
+            crossing_weight = self._cf_compute_crossing_weight(dataset, user_weight)
+            if self.debug:
+                print('Debug --- crossing weight matrix:')
+                crossing_weight.show(10)
 
         item_l2_norm = self._cf_compute_item_l2_norm(dataset, user_weight)
         if self.debug:
@@ -175,13 +268,18 @@ class ItemCFEstimator(pyspark.ml.base.Estimator):
         t2 = item_l2_norm.withColumnRenamed('weight', 'normal_weight_i')
         t3 = item_l2_norm.withColumnRenamed('weight', 'normal_weight_j')
         ## sparse inner product
-        inner_product = crossing_weight.groupby('item_id_i', 'item_id_j') \
+        if self.streaming:
+            inner_product = self._cf_compute_streaming_inner_product(dataset)
+        else:
+            inner_product = crossing_weight.groupby('item_id_i', 'item_id_j') \
                                 .agg(F.sum(F.col('weight') * F.col('weight')).alias('weight_sum'))
         ## penalized by the l2 norm
         cossine_similarity = inner_product.alias('t1')\
                                 .join(t2.alias('t2'), on=(F.col('t1.item_id_i')==F.col('t2.item_id'))) \
                                 .join(t3.alias('t3'), on=(F.col('t1.item_id_j')==F.col('t3.item_id'))) \
                                 .withColumn('weight', F.col('t1.weight_sum')/(F.col('t2.normal_weight_i') * F.col('t3.normal_weight_j')))
+        if self.streaming:
+            cossine_similarity = self._cf_prune_top_k(cossine_similarity.select('t1.item_id_i', 't1.item_id_j', 'weight'))
         ## collect the top k list
         result = cossine_similarity.withColumn("rn", F.row_number().over(Window.partitionBy('item_id_i').orderBy(F.desc('weight')))) \
                                 .filter(f"rn <= %d"%self.max_recommendation_count)  \
@@ -66,6 +66,9 @@ class ItemCFEstimatorConfig:
     value_column_name = field(default=None, validator=optional(instance_of(str)))
     item_score_delimiter = field(default=None, validator=optional(instance_of(str)))
     item_score_pair_delimiter = field(default=None, validator=optional(instance_of(str)))
+    streaming = field(default=None, validator=optional(instance_of(bool)))
+    max_user_history_length = field(default=None, validator=optional(recommendation_count_validator))
+    history_sample_seed = field(default=None, validator=optional(instance_of(int)))
     debug = field(default=None, validator=optional(instance_of(bool)))
 
 @attrs.frozen(kw_only=True)
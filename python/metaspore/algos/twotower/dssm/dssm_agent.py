@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
+from .sampled_softmax import hash_item_ids, match_id_pairs, StreamingFrequencyEstimator, NegativeQueue
 
 MIN_FLOAT = np.finfo(np.float32).min / 100.0
 MAX_FLOAT = np.finfo(np.float32).max / 100.0
@@ -35,8 +36,11 @@ class TwoTowerBatchNegativeSamplingModule(ms.TwoTowerRetrievalModule):
     def forward(self, x):
         user_emb = self._user_module(x)
         item_emb = self._item_module(x)
+        # kept for the cross-batch negatives of the agent
+        self.last_user_embedding = user_emb
+        self.last_item_embedding = item_emb
         scores = torch.matmul(user_emb, item_emb.T)
-        targets = torch.tensor(range(len(scores)), dtype=torch.long)
+        targets = torch.arange(len(scores), dtype=torch.long)
         predictions = F.softmax(scores, dim=1).clone().detach().diag()
         return predictions, scores, targets
 
@@ -45,23 +49,69 @@ class TwoTowerBatchNegativeSamplingAgent(ms.PyTorchAgent):
         super().__init__()
         self.cross_entropy_loss = nn.CrossEntropyLoss()
         self.cross_entropy_loss_no_reduction = nn.CrossEntropyLoss(reduction='none')
+        self.frequency_estimator = None
+        self.negative_queue = None
+
+    def _get_sampling_probability_source(self):
+        source = getattr(self, 'sampling_probability_source', 'column')
+        if source not in ('column', 'streaming'):
+            raise ValueError(f"sampling_probability_source must be one of: 'column', 'streaming'; {source!r} is invalid")
+        return source
+
+    def _get_frequency_estimator(self):
+        if self.frequency_estimator is None:
+            hash_size = getattr(self, 'frequency_estimator_hash_size', 1 << 20)
+            alpha = getattr(self, 'frequency_estimator_alpha', 0.01)
+            self.frequency_estimator = StreamingFrequencyEstimator(hash_size, alpha)
+        return self.frequency_estimator
+
+    def _get_negative_queue(self):
+        queue_size = getattr(self, 'negative_queue_size', None)
+        if queue_size is None:
+            return None
+        if self.negative_queue is None:
+            self.negative_queue = NegativeQueue(queue_size)
+        return self.negative_queue
+
+    def _get_log_sampling_probability(self, minibatch, candidate_ids):
+        if self._get_sampling_probability_source() == 'streaming':
+            sampling_probability = self._get_frequency_estimator().update(candidate_ids.numpy())
+        else:
+            sampling_probability = minibatch[self.input_item_probability_column_name].values
+        sampling_probability = torch.from_numpy(np.asarray(sampling_probability, dtype=np.float32))
+        return torch.log(torch.clamp(sampling_probability, 1e-6, 1.))
 
     def _default_train_minibatch(self, minibatch):
         # prepare the training process
         self.model.train()
         minibatch, labels = self.preprocess_minibatch(minibatch)
         predictions, scores, targets = self.model(minibatch)
+        queue = self._get_negative_queue()
+        candidate_ids = None
+        if (self.use_remove_accidental_hits or queue is not None or
+            self.use_sampling_probability_correction and self._get_sampling_probability_source() == 'streaming'):
+            candidate_ids = torch.from_numpy(hash_item_ids(minibatch[self.input_item_id_column_name].values))
+        log_probability = None
+        if self.use_sampling_probability_correction:
+            log_probability = self._get_log_sampling_probability(minibatch, candidate_ids)
+        # mix the in-batch negatives with the cached ones of previous batches
+        all_candidate_ids = candidate_ids
+        all_log_probability = log_probability
+        if queue is not None and queue.embeddings is not None:
+            user_emb = self.model.module.last_user_embedding
+            scores = torch.cat((scores, torch.matmul(user_emb, queue.embeddings.T)), dim=1)
+            all_candidate_ids = torch.cat((candidate_ids, queue.item_ids))
+            if log_probability is not None:
+                all_log_probability = torch.cat((log_probability, queue.log_probabilities))
         # temperature control
         if self.tau is not None and self.tau > 1e-6:
             scores = scores/self.tau
         # remove accidental hits
         if self.use_remove_accidental_hits:
-            candidate_ids = minibatch[self.input_item_id_column_name].values.astype(np.long)
-            scores = self.remove_accidental_hits(targets, candidate_ids, scores)
+            scores = self.remove_accidental_hits(targets, candidate_ids, scores, all_candidate_ids)
         # sampling probability correction
         if self.use_sampling_probability_correction:
-            sampling_probability = minibatch[self.input_item_probability_column_name]
-            scores = self.sampling_probability_correction(sampling_probability, scores)
+            scores = scores - all_log_probability
         # sample weight
         if self.use_sample_weight:
             sample_weight = minibatch[self.input_sample_weight_column_name]
@@ -70,28 +120,31 @@ class TwoTowerBatchNegativeSamplingAgent(ms.PyTorchAgent):
             loss = self.cross_entropy_loss(scores, targets)
         # backward the loss
         self.trainer.train(loss)
+        if queue is not None:
+            queue.push(self.model.module.last_item_embedding, candidate_ids, log_probability)
         # update trainning progress
         labels = torch.from_numpy(labels).reshape(-1, 1)
         self.update_progress(batch_size=len(labels), batch_loss=loss)
 
-    def remove_accidental_hits(self, targets, candidate_ids, logits):
-        labels = torch.zeros(logits.shape)
-        row_indices = torch.tensor(range(len(logits)), dtype=torch.long)
-        labels[row_indices, targets] = 1
-
-        candidate_ids = torch.unsqueeze(torch.tensor(candidate_ids), 1)
-        positive_indices = targets.clone().detach()
-        positive_candidate_ids = candidate_ids[positive_indices]
-
-        duplicate = torch.eq(positive_candidate_ids, candidate_ids.T).type(labels.type())
-        duplicate = duplicate - labels
-
-        return logits +  duplicate * MIN_FLOAT
+    def remove_accidental_hits(self, targets, candidate_ids, logits, all_candidate_ids=None):
+        # Mask the candidates having the same item id as the positive of the
+        # row, except the positive itself; the matches are found by sorting
+        # the ids, so no dense B x B comparison is materialized.
+        if not isinstance(candidate_ids, torch.Tensor):
+            candidate_ids = torch.from_numpy(hash_item_ids(candidate_ids))
+        if all_candidate_ids is None:
+            all_candidate_ids = candidate_ids
+        rows, cols = match_id_pairs(candidate_ids[targets], all_candidate_ids)
+        hits = cols != targets[rows]
+        rows, cols = rows[hits], cols[hits]
+        mask = torch.full((len(rows),), MIN_FLOAT, dtype=logits.dtype)
+        return logits.index_put((rows, cols), mask, accumulate=True)
 
     def sampling_probability_correction(self, sampling_probability, scores):
-        return scores - torch.log(torch.clamp(torch.tensor(sampling_probability), 1e-6, 1.))
+        sampling_probability = torch.from_numpy(np.asarray(sampling_probability, dtype=np.float32))
+        return scores - torch.log(torch.clamp(sampling_probability, 1e-6, 1.))
 
     def cross_entropy_loss_with_sample_weight(self, scores, targets, sample_weight):
         loss = self.cross_entropy_loss_no_reduction(scores, targets)
-        loss = loss * torch.tensor(sample_weight)
+        loss = loss * torch.from_numpy(np.asarray(sample_weight, dtype=np.float32))
         return loss.mean()
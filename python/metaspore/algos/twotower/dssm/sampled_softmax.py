@@ -0,0 +1,98 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np
+import pandas as pd
+import torch
+
+def hash_item_ids(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64)
+    return pd.util.hash_array(values.astype(object)).view(np.int64)
+
+def match_id_pairs(query_ids, key_ids):
+    # Find all the pairs (i, j) with query_ids[i] == key_ids[j] by binary
+    # search in the sorted keys, so that the cost is proportional to the
+    # number of matches instead of the size of the dense comparison matrix.
+    order = torch.argsort(key_ids)
+    sorted_keys = key_ids[order]
+    lower = torch.searchsorted(sorted_keys, query_ids)
+    upper = torch.searchsorted(sorted_keys, query_ids, right=True)
+    counts = upper - lower
+    rows = torch.repeat_interleave(torch.arange(len(query_ids)), counts)
+    starts = torch.repeat_interleave(lower, counts)
+    offsets = torch.arange(len(rows)) - torch.repeat_interleave(torch.cumsum(counts, 0) - counts, counts)
+    cols = order[starts + offsets]
+    return rows, cols
+
+class StreamingFrequencyEstimator(object):
+    """Estimate the sampling probabilities of items from the training stream.
+
+    As in "Sampling-Bias-Corrected Neural Modeling for Large Corpus Item
+    Recommendations" (Yi et al., 2019), each hash bucket tracks the moving
+    average of the number of steps between two occurrences of its items;
+    the inverse of the average estimates the probability that an item
+    occurs in a batch.
+    """
+
+    def __init__(self, hash_size=1 << 20, alpha=0.01):
+        if not isinstance(hash_size, int) or hash_size <= 0:
+            raise TypeError(f"hash_size must be positive integer; {hash_size!r} is invalid")
+        if not isinstance(alpha, float) or not 0.0 < alpha <= 1.0:
+            raise TypeError(f"alpha must be float in (0, 1]; {alpha!r} is invalid")
+        self._hash_size = hash_size
+        self._alpha = alpha
+        self._step = 0
+        self._last_steps = np.zeros(hash_size, dtype=np.int64)
+        self._intervals = np.ones(hash_size, dtype=np.float64)
+
+    def update(self, item_ids):
+        """Update the estimates with a batch of hashed item ids and return their probabilities."""
+        self._step += 1
+        buckets = np.mod(item_ids, self._hash_size)
+        unique_buckets = np.unique(buckets)
+        intervals = self._step - self._last_steps[unique_buckets]
+        self._intervals[unique_buckets] *= 1.0 - self._alpha
+        self._intervals[unique_buckets] += self._alpha * intervals
+        self._last_steps[unique_buckets] = self._step
+        return np.minimum(1.0 / self._intervals[buckets], 1.0)
+
+class NegativeQueue(object):
+    """Item embeddings of previous batches, used as extra negatives.
+
+    The embeddings are detached, so the negatives do not receive gradients;
+    the log sampling probabilities are kept with them for the correction.
+    """
+
+    def __init__(self, capacity):
+        if not isinstance(capacity, int) or capacity <= 0:
+            raise TypeError(f"capacity must be positive integer; {capacity!r} is invalid")
+        self._capacity = capacity
+        self.embeddings = None
+        self.item_ids = None
+        self.log_probabilities = None
+
+    def push(self, embeddings, item_ids, log_probabilities):
+        embeddings = embeddings.detach()
+        if self.embeddings is not None:
+            embeddings = torch.cat((self.embeddings, embeddings))
+            item_ids = torch.cat((self.item_ids, item_ids))
+            if log_probabilities is not None and self.log_probabilities is not None:
+                log_probabilities = torch.cat((self.log_probabilities, log_probabilities))
+        self.embeddings = embeddings[-self._capacity:]
+        self.item_ids = item_ids[-self._capacity:]
+        self.log_probabilities = None if log_probabilities is None else log_probabilities[-self._capacity:]
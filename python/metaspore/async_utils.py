@@ -0,0 +1,42 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+import threading
+
+_thread_local = threading.local()
+
+def _get_thread_event_loop():
+    loop = getattr(_thread_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _thread_local.loop = loop
+    return loop
+
+def run_sync(coro):
+    """Run ``coro`` to completion and return its result.
+
+    Unlike ``asyncio.run``, the event loop is created once per thread and
+    reused by the following calls, so that the PS operations of every
+    training step do not pay for creating and closing an event loop.
+    The prefetch thread gets a loop of its own.
+    """
+    if asyncio._get_running_loop() is not None:
+        # Called from a running loop, e.g. on the coordinator where the
+        # launcher applies ``nest_asyncio``; let it handle the nesting.
+        return asyncio.run(coro)
+    loop = _get_thread_event_loop()
+    return loop.run_until_complete(coro)
@@ -38,11 +38,21 @@ class Cast(torch.nn.Module):
     def _clean(self):
         self._output = torch.tensor(0.0)
 
+    @torch.jit.unused
+    def _get_column_values(self, minibatch, name):
+        import pyarrow as pa
+        if isinstance(minibatch, pa.RecordBatch):
+            index = minibatch.schema.get_field_index(name)
+            if index == -1:
+                raise KeyError(f"column {name!r} not found in minibatch")
+            return minibatch.column(index).to_numpy(zero_copy_only=False)
+        return minibatch[name].values
+
     @torch.jit.unused
     def _do_cast(self, minibatch):
         columns = []
         for name in self._selected_columns:
-            column = minibatch[name].values.astype(self._dtype_name)
+            column = self._get_column_values(minibatch, name).astype(self._dtype_name)
             columns.append(column)
         output = numpy.stack(columns, axis=-1)
         output = torch.from_numpy(output)
@@ -15,6 +15,7 @@
 #
 
 import asyncio
+import numpy
 import torch
 from ._metaspore import DenseTensor
 from ._metaspore import SparseTensor
@@ -26,6 +27,9 @@ class DistributedTensor(object):
         self.__name = name if name_prefix is None else name_prefix + name
         self.__item = item
         self.__handle = None
+        self._step_profiler = None
+        self._compressor = None
+        self._compression_state = None
 
     @property
     def name(self):
@@ -70,6 +74,8 @@ class DistributedTensor(object):
                 self.item.grad.zero_()
 
     def _init_tensor(self, trainer):
+        if not self.is_dense_buffer:
+            self._compressor = trainer._get_compressor(self)
         if self.is_dense:
             return self._init_dense_tensor(trainer)
         else:
@@ -118,6 +124,7 @@ class DistributedTensor(object):
         x.slice_state_shape = trainer._get_sparse_slice_state_shape(self)
         x.initializer = trainer._get_sparse_initializer(self)
         x.updater = trainer._get_sparse_updater(self)
+        x.storage_type = trainer._get_sparse_storage_type(self)
         x.partition_count = trainer.agent.server_count
         x.agent = trainer.agent._cxx_agent
         loop = asyncio.get_running_loop()
@@ -138,7 +145,10 @@ class DistributedTensor(object):
     def _pull_dense_tensor(self):
         loop = asyncio.get_running_loop()
         future = loop.create_future()
+        profiler = self._step_profiler
         def pull_dense_tensor_done(data):
+            if profiler is not None:
+                profiler.add_pulled_bytes(data.nbytes)
             data = torch.from_numpy(data)
             data = data.view(self.item.shape)
             self.item.data.copy_(data)
@@ -151,18 +161,47 @@ class DistributedTensor(object):
         keys = op.keys
         if keys is None:
             return
+        data = await self._pull_sparse_tensor_data(keys)
+        op._update_data(data)
+
+    async def _pull_sparse_tensor_data(self, keys):
+        op = self.item
+        cache = op.cache
+        read_only = not op.training or not op.requires_grad
+        # NaN filled rows of missing keys must not be cached.
+        if cache is None or read_only and op.use_nan_fill:
+            return await self._pull_sparse_tensor_rows(keys)
+        # Only keys missing from the worker side cache are pulled.
+        hit, rows = cache.lookup(keys)
+        if rows is None:
+            data = await self._pull_sparse_tensor_rows(keys)
+            cache.update(keys, data)
+            return data
+        miss = ~hit
+        miss_keys = keys[miss]
+        embedding_size = op._checked_get_embedding_size()
+        data = numpy.empty((len(keys), embedding_size), dtype=rows.dtype)
+        data[hit] = rows
+        if len(miss_keys) > 0:
+            miss_data = await self._pull_sparse_tensor_rows(miss_keys)
+            cache.update(miss_keys, miss_data)
+            data[miss] = miss_data
+        return data
+
+    def _pull_sparse_tensor_rows(self, keys):
+        op = self.item
         read_only = not op.training or not op.requires_grad
         nan_fill = read_only and op.use_nan_fill
-        def pull_sparse_tensor():
-            loop = asyncio.get_running_loop()
-            future = loop.create_future()
-            def pull_sparse_tensor_done(data):
-                op._check_dtype_and_shape(keys, data)
-                op._update_data(data)
-                loop.call_soon_threadsafe(future.set_result, None)
-            self._handle.pull(keys, pull_sparse_tensor_done, read_only, nan_fill)
-            return future
-        await pull_sparse_tensor()
+        profiler = self._step_profiler
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        def pull_sparse_tensor_done(data):
+            op._check_dtype_and_shape(keys, data)
+            if profiler is not None:
+                profiler.add_pulled_bytes(keys.nbytes + data.nbytes)
+            loop.call_soon_threadsafe(future.set_result, data)
+        self._handle.pull(keys, pull_sparse_tensor_done, read_only, nan_fill)
+        return future
 
     def _push_tensor(self, *, is_value=False, skip_no_grad=True):
         if self.is_dense:
@@ -180,14 +219,23 @@ class DistributedTensor(object):
         # For dense buffers, use .data to fake gradients.
         # But we still need to pass is_value=False, otherwise updaters on server won't be called.
         data = data.data.numpy() if self.is_dense_buffer or is_value else data.grad.data.numpy()
-        def push_dense_tensor():
-            loop = asyncio.get_running_loop()
-            future = loop.create_future()
-            def push_dense_tensor_done():
-                loop.call_soon_threadsafe(future.set_result, None)
-            self._handle.push(data, push_dense_tensor_done, is_value, False)
-            return future
-        await push_dense_tensor()
+        float16 = False
+        if self._compressor is not None and not is_value:
+            data = self._compressor.compress_dense(self, data)
+            if data is None:
+                return
+            float16 = self._compressor.float16
+        await self._push_dense_data(data, is_value=is_value, float16=float16)
+
+    def _push_dense_data(self, data, *, is_value, float16):
+        if self._step_profiler is not None:
+            self._step_profiler.add_pushed_bytes(data.nbytes)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        def push_dense_tensor_done():
+            loop.call_soon_threadsafe(future.set_result, None)
+        self._handle.push(data, push_dense_tensor_done, is_value, False, float16)
+        return future
 
     async def _push_sparse_tensor(self, *, is_value=False, skip_no_grad=True):
         op = self.item
@@ -200,25 +248,66 @@ class DistributedTensor(object):
             raise RuntimeError(f"the gradient of operator {op!r} is not available")
         data = data.data.numpy() if is_value else data.grad.data.numpy()
         op._check_dtype_and_shape(keys, data)
-        def push_sparse_tensor():
-            loop = asyncio.get_running_loop()
-            future = loop.create_future()
-            def push_sparse_tensor_done():
-                loop.call_soon_threadsafe(future.set_result, None)
-            self._handle.push(keys, data, push_sparse_tensor_done, is_value)
-            return future
-        await push_sparse_tensor()
-
-    def _load_tensor(self, dir_path, *, keep_meta=False):
+        float16 = False
+        if self._compressor is not None and not is_value:
+            result = self._compressor.compress_sparse(self, keys, data)
+            if result is None:
+                return
+            keys, data = result
+            float16 = self._compressor.float16
+        await self._push_sparse_data(keys, data, is_value=is_value, float16=float16)
+
+    def _push_sparse_data(self, keys, data, *, is_value, float16):
+        if self._step_profiler is not None:
+            self._step_profiler.add_pushed_bytes(keys.nbytes + data.nbytes)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        def push_sparse_tensor_done():
+            loop.call_soon_threadsafe(future.set_result, None)
+        self._handle.push(keys, data, push_sparse_tensor_done, is_value, float16)
+        return future
+
+    async def _flush_tensor(self):
+        # Push the gradients the compressor still holds back, so that
+        # the values on the servers include every update.
+        if self._compressor is None:
+            return
+        float16 = self._compressor.float16
+        if self.is_dense:
+            data = self._compressor.flush_dense(self)
+            if data is not None:
+                await self._push_dense_data(data, is_value=False, float16=float16)
+        else:
+            result = self._compressor.flush_sparse(self)
+            if result is not None:
+                keys, data = result
+                await self._push_sparse_data(keys, data, is_value=False, float16=float16)
+
+    def _invalidate_cache(self):
+        if self.is_sparse and self.item.cache is not None:
+            self.item.cache.clear()
+
+    def _load_tensor(self, dir_path, *, keep_meta=False, delta_dir_paths=(), track_changes=False):
+        self._invalidate_cache()
+        # Gradients accumulated against the replaced values are dropped.
+        self._compression_state = None
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         def load_tensor_done():
             loop.call_soon_threadsafe(future.set_result, None)
-        dir_path = use_s3(dir_path)
-        self._handle.load(dir_path, load_tensor_done, keep_meta)
+        if self.is_sparse:
+            dir_path = use_s3(dir_path)
+            delta_dir_paths = [use_s3(path) for path in delta_dir_paths]
+            self._handle.load(dir_path, load_tensor_done, keep_meta, delta_dir_paths, track_changes)
+        else:
+            # Dense tensors are saved in full with every delta.
+            if delta_dir_paths:
+                dir_path = delta_dir_paths[-1]
+            dir_path = use_s3(dir_path)
+            self._handle.load(dir_path, load_tensor_done, keep_meta)
         return future
 
-    def _save_tensor(self, dir_path):
+    def _save_tensor(self, dir_path, *, delta=False, track_changes=False):
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         def save_tensor_done():
@@ -226,12 +315,13 @@ class DistributedTensor(object):
         dir_path = use_s3(dir_path)
         if self.is_sparse:
             text_mode = self.item.save_as_text
-            self._handle.save(dir_path, save_tensor_done, text_mode)
+            self._handle.save(dir_path, save_tensor_done, text_mode, delta, track_changes)
         else:
             self._handle.save(dir_path, save_tensor_done)
         return future
 
     def _sparse_tensor_clear(self):
+        self._invalidate_cache()
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         def sparse_tensor_clear_done():
@@ -251,6 +341,7 @@ class DistributedTensor(object):
     def _sparse_tensor_import_from(self, meta_file_path, *,
                                    data_only=False, skip_existing=False,
                                    transform_key=False, feature_name=''):
+        self._invalidate_cache()
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         def sparse_tensor_import_from_done():
@@ -262,6 +353,7 @@ class DistributedTensor(object):
         return future
 
     def _sparse_tensor_prune_small(self, epsilon):
+        self._invalidate_cache()
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         def sparse_tensor_prune_small_done():
@@ -270,6 +362,7 @@ class DistributedTensor(object):
         return future
 
     def _sparse_tensor_prune_old(self, max_age):
+        self._invalidate_cache()
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         def sparse_tensor_prune_old_done():
@@ -14,15 +14,24 @@
 # limitations under the License.
 #
 
-import asyncio
+import json
+from . import _metaspore
 from .updater import TensorUpdater
 from .updater import SGDTensorUpdater
 from .initializer import TensorInitializer
 from .initializer import DefaultTensorInitializer
+from .gradient_compressor import GradientCompressor
 from .model import Model
+from .step_profiler import profile_phase
+from .async_utils import run_sync
+from .file_utils import file_exists
+from .file_utils import delete_dir
+from .file_utils import delete_file
+from .url_utils import use_s3
 
 class DistributedTrainer(object):
-    def __init__(self, model, updater=None, initializer=None):
+    def __init__(self, model, updater=None, initializer=None, compressor=None,
+                 checkpoint_mode='full', checkpoint_compaction_interval=7):
         if not isinstance(model, Model):
             raise TypeError(f"model must be Model; {model!r} is invalid")
         if updater is None:
@@ -33,10 +42,22 @@ class DistributedTrainer(object):
             initializer = DefaultTensorInitializer()
         if not isinstance(initializer, TensorInitializer):
             raise TypeError(f"initializer must be TensorInitializer; {initializer!r} is invalid")
+        if compressor is not None:
+            if not isinstance(compressor, GradientCompressor):
+                raise TypeError(f"compressor must be GradientCompressor; {compressor!r} is invalid")
+        if checkpoint_mode not in ('full', 'delta'):
+            raise ValueError(f"checkpoint_mode must be one of: 'full', 'delta'; {checkpoint_mode!r} is invalid")
+        if not isinstance(checkpoint_compaction_interval, int) or checkpoint_compaction_interval <= 0:
+            raise TypeError(f"checkpoint_compaction_interval must be positive integer; "
+                            f"{checkpoint_compaction_interval!r} is invalid")
         self._model = model
         self._updater = updater
         self._initializer = initializer
+        self._compressor = compressor
         self._skip_no_grad = True
+        self._checkpoint_mode = checkpoint_mode
+        self._checkpoint_compaction_interval = checkpoint_compaction_interval
+        self._checkpoint_chain = None
 
     @property
     def model(self):
@@ -54,6 +75,18 @@ class DistributedTrainer(object):
     def initializer(self):
         return self._initializer
 
+    @property
+    def compressor(self):
+        return self._compressor
+
+    @property
+    def checkpoint_mode(self):
+        return self._checkpoint_mode
+
+    @property
+    def checkpoint_compaction_interval(self):
+        return self._checkpoint_compaction_interval
+
     @property
     def skip_no_grad(self):
         return self._skip_no_grad
@@ -115,6 +148,22 @@ class DistributedTrainer(object):
         result = updater.get_dense_state_shape(tensor)
         return result or ()
 
+    def _get_compressor(self, tensor):
+        # Like updaters, compressors can be specified per tensor by the
+        # ``compressor`` attribute of parameters and embedding operators.
+        compressor = getattr(tensor.item, 'compressor', None)
+        if compressor is None:
+            compressor = self.compressor
+        if compressor is not None and not isinstance(compressor, GradientCompressor):
+            message = "compressor must be an instance of GradientCompressor; "
+            message += f"{compressor!r} is invalid"
+            raise TypeError(message)
+        return compressor
+
+    def _get_sparse_storage_type(self, tensor):
+        storage_type = getattr(tensor.item, 'storage_type', None)
+        return storage_type or ''
+
     def _get_sparse_slice_data_shape(self, tensor):
         updater = self._get_sparse_updater(tensor)
         result = updater.get_sparse_slice_data_shape(tensor)
@@ -129,47 +178,154 @@ class DistributedTrainer(object):
         self.agent.barrier()
         self.model._configure_batch_norms()
         self.model._collect_tensors()
-        asyncio.run(self.model._init_tensors(self))
+        run_sync(self.model._init_tensors(self))
         # We now always use local initialize mode since this is more natural.
         # Dense tensors will first be initialized by dense initializers,
         # then their values will be overridden by those from the PyTorch model.
         # Sparse tensors are still initialized by sparse initializers block by block.
         self.agent.barrier()
         if self.agent.rank == 0:
-            asyncio.run(self.model._push_tensors(is_value=True))
+            run_sync(self.model._push_tensors(is_value=True))
         self.agent.barrier()
-        asyncio.run(self.model._pull_tensors(force_mode=True))
+        run_sync(self.model._pull_tensors(force_mode=True))
         self.agent.barrier()
 
+    # In delta mode, a checkpoint is a chain of a full base snapshot and
+    # the deltas saved since, each holding the sparse keys changed and
+    # removed after the previous one. The chain is recorded in a manifest
+    # in the checkpoint directory; dense tensors are saved in full with
+    # every delta. After ``checkpoint_compaction_interval`` deltas, a full
+    # base is saved again, which folds the chain. Bases and deltas are
+    # saved to ``base_%05d/`` and ``delta_%05d/`` subdirectories numbered
+    # by a sequence recorded in the manifest, and those of a folded chain
+    # are deleted once the manifest is switched. Chains with deltas can
+    # only be loaded with the server count they were saved with.
+    checkpoint_manifest_file_name = 'checkpoint_manifest.json'
+
+    def _join_path(self, dir_path, name):
+        if not dir_path.endswith('/'):
+            dir_path += '/'
+        return dir_path + name
+
+    def _read_checkpoint_manifest(self, dir_path):
+        path = self._join_path(dir_path, self.checkpoint_manifest_file_name)
+        if not file_exists(path):
+            return None
+        data = _metaspore.stream_read_all(use_s3(path))
+        return json.loads(data)
+
+    def _write_checkpoint_manifest(self, dir_path, manifest):
+        path = self._join_path(dir_path, self.checkpoint_manifest_file_name)
+        data = json.dumps(manifest, separators=(',', ': '), indent=4).encode('utf-8')
+        _metaspore.stream_write_all(use_s3(path), data)
+
     def load(self, dir_path, *, keep_meta=False):
+        manifest = self._read_checkpoint_manifest(dir_path)
+        self._checkpoint_chain = None
+        delta_dir_paths = ()
+        track_changes = False
+        if manifest is not None:
+            if manifest['deltas'] and manifest['server_count'] != self.agent.server_count:
+                # Deltas hold the keys of each partition, they can not be
+                # applied once the keys are hashed to other partitions.
+                message = f"checkpoint {dir_path!r} has {len(manifest['deltas'])} delta(s) "
+                message += f"saved with {manifest['server_count']} servers, "
+                message += f"can not load it with {self.agent.server_count} servers; "
+                message += "load it with the same server count and save it in full mode "
+                message += "to repartition it"
+                raise RuntimeError(message)
+            dir_path = manifest['base']
+            delta_dir_paths = manifest['deltas']
+            # A base without deltas can be repartitioned, but the chain is
+            # continued only when the partitions are unchanged; otherwise
+            # the next checkpoint is a full base.
+            if (self._checkpoint_mode == 'delta' and
+                    manifest['server_count'] == self.agent.server_count):
+                self._checkpoint_chain = manifest
+                track_changes = True
         # When spare tensors are repartitioned, we need to make
         # sure sparse tensors are cleared, as ``import_from``
         # won't clear or override existing keys. Make sure this
         # in C++ is a bit complicated, so we do it here.
         self.agent.barrier()
         if self.agent.rank == 0:
-            asyncio.run(self.model._clear_tensors())
+            run_sync(self.model._clear_tensors())
         # When spare tensors are repartitioned, they must be loaded
         # and pushed to servers later by all workers, so we do not
         # use ``if self.agent.rank == 0:`` here, instead this will
         # be checked in C++ code when necessary.
         self.agent.barrier()
-        asyncio.run(self.model._load_tensors(dir_path, keep_meta=keep_meta))
+        run_sync(self.model._load_tensors(dir_path, keep_meta=keep_meta,
+                                          delta_dir_paths=delta_dir_paths,
+                                          track_changes=track_changes))
         self.agent.barrier()
-        asyncio.run(self.model._pull_tensors(force_mode=True))
+        run_sync(self.model._pull_tensors(force_mode=True))
         self.agent.barrier()
 
+    def flush(self):
+        # Gradients held back by compressors are pushed, so that the saved
+        # or exported values include every update; call it on all workers.
+        run_sync(self.model._flush_tensors())
+
+    def _get_chain_dir_paths(self, manifest):
+        if manifest is None:
+            return []
+        return [self._join_path(path, '') for path in [manifest['base']] + manifest['deltas']]
+
     def save(self, dir_path):
+        self.flush()
+        track_changes = self._checkpoint_mode == 'delta'
+        chain = self._checkpoint_chain
+        delta = (track_changes and chain is not None and
+                 len(chain['deltas']) < self._checkpoint_compaction_interval)
+        # The chain already saved in ``dir_path``, which may be the one
+        # being continued when the model is saved to where it was loaded from.
+        previous = self._read_checkpoint_manifest(dir_path)
+        if not track_changes:
+            data_dir_path = dir_path
+            manifest = None
+        else:
+            # Every checkpoint of a chain is saved to a fresh directory and
+            # the manifest is switched last, so that the previous chain can
+            # be loaded until the new checkpoint is complete.
+            sequence = 1
+            for other in (chain, previous):
+                if other is not None:
+                    sequence = max(sequence, other.get('sequence', 0) + 1)
+            if delta:
+                data_dir_path = self._join_path(dir_path, 'delta_%05d/' % sequence)
+                manifest = dict(chain, deltas=chain['deltas'] + [data_dir_path], sequence=sequence)
+            else:
+                data_dir_path = self._join_path(dir_path, 'base_%05d/' % sequence)
+                manifest = {'base': data_dir_path, 'deltas': [], 'sequence': sequence,
+                            'server_count': self.agent.server_count}
         self.agent.barrier()
         if self.agent.rank == 0:
-            asyncio.run(self.model._save_tensors(dir_path))
+            run_sync(self.model._save_tensors(data_dir_path, delta=delta, track_changes=track_changes))
+            if manifest is not None:
+                self._write_checkpoint_manifest(dir_path, manifest)
+            elif previous is not None:
+                # A stale manifest would make the full checkpoint be loaded as a chain.
+                delete_file(self._join_path(dir_path, self.checkpoint_manifest_file_name))
+            # Directories of the previous chain not referenced any more are
+            # deleted, those outside ``dir_path`` are left alone.
+            prefix = self._join_path(dir_path, '')
+            kept = self._get_chain_dir_paths(manifest)
+            for path in self._get_chain_dir_paths(previous):
+                if path.startswith(prefix) and path != prefix and path not in kept:
+                    delete_dir(path)
         self.agent.barrier()
+        if track_changes:
+            self._checkpoint_chain = manifest
 
     def train(self, loss):
         if not self.model.training:
             message = "model is in evaluation mode, can not train it; "
             message += "call the 'train' method to set it in training mode explicitly"
             raise RuntimeError(message)
+        profiler = self.model.step_profiler
         self.model._zero_grad()
-        loss.backward()
-        asyncio.run(self.model._push_tensors(skip_no_grad=self.skip_no_grad))
+        with profile_phase(profiler, 'backward'):
+            loss.backward()
+        with profile_phase(profiler, 'push'):
+            run_sync(self.model._push_tensors(skip_no_grad=self.skip_no_grad))
@@ -14,7 +14,6 @@
 # limitations under the License.
 #
 
-import asyncio
 import os
 import numpy
 import torch
@@ -28,6 +27,10 @@ from .file_utils import file_exists
 from .name_utils import is_valid_qualified_name
 from .updater import TensorUpdater
 from .initializer import TensorInitializer
+from .embedding_cache import EmbeddingCache
+from .gradient_compressor import GradientCompressor
+from .async_utils import run_sync
+from .step_profiler import profile_phase
 
 #declare a class which we generate a onnx file to represent the sumconcat logic after Lookup
 class EmbeddingBagModule(torch.nn.Module):
@@ -87,7 +90,10 @@ class EmbeddingOperator(torch.nn.Module):
                  output_batchsize1_if_only_level0=False,
                  use_nan_fill=False,
                  save_as_text=False,
-                 embedding_bag_mode='sum'
+                 embedding_bag_mode='sum',
+                 cache=None,
+                 storage_type=None,
+                 compressor=None
                 ):
         if embedding_size is not None:
             if not isinstance(embedding_size, int) or embedding_size <= 0:
@@ -104,6 +110,13 @@ class EmbeddingOperator(torch.nn.Module):
         if initializer is not None:
             if not isinstance(initializer, TensorInitializer):
                 raise TypeError(f"initializer must be TensorInitializer; {initializer!r} is invalid")
+        if cache is not None:
+            if not isinstance(cache, EmbeddingCache):
+                raise TypeError(f"cache must be EmbeddingCache; {cache!r} is invalid")
+        if compressor is not None:
+            if not isinstance(compressor, GradientCompressor):
+                raise TypeError(f"compressor must be GradientCompressor; {compressor!r} is invalid")
+        self._check_storage_type(storage_type)
         self._check_embedding_bag_mode(embedding_bag_mode)
         super().__init__()
         self._embedding_size = embedding_size
@@ -123,7 +136,11 @@ class EmbeddingOperator(torch.nn.Module):
         self._use_nan_fill = use_nan_fill
         self._save_as_text = save_as_text
         self._embedding_bag_mode = embedding_bag_mode
+        self._cache = cache
+        self._storage_type = storage_type
+        self._compressor = compressor
         self._distributed_tensor = None
+        self._step_profiler = None
         self._feature_extractor = None
         if self._combine_schema_source is not None:
             self._load_combine_schema()
@@ -174,6 +191,12 @@ class EmbeddingOperator(torch.nn.Module):
             args.append(f"use_nan_fill={self._use_nan_fill!r}")
         if self._save_as_text:
             args.append(f"save_as_text={self._save_as_text!r}")
+        if self._cache is not None:
+            args.append(f"cache={self._cache!r}")
+        if self._storage_type is not None:
+            args.append(f"storage_type={self._storage_type!r}")
+        if self._compressor is not None:
+            args.append(f"compressor={self._compressor!r}")
         return f"{self.__class__.__name__}({', '.join(args)})"
 
     @property
@@ -364,6 +387,60 @@ class EmbeddingOperator(torch.nn.Module):
     def embedding_bag_mode(self, value):
         self._embedding_bag_mode = value
 
+    @property
+    @torch.jit.unused
+    def cache(self):
+        return self._cache
+
+    @cache.setter
+    @torch.jit.unused
+    def cache(self, value):
+        if value is not None:
+            if not isinstance(value, EmbeddingCache):
+                raise TypeError(f"cache must be EmbeddingCache; {value!r} is invalid")
+        self._cache = value
+
+    @property
+    @torch.jit.unused
+    def compressor(self):
+        return self._compressor
+
+    @compressor.setter
+    @torch.jit.unused
+    def compressor(self, value):
+        if value is not None:
+            if not isinstance(value, GradientCompressor):
+                raise TypeError(f"compressor must be GradientCompressor; {value!r} is invalid")
+        self._compressor = value
+
+    @torch.jit.unused
+    def _check_storage_type(self, value):
+        if value not in (None, 'float16', 'bfloat16', 'int8'):
+            raise ValueError(f"storage_type must be one of: None, 'float16', 'bfloat16', 'int8'; {value!r} is invalid")
+
+    @property
+    @torch.jit.unused
+    def storage_type(self):
+        # Precision the parameter servers keep the embedding rows in; updates
+        # are still computed in ``dtype`` and pulled rows are dequantized.
+        return self._storage_type
+
+    @storage_type.setter
+    @torch.jit.unused
+    def storage_type(self, value):
+        if self._distributed_tensor is not None:
+            raise RuntimeError(f"can not reset storage_type after {self!r} is initialized")
+        self._check_storage_type(value)
+        self._storage_type = value
+
+    @torch.jit.unused
+    def train(self, mode=True):
+        # Rows pulled in read-only mode are not created on the servers,
+        # so the cache is dropped when the training mode changes.
+        if self._cache is not None and mode != self.training:
+            self._cache.clear()
+        return super().train(mode)
+
     @property
     @torch.jit.unused
     def _is_clean(self):
@@ -467,8 +544,15 @@ class EmbeddingOperator(torch.nn.Module):
     @torch.jit.unused
     def _combine_to_indices_and_offsets(self, minibatch, feature_offset):
         import pyarrow as pa
-        batch = pa.RecordBatch.from_pandas(minibatch)
-        indices, offsets = self._feature_extractor.extract(batch)
+        if isinstance(minibatch, pa.RecordBatch):
+            # Minibatches fed by ``mapInArrow`` are passed to the feature
+            # extractor as is, avoiding the Arrow -> pandas -> Arrow round trip.
+            batch = minibatch
+        else:
+            with profile_phase(self._step_profiler, 'arrow_conversion'):
+                batch = pa.RecordBatch.from_pandas(minibatch)
+        with profile_phase(self._step_profiler, 'feature_extraction'):
+            indices, offsets = self._feature_extractor.extract(batch)
         if not feature_offset:
             offsets = offsets[::self.feature_count]
         return indices, offsets
@@ -482,12 +566,34 @@ class EmbeddingOperator(torch.nn.Module):
         keys = HashUniquifier.uniquify(indices)
         return keys
 
+    @torch.jit.unused
+    def _combine_detached(self, minibatch):
+        # Combine the minibatch without touching the state of the operator,
+        # so that later minibatches can be combined ahead of time.
+        self._ensure_combine_schema_loaded()
+        indices, indices_meta = self._do_combine(minibatch)
+        with profile_phase(self._step_profiler, 'uniquify'):
+            keys = self._uniquify_hash_codes(indices)
+        return indices, indices_meta, keys
+
     @torch.jit.unused
     def _combine(self, minibatch):
+        self._install_combined_indices(*self._combine_detached(minibatch))
+
+    @torch.jit.unused
+    def _install_combined_indices(self, indices, indices_meta, keys):
         self._clean()
-        self._ensure_combine_schema_loaded()
-        self._indices, self._indices_meta = self._do_combine(minibatch)
-        self._keys = self._uniquify_hash_codes(self._indices)
+        self._indices = indices
+        self._indices_meta = indices_meta
+        self._keys = keys
+
+    @torch.jit.unused
+    def _install_combined(self, indices, indices_meta, keys, data):
+        self._clean()
+        self._indices = indices
+        self._indices_meta = indices_meta
+        self._keys = keys
+        self._update_data(data)
 
     @torch.jit.unused
     def _check_embedding_bag_mode(self, mode):
@@ -578,7 +684,7 @@ class EmbeddingOperator(torch.nn.Module):
         agent = tensor._handle.agent
         agent.barrier()
         if agent.rank == 0:
-            asyncio.run(self._sparse_tensor_clear())
+            run_sync(self._sparse_tensor_clear())
         agent.barrier()
 
     @torch.jit.unused
@@ -595,7 +701,7 @@ class EmbeddingOperator(torch.nn.Module):
         tensor = self._distributed_tensor
         agent = tensor._handle.agent
         agent.barrier()
-        asyncio.run(self._sparse_tensor_import_from(meta_file_path,
+        run_sync(self._sparse_tensor_import_from(meta_file_path,
             data_only=data_only, skip_existing=skip_existing,
             transform_key=transform_key, feature_name=feature_name))
         agent.barrier()
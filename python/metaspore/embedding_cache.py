@@ -0,0 +1,243 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import threading
+import numpy
+
+class EmbeddingCache(object):
+    """Worker side cache of the hottest embedding rows of a sparse tensor.
+
+    Keys served from the cache are not pulled from the parameter servers.
+    Cached rows are re-pulled once they are ``refresh_interval`` pulls
+    or ``max_staleness`` seconds old, which bounds their staleness with
+    respect to the values on the servers.
+    """
+
+    def __init__(self,
+                 capacity=None,
+                 memory_limit=None,
+                 policy='lfu',
+                 refresh_interval=100,
+                 max_staleness=None):
+        if capacity is None and memory_limit is None:
+            raise ValueError("at least one of capacity and memory_limit must be specified")
+        if capacity is not None:
+            if not isinstance(capacity, int) or capacity <= 0:
+                raise TypeError(f"capacity must be positive integer; {capacity!r} is invalid")
+        if memory_limit is not None:
+            if not isinstance(memory_limit, int) or memory_limit <= 0:
+                raise TypeError(f"memory_limit must be positive integer; {memory_limit!r} is invalid")
+        if policy not in ('lfu', 'lru'):
+            raise ValueError(f"policy must be one of: 'lfu', 'lru'; {policy!r} is invalid")
+        if refresh_interval is not None:
+            if not isinstance(refresh_interval, int) or refresh_interval <= 0:
+                raise TypeError(f"refresh_interval must be positive integer; {refresh_interval!r} is invalid")
+        if max_staleness is not None:
+            if not isinstance(max_staleness, (int, float)) or max_staleness <= 0:
+                raise TypeError(f"max_staleness must be positive number; {max_staleness!r} is invalid")
+        self._capacity = capacity
+        self._memory_limit = memory_limit
+        self._policy = policy
+        self._refresh_interval = refresh_interval
+        self._max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._step = 0
+        self._hit_count = 0
+        self._miss_count = 0
+        self._clear()
+
+    def __repr__(self):
+        args = []
+        if self._capacity is not None:
+            args.append(f"capacity={self._capacity!r}")
+        if self._memory_limit is not None:
+            args.append(f"memory_limit={self._memory_limit!r}")
+        if self._policy != 'lfu':
+            args.append(f"policy={self._policy!r}")
+        if self._refresh_interval != 100:
+            args.append(f"refresh_interval={self._refresh_interval!r}")
+        if self._max_staleness is not None:
+            args.append(f"max_staleness={self._max_staleness!r}")
+        return f"{self.__class__.__name__}({', '.join(args)})"
+
+    def __getstate__(self):
+        # Only the configuration is pickled, as modules are sent to the
+        # workers with ``torch.save``; locks can not be pickled and the
+        # cached rows are stale in another process anyway.
+        state = self.__dict__.copy()
+        for name in ('_lock', '_step', '_hit_count', '_miss_count',
+                     '_keys', '_data', '_counts', '_used_steps',
+                     '_fetched_steps', '_fetched_times'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._step = 0
+        self._hit_count = 0
+        self._miss_count = 0
+        self._clear()
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def memory_limit(self):
+        return self._memory_limit
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def refresh_interval(self):
+        return self._refresh_interval
+
+    @property
+    def max_staleness(self):
+        return self._max_staleness
+
+    @property
+    def size(self):
+        return len(self._keys)
+
+    @property
+    def hit_count(self):
+        return self._hit_count
+
+    @property
+    def miss_count(self):
+        return self._miss_count
+
+    @property
+    def hit_rate(self):
+        total = self._hit_count + self._miss_count
+        if total == 0:
+            return 0.0
+        return self._hit_count / total
+
+    def reset_stats(self):
+        self._hit_count = 0
+        self._miss_count = 0
+
+    def _clear(self):
+        # Cached keys are kept sorted, so that lookups are vectorized
+        # with ``numpy.searchsorted``; the other arrays are parallel to it.
+        self._keys = numpy.empty(0, dtype=numpy.uint64)
+        self._data = None
+        self._counts = numpy.empty(0, dtype=numpy.int64)
+        self._used_steps = numpy.empty(0, dtype=numpy.int64)
+        self._fetched_steps = numpy.empty(0, dtype=numpy.int64)
+        self._fetched_times = numpy.empty(0, dtype=numpy.float64)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _get_max_rows(self, data):
+        max_rows = self._capacity
+        if self._memory_limit is not None:
+            row_bytes = data.itemsize * (data.shape[1] if data.ndim > 1 else 1)
+            limit = self._memory_limit // row_bytes
+            max_rows = limit if max_rows is None else min(max_rows, limit)
+        return max_rows
+
+    def _find(self, keys):
+        pos = numpy.searchsorted(self._keys, keys)
+        found = pos < len(self._keys)
+        found[found] = self._keys[pos[found]] == keys[found]
+        return pos, found
+
+    def lookup(self, keys):
+        """Split ``keys`` into cache hits and misses.
+
+        Return a pair of the boolean hit mask and the cached rows of the hits.
+        Rows older than the refresh bounds are reported as misses.
+        """
+        with self._lock:
+            self._step += 1
+            pos, hit = self._find(keys)
+            if self._data is not None and hit.any():
+                hit_pos = pos[hit]
+                fresh = numpy.ones(len(hit_pos), dtype=bool)
+                if self._refresh_interval is not None:
+                    fresh &= self._step - self._fetched_steps[hit_pos] < self._refresh_interval
+                if self._max_staleness is not None:
+                    fresh &= time.time() - self._fetched_times[hit_pos] < self._max_staleness
+                hit[hit] = fresh
+                hit_pos = pos[hit]
+                self._counts[hit_pos] += 1
+                self._used_steps[hit_pos] = self._step
+                rows = self._data[hit_pos]
+            else:
+                hit[:] = False
+                rows = None
+            hit_count = int(hit.sum())
+            self._hit_count += hit_count
+            self._miss_count += len(keys) - hit_count
+            return hit, rows
+
+    def update(self, keys, data):
+        """Store the freshly pulled rows ``data`` of ``keys``.
+
+        Keys already cached are refreshed in place; new keys are admitted
+        and the coldest rows are evicted when the cache is full.
+        """
+        if len(keys) == 0:
+            return
+        with self._lock:
+            now = time.time()
+            if self._data is None:
+                self._data = numpy.empty((0,) + data.shape[1:], dtype=data.dtype)
+            pos, found = self._find(keys)
+            if found.any():
+                old_pos = pos[found]
+                self._data[old_pos] = data[found]
+                self._counts[old_pos] += 1
+                self._used_steps[old_pos] = self._step
+                self._fetched_steps[old_pos] = self._step
+                self._fetched_times[old_pos] = now
+            new = ~found
+            if not new.any():
+                return
+            n = new.sum()
+            keys = numpy.concatenate((self._keys, keys[new]))
+            data = numpy.concatenate((self._data, data[new]))
+            counts = numpy.concatenate((self._counts, numpy.ones(n, dtype=numpy.int64)))
+            used_steps = numpy.concatenate((self._used_steps, numpy.full(n, self._step, dtype=numpy.int64)))
+            fetched_steps = numpy.concatenate((self._fetched_steps, numpy.full(n, self._step, dtype=numpy.int64)))
+            fetched_times = numpy.concatenate((self._fetched_times, numpy.full(n, now, dtype=numpy.float64)))
+            max_rows = self._get_max_rows(data)
+            if len(keys) > max_rows:
+                # ``numpy.lexsort`` sorts by the last key first, so the
+                # hottest rows end up at the tail.
+                if self._policy == 'lfu':
+                    order = numpy.lexsort((used_steps, counts))
+                else:
+                    order = numpy.lexsort((counts, used_steps))
+                kept = order[len(keys) - max_rows:]
+            else:
+                kept = numpy.arange(len(keys))
+            kept = kept[numpy.argsort(keys[kept], kind='stable')]
+            self._keys = keys[kept]
+            self._data = data[kept]
+            self._counts = counts[kept]
+            self._used_steps = used_steps[kept]
+            self._fetched_steps = fetched_steps[kept]
+            self._fetched_times = fetched_times[kept]
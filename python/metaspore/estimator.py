@@ -15,11 +15,13 @@
 #
 
 import io
+import collections
 import torch
 import pyspark.ml.base
 from . import patching_pickle
 from .agent import Agent
 from .model import Model
+from .model import SparseModel
 from .metric import ModelMetric
 from .metric import BinaryClassificationModelMetric
 from .updater import TensorUpdater
@@ -28,6 +30,8 @@ from .distributed_trainer import DistributedTrainer
 from .file_utils import dir_exists
 from .file_utils import delete_dir
 from .ps_launcher import PSLauncher
+from .step_profiler import StepProfiler
+from .step_profiler import profile_phase
 
 class PyTorchAgent(Agent):
     def __init__(self):
@@ -65,7 +69,12 @@ class PyTorchAgent(Agent):
         self.use_fresh_updaters = None
         self.training_epoches = None
         self.shuffle_training_dataset = None
+        self.use_arrow_minibatch = None
+        self.prefetch_depth = None
+        self.profile_training_steps = None
         self.max_sparse_feature_age = None
+        self.checkpoint_mode = None
+        self.checkpoint_compaction_interval = None
         self.metric_update_interval = None
         self.consul_host = None
         self.consul_port = None
@@ -78,6 +87,7 @@ class PyTorchAgent(Agent):
         self.output_prediction_column_name = None
         self.output_prediction_column_type = None
         self.minibatch_id = 0
+        self._prefetched_minibatches = collections.deque()
 
     def run(self):
         if self.coordinator_start_hook is not None:
@@ -296,9 +306,19 @@ class PyTorchAgent(Agent):
         self.model = Model.wrap(self, self.module, name_prefix=self.tensor_name_prefix)
 
     def setup_trainer(self):
-        self.trainer = DistributedTrainer(self.model, updater=self.updater)
+        self.trainer = DistributedTrainer(self.model, updater=self.updater,
+                                          checkpoint_mode=self.checkpoint_mode,
+                                          checkpoint_compaction_interval=self.checkpoint_compaction_interval)
         self.trainer.initialize()
 
+    def setup_step_profiler(self):
+        # Phase latencies and transfer bytes are pushed to the coordinator
+        # together with the metrics, every ``metric_update_interval`` minibatches.
+        if self.profile_training_steps and self.is_training_mode:
+            profiler = StepProfiler()
+            self.step_profiler = profiler
+            self.model.step_profiler = profiler
+
     def start_workers(self):
         if self.start_workers_hook is not None:
             self.start_workers_hook(self)
@@ -308,6 +328,7 @@ class PyTorchAgent(Agent):
         super().worker_start()
         self.setup_model()
         self.setup_trainer()
+        self.setup_step_profiler()
         self.load_model()
         if self.worker_start_hook is not None:
             self.worker_start_hook(self)
@@ -328,6 +349,7 @@ class PyTorchAgent(Agent):
     def export_model(self):
         if self.model_export_path is not None:
             print('\033[38;5;196mexporting model to %s\033[m' % self.model_export_path)
+            self.trainer.flush()
             self.model.eval()
             self.model.model_version = self.model_version
             self.model.experiment_name = self.experiment_name
@@ -345,6 +367,7 @@ class PyTorchAgent(Agent):
         # Make sure the final metric buffers are pushed.
         self.push_metric()
         if self.is_training_mode:
+            self.trainer.flush()
             self.save_model()
             self.export_model()
         if self.worker_stop_hook is not None:
@@ -371,9 +394,57 @@ class PyTorchAgent(Agent):
             if self.shuffle_training_dataset:
                 df = shuffle_df(df, self.worker_count)
             func = self.feed_training_minibatch()
-            df = df.mapInPandas(func, df.schema)
+            if self.use_arrow_minibatch:
+                # Minibatches are fed as Arrow record batches, so that sparse
+                # features can be extracted without converting to pandas.
+                df = df.mapInArrow(func, df.schema)
+            else:
+                df = df.mapInPandas(func, df.schema)
             df.write.format('noop').mode('overwrite').save()
 
+    def feed_training_minibatch(self):
+        def _feed_training_minibatch(iterator):
+            self = __class__.get_instance()
+            for minibatch in self._prefetch_training_minibatches(iterator):
+                result = self.train_minibatch(minibatch)
+                yield result
+        return _feed_training_minibatch
+
+    def _prefetch_training_minibatches(self, iterator):
+        # Prefetching only applies to the default training path, as custom
+        # minibatch transformers may call the model in arbitrary ways.
+        if (not self.prefetch_depth or
+                self.training_minibatch_transformer is not None or
+                not isinstance(self.model, SparseModel)):
+            yield from iterator
+            return
+        window = collections.deque()
+        try:
+            for minibatch in iterator:
+                self._prefetch_minibatch(minibatch)
+                window.append(minibatch)
+                if len(window) > self.prefetch_depth:
+                    yield window.popleft()
+            while window:
+                yield window.popleft()
+        finally:
+            self._prefetched_minibatches.clear()
+            self.model.clear_prefetched()
+
+    def _prefetch_minibatch(self, minibatch):
+        self.model.train()
+        result = self.preprocess_minibatch(minibatch)
+        self._prefetched_minibatches.append((minibatch, result))
+        self.model.prefetch(result[0])
+
+    def _preprocess_training_minibatch(self, minibatch):
+        if self._prefetched_minibatches:
+            head, result = self._prefetched_minibatches.popleft()
+            if head is minibatch:
+                return result
+            self._prefetched_minibatches.clear()
+        return self.preprocess_minibatch(minibatch)
+
     def feed_validation_dataset(self):
         if self.validation_dataset_transformer is not None:
             self.validation_dataset_transformer(self)
@@ -411,6 +482,15 @@ class PyTorchAgent(Agent):
 
     def _default_preprocess_minibatch(self, minibatch):
         import numpy as np
+        import pyarrow as pa
+        if isinstance(minibatch, pa.RecordBatch):
+            if self.input_label_column_name is not None:
+                label_column_name = self.input_label_column_name
+            else:
+                label_column_name = minibatch.schema.names[self.input_label_column_index]
+            index = minibatch.schema.get_field_index(label_column_name)
+            labels = minibatch.column(index).to_numpy(zero_copy_only=False).astype(np.float32)
+            return minibatch, labels
         if self.input_label_column_name is not None:
             label_column_name = self.input_label_column_name
         else:
@@ -427,14 +507,20 @@ class PyTorchAgent(Agent):
         return minibatch
 
     def _default_train_minibatch(self, minibatch):
-        self.model.train()
-        minibatch, labels = self.preprocess_minibatch(minibatch)
-        predictions = self.model(minibatch)
-        labels = torch.from_numpy(labels).reshape(-1, 1)
-        loss = self.compute_loss(predictions, labels)
-        self.trainer.train(loss)
-        self.update_progress(batch_size=len(minibatch), batch_loss=loss,
-                             predictions=predictions, labels=labels)
+        profiler = self.step_profiler
+        with profile_phase(profiler, 'step'):
+            self.model.train()
+            with profile_phase(profiler, 'preprocess'):
+                minibatch, labels = self._preprocess_training_minibatch(minibatch)
+            with profile_phase(profiler, 'model'):
+                predictions = self.model(minibatch)
+            with profile_phase(profiler, 'loss'):
+                labels = torch.from_numpy(labels).reshape(-1, 1)
+                loss = self.compute_loss(predictions, labels)
+            self.trainer.train(loss)
+            with profile_phase(profiler, 'update_progress'):
+                self.update_progress(batch_size=len(minibatch), batch_loss=loss,
+                                     predictions=predictions, labels=labels)
 
     def validate_minibatch(self, minibatch):
         if self.validation_minibatch_transformer is not None:
@@ -537,7 +623,12 @@ class PyTorchLauncher(PSLauncher):
         self.use_fresh_updaters = None
         self.training_epoches = None
         self.shuffle_training_dataset = None
+        self.use_arrow_minibatch = None
+        self.prefetch_depth = None
+        self.profile_training_steps = None
         self.max_sparse_feature_age = None
+        self.checkpoint_mode = None
+        self.checkpoint_compaction_interval = None
         self.metric_update_interval = None
         self.consul_host = None
         self.consul_port = None
@@ -591,7 +682,12 @@ class PyTorchLauncher(PSLauncher):
         self._agent_attributes['use_fresh_updaters'] = self.use_fresh_updaters
         self._agent_attributes['training_epoches'] = self.training_epoches
         self._agent_attributes['shuffle_training_dataset'] = self.shuffle_training_dataset
+        self._agent_attributes['use_arrow_minibatch'] = self.use_arrow_minibatch
+        self._agent_attributes['prefetch_depth'] = self.prefetch_depth
+        self._agent_attributes['profile_training_steps'] = self.profile_training_steps
         self._agent_attributes['max_sparse_feature_age'] = self.max_sparse_feature_age
+        self._agent_attributes['checkpoint_mode'] = self.checkpoint_mode
+        self._agent_attributes['checkpoint_compaction_interval'] = self.checkpoint_compaction_interval
         self._agent_attributes['metric_update_interval'] = self.metric_update_interval
         self._agent_attributes['consul_host'] = self.consul_host
         self._agent_attributes['consul_port'] = self.consul_port
@@ -638,7 +734,12 @@ class PyTorchHelperMixin(object):
                  experiment_name=None,
                  training_epoches=1,
                  shuffle_training_dataset=False,
+                 use_arrow_minibatch=False,
+                 prefetch_depth=0,
+                 profile_training_steps=False,
                  max_sparse_feature_age=15,
+                 checkpoint_mode='full',
+                 checkpoint_compaction_interval=7,
                  metric_update_interval=10,
                  consul_host=None,
                  consul_port=None,
@@ -681,7 +782,12 @@ class PyTorchHelperMixin(object):
         self.use_fresh_updaters = use_fresh_updaters
         self.training_epoches = training_epoches
         self.shuffle_training_dataset = shuffle_training_dataset
+        self.use_arrow_minibatch = use_arrow_minibatch
+        self.prefetch_depth = prefetch_depth
+        self.profile_training_steps = profile_training_steps
         self.max_sparse_feature_age = max_sparse_feature_age
+        self.checkpoint_mode = checkpoint_mode
+        self.checkpoint_compaction_interval = checkpoint_compaction_interval
         self.metric_update_interval = metric_update_interval
         self.consul_host = consul_host
         self.consul_port = consul_port
@@ -761,8 +867,18 @@ class PyTorchHelperMixin(object):
             raise TypeError(f"experiment_name must be string; {self.experiment_name!r} is invalid")
         if not isinstance(self.training_epoches, int) or self.training_epoches <= 0:
             raise TypeError(f"training_epoches must be positive integer; {self.training_epoches!r} is invalid")
+        if not isinstance(self.use_arrow_minibatch, bool):
+            raise TypeError(f"use_arrow_minibatch must be bool; {self.use_arrow_minibatch!r} is invalid")
+        if not isinstance(self.prefetch_depth, int) or self.prefetch_depth < 0:
+            raise TypeError(f"prefetch_depth must be non-negative integer; {self.prefetch_depth!r} is invalid")
+        if not isinstance(self.profile_training_steps, bool):
+            raise TypeError(f"profile_training_steps must be bool; {self.profile_training_steps!r} is invalid")
         if not isinstance(self.max_sparse_feature_age, int) or self.max_sparse_feature_age <= 0:
             raise TypeError(f"max_sparse_feature_age must be positive integer; {self.max_sparse_feature_age!r} is invalid")
+        if self.checkpoint_mode not in ('full', 'delta'):
+            raise ValueError(f"checkpoint_mode must be one of: 'full', 'delta'; {self.checkpoint_mode!r} is invalid")
+        if not isinstance(self.checkpoint_compaction_interval, int) or self.checkpoint_compaction_interval <= 0:
+            raise TypeError(f"checkpoint_compaction_interval must be positive integer; {self.checkpoint_compaction_interval!r} is invalid")
         if not isinstance(self.metric_update_interval, int) or self.metric_update_interval <= 0:
             raise TypeError(f"metric_update_interval must be positive integer; {self.metric_update_interval!r} is invalid")
         if self.consul_host is not None and not isinstance(self.consul_host, str):
@@ -843,7 +959,12 @@ class PyTorchHelperMixin(object):
         launcher.use_fresh_updaters = self.use_fresh_updaters
         launcher.training_epoches = self.training_epoches
         launcher.shuffle_training_dataset = self.shuffle_training_dataset
+        launcher.use_arrow_minibatch = self.use_arrow_minibatch
+        launcher.prefetch_depth = self.prefetch_depth
+        launcher.profile_training_steps = self.profile_training_steps
         launcher.max_sparse_feature_age = self.max_sparse_feature_age
+        launcher.checkpoint_mode = self.checkpoint_mode
+        launcher.checkpoint_compaction_interval = self.checkpoint_compaction_interval
         launcher.metric_update_interval = self.metric_update_interval
         launcher.consul_host = self.consul_host
         launcher.consul_port = self.consul_port
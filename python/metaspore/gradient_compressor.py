@@ -0,0 +1,195 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import math
+import numpy
+
+def _merge_rows(keys, rows):
+    # Sum the rows of duplicated keys; the result is sorted by key.
+    order = numpy.argsort(keys, kind='stable')
+    keys = keys[order]
+    rows = rows[order]
+    if len(keys) == 0:
+        return keys, rows
+    starts = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], numpy.add.reduceat(rows, starts, axis=0)
+
+class _CompressionState(object):
+    def __init__(self):
+        self.step = 0
+        self.dense_sum = None
+        self.sparse_keys = []
+        self.sparse_rows = []
+        self.residual_keys = None
+        self.residual_rows = None
+
+class GradientCompressor(object):
+    """Reduce the size of the gradients workers push to the parameter servers.
+
+    Gradients are summed locally over ``accumulation_steps`` minibatches
+    before being pushed. For sparse tensors, only the ``top_k_ratio``
+    fraction of rows with the largest norms is pushed; the other rows are
+    kept as residuals and added to the gradients of the next push, so that
+    no update is lost. With ``float16``, gradients are sent as float16 and
+    converted back to the data type of the tensor on the servers.
+
+    Accumulated gradients and residuals still held by the workers are
+    pushed by ``flush_dense`` and ``flush_sparse``, which the trainer calls
+    before models are saved or exported.
+
+    Dense tensors support ``float16`` and ``accumulation_steps`` only, as
+    their gradients are pushed as a whole.
+    """
+
+    def __init__(self, float16=False, top_k_ratio=None, accumulation_steps=1):
+        if not isinstance(float16, bool):
+            raise TypeError(f"float16 must be bool; {float16!r} is invalid")
+        if top_k_ratio is not None:
+            if not isinstance(top_k_ratio, float) or not 0.0 < top_k_ratio <= 1.0:
+                raise TypeError(f"top_k_ratio must be float in (0, 1]; {top_k_ratio!r} is invalid")
+        if not isinstance(accumulation_steps, int) or accumulation_steps <= 0:
+            raise TypeError(f"accumulation_steps must be positive integer; {accumulation_steps!r} is invalid")
+        self._float16 = float16
+        self._top_k_ratio = top_k_ratio
+        self._accumulation_steps = accumulation_steps
+
+    def __repr__(self):
+        args = []
+        if self._float16:
+            args.append("float16=True")
+        if self._top_k_ratio is not None:
+            args.append(f"top_k_ratio={self._top_k_ratio!r}")
+        if self._accumulation_steps != 1:
+            args.append(f"accumulation_steps={self._accumulation_steps!r}")
+        return f"{self.__class__.__name__}({', '.join(args)})"
+
+    @property
+    def float16(self):
+        return self._float16
+
+    @property
+    def top_k_ratio(self):
+        return self._top_k_ratio
+
+    @property
+    def accumulation_steps(self):
+        return self._accumulation_steps
+
+    def _get_state(self, tensor):
+        state = tensor._compression_state
+        if state is None:
+            state = _CompressionState()
+            tensor._compression_state = state
+        return state
+
+    def reset(self, tensor):
+        tensor._compression_state = None
+
+    def _is_flush_step(self, state):
+        state.step += 1
+        if state.step < self._accumulation_steps:
+            return False
+        state.step = 0
+        return True
+
+    def compress_dense(self, tensor, grad):
+        """Return the gradient to push, or ``None`` to skip this push."""
+        if self._accumulation_steps > 1:
+            state = self._get_state(tensor)
+            if state.dense_sum is None:
+                state.dense_sum = grad.copy()
+            else:
+                state.dense_sum += grad
+            if not self._is_flush_step(state):
+                return None
+            grad = state.dense_sum
+            state.dense_sum = None
+        if self._float16:
+            grad = grad.astype(numpy.float16)
+        return grad
+
+    def compress_sparse(self, tensor, keys, grad):
+        """Return the keys and gradient rows to push, or ``None`` to skip this push."""
+        if self._accumulation_steps > 1 or self._top_k_ratio is not None:
+            state = self._get_state(tensor)
+            if self._accumulation_steps > 1:
+                state.sparse_keys.append(keys)
+                state.sparse_rows.append(grad)
+                if not self._is_flush_step(state):
+                    return None
+                keys = numpy.concatenate(state.sparse_keys)
+                grad = numpy.concatenate(state.sparse_rows)
+                state.sparse_keys = []
+                state.sparse_rows = []
+                keys, grad = _merge_rows(keys, grad)
+            if self._top_k_ratio is not None:
+                keys, grad = self._select_top_k(state, keys, grad)
+        if self._float16:
+            grad = grad.astype(numpy.float16)
+        return keys, grad
+
+    def flush_dense(self, tensor):
+        """Return the accumulated gradient not pushed yet, or ``None``."""
+        state = tensor._compression_state
+        if state is None or state.dense_sum is None:
+            return None
+        grad = state.dense_sum
+        state.dense_sum = None
+        state.step = 0
+        if self._float16:
+            grad = grad.astype(numpy.float16)
+        return grad
+
+    def flush_sparse(self, tensor):
+        """Return the accumulated and residual rows not pushed yet, or ``None``."""
+        state = tensor._compression_state
+        if state is None:
+            return None
+        keys = list(state.sparse_keys)
+        rows = list(state.sparse_rows)
+        if state.residual_keys is not None:
+            keys.append(state.residual_keys)
+            rows.append(state.residual_rows)
+        state.sparse_keys = []
+        state.sparse_rows = []
+        state.residual_keys = None
+        state.residual_rows = None
+        state.step = 0
+        if not keys:
+            return None
+        keys, grad = _merge_rows(numpy.concatenate(keys), numpy.concatenate(rows))
+        if len(keys) == 0:
+            return None
+        if self._float16:
+            grad = grad.astype(numpy.float16)
+        return keys, grad
+
+    def _select_top_k(self, state, keys, grad):
+        if state.residual_keys is not None:
+            keys = numpy.concatenate((keys, state.residual_keys))
+            grad = numpy.concatenate((grad, state.residual_rows))
+            keys, grad = _merge_rows(keys, grad)
+        k = max(1, math.ceil(self._top_k_ratio * len(keys)))
+        if k >= len(keys):
+            state.residual_keys = None
+            state.residual_rows = None
+            return keys, grad
+        norms = numpy.square(grad.reshape(len(keys), -1)).sum(axis=1)
+        selected = numpy.zeros(len(keys), dtype=bool)
+        selected[numpy.argpartition(norms, len(keys) - k)[len(keys) - k:]] = True
+        state.residual_keys = keys[~selected]
+        state.residual_rows = grad[~selected]
+        return keys[selected], numpy.ascontiguousarray(grad[selected])
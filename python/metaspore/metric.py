@@ -140,13 +140,20 @@ class BasicModelMetric(ModelMetric):
         return string
 
 class BinaryClassificationModelMetric(BasicModelMetric):
-    def __init__(self, buffer_size=1000000, threshold=0.0, beta=1.0):
+    def __init__(self, buffer_size=1000000, threshold=0.0, beta=1.0, max_push_bins=None):
         super().__init__()
+        if max_push_bins is not None:
+            if not isinstance(max_push_bins, int) or max_push_bins <= 0:
+                raise TypeError(f"max_push_bins must be positive integer; {max_push_bins!r} is invalid")
         self._buffer_size = buffer_size
         self._threshold = threshold
         self._beta = beta
-        self._positive_buffer = numpy.zeros(buffer_size, dtype=numpy.float64)
-        self._negative_buffer = numpy.zeros(buffer_size, dtype=numpy.float64)
+        self._max_push_bins = max_push_bins
+        # The dense histogram buffers are allocated on first use, so that
+        # metrics received from workers can stay in the compact form.
+        self._positive_buffer_data = None
+        self._negative_buffer_data = None
+        self._clear_compact_bins()
         self._prediction_sum = 0.0
         self._label_sum = 0.0
         self._true_positive = 0
@@ -162,6 +169,67 @@ class BinaryClassificationModelMetric(BasicModelMetric):
     def beta(self):
         return self._beta
 
+    @property
+    def max_push_bins(self):
+        return self._max_push_bins
+
+    @property
+    def _positive_buffer(self):
+        if self._positive_buffer_data is None:
+            self._positive_buffer_data = numpy.zeros(self._buffer_size, dtype=numpy.float64)
+            self._expand_compact_bins()
+        return self._positive_buffer_data
+
+    @property
+    def _negative_buffer(self):
+        if self._negative_buffer_data is None:
+            self._negative_buffer_data = numpy.zeros(self._buffer_size, dtype=numpy.float64)
+            self._expand_compact_bins()
+        return self._negative_buffer_data
+
+    @property
+    def _is_dense(self):
+        return self._positive_buffer_data is not None or self._negative_buffer_data is not None
+
+    def _clear_compact_bins(self):
+        self._bin_indices = numpy.empty(0, dtype=numpy.uint32)
+        self._bin_positives = numpy.empty(0, dtype=numpy.float32)
+        self._bin_negatives = numpy.empty(0, dtype=numpy.float32)
+
+    def _expand_compact_bins(self):
+        if self._positive_buffer_data is None or self._negative_buffer_data is None:
+            return
+        indices = self._bin_indices.astype(numpy.int64)
+        self._positive_buffer_data[indices] += self._bin_positives
+        self._negative_buffer_data[indices] += self._bin_negatives
+        self._clear_compact_bins()
+
+    def _get_compact_bins(self):
+        # Only non-empty bins are shipped. As metrics are cleared after being
+        # pushed, these are exactly the bins touched since the last push.
+        positives = self._positive_buffer
+        negatives = self._negative_buffer
+        indices = numpy.flatnonzero((positives != 0.0) | (negatives != 0.0))
+        if len(indices) == 0:
+            # Message slices can not be empty, ship a single zero bin
+            # instead, which contributes nothing to merge and AUC.
+            indices = numpy.zeros(1, dtype=numpy.int64)
+        positives = positives[indices]
+        negatives = negatives[indices]
+        max_bins = self._max_push_bins
+        if max_bins is not None and len(indices) > max_bins:
+            # Adaptive resolution: merge runs of consecutive non-empty bins
+            # into ``max_bins`` groups holding equally many bins, so that the
+            # resolution follows the distribution of the predictions.
+            starts = numpy.arange(max_bins, dtype=numpy.int64) * len(indices) // max_bins
+            indices = indices[starts]
+            positives = numpy.add.reduceat(positives, starts)
+            negatives = numpy.add.reduceat(negatives, starts)
+        indices = indices.astype(numpy.uint32)
+        positives = positives.astype(numpy.float32)
+        negatives = negatives.astype(numpy.float32)
+        return indices, positives, negatives
+
     def _get_scalar_pack_info(self):
         return super()._get_scalar_pack_info() + (
             ('_prediction_sum', 'd'),
@@ -171,15 +239,27 @@ class BinaryClassificationModelMetric(BasicModelMetric):
             ('_false_positive', 'l'),
             ('_false_negative', 'l'))
 
-    def _get_array_pack_info(self):
-        return super()._get_array_pack_info() + (
-            '_positive_buffer',
-            '_negative_buffer')
+    def get_states(self):
+        states = self._pack_scalar_values(),
+        states += self._get_compact_bins()
+        return states
+
+    def from_states(self, states):
+        self._unpack_scalar_values(states[0])
+        indices, positives, negatives = states[1:]
+        self._positive_buffer_data = None
+        self._negative_buffer_data = None
+        self._bin_indices = indices
+        self._bin_positives = positives
+        self._bin_negatives = negatives
 
     def clear(self):
         super().clear()
-        self._positive_buffer.fill(0.0)
-        self._negative_buffer.fill(0.0)
+        if self._positive_buffer_data is not None:
+            self._positive_buffer_data.fill(0.0)
+        if self._negative_buffer_data is not None:
+            self._negative_buffer_data.fill(0.0)
+        self._clear_compact_bins()
         self._prediction_sum = 0.0
         self._label_sum = 0.0
         self._true_positive = 0
@@ -189,8 +269,15 @@ class BinaryClassificationModelMetric(BasicModelMetric):
 
     def merge(self, other):
         super().merge(other)
-        self._positive_buffer += other._positive_buffer
-        self._negative_buffer += other._negative_buffer
+        if other._is_dense:
+            self._positive_buffer += other._positive_buffer
+            self._negative_buffer += other._negative_buffer
+        else:
+            # Bin indices of compact metrics are unique, so the sparse
+            # additions below need not be unbuffered.
+            indices = other._bin_indices.astype(numpy.int64)
+            self._positive_buffer[indices] += other._bin_positives
+            self._negative_buffer[indices] += other._bin_negatives
         self._prediction_sum += other._prediction_sum
         self._label_sum += other._label_sum
         self._true_positive += other._true_positive
@@ -219,6 +306,12 @@ class BinaryClassificationModelMetric(BasicModelMetric):
             self._false_negative += (predicted_negative & actually_positive).sum()
 
     def compute_auc(self):
+        if not self._is_dense:
+            # Empty bins do not contribute to AUC, the compact bins which
+            # are sorted by index give the same result as the dense buffers.
+            positives = self._bin_positives.astype(numpy.float64)
+            negatives = self._bin_negatives.astype(numpy.float64)
+            return ModelMetricBuffer.compute_auc(positives, negatives)
         auc = ModelMetricBuffer.compute_auc(self._positive_buffer, self._negative_buffer)
         return auc
 
@@ -20,6 +20,7 @@ import time
 import asyncio
 import torch
 import collections
+import concurrent.futures
 from . import _metaspore
 from . import embedding
 from .agent import Agent
@@ -30,6 +31,9 @@ from .updater import EMATensorUpdater
 from .embedding import EmbeddingOperator
 from .cast import Cast
 from .distributed_tensor import DistributedTensor
+from .step_profiler import StepProfiler
+from .step_profiler import profile_phase
+from .async_utils import run_sync
 from .url_utils import use_s3
 
 
@@ -60,6 +64,7 @@ class Model(object):
         self._model_version = model_version
         self._name_prefix = name_prefix
         self._tensors = []
+        self._step_profiler = None
 
     @property
     def agent(self):
@@ -121,6 +126,21 @@ class Model(object):
                 f"can not reset name_prefix {self._name_prefix!r} to {value!r}")
         self._name_prefix = value
 
+    @property
+    def step_profiler(self):
+        return self._step_profiler
+
+    @step_profiler.setter
+    def step_profiler(self, value):
+        if value is not None and not isinstance(value, StepProfiler):
+            raise TypeError(f"step_profiler must be StepProfiler; {value!r} is invalid")
+        self._step_profiler = value
+        self._configure_step_profiler()
+
+    def _configure_step_profiler(self):
+        for tensor in self._tensors:
+            tensor._step_profiler = self._step_profiler
+
     @property
     def training(self):
         return self._module.training
@@ -146,6 +166,7 @@ class Model(object):
         submodel._name_prefix = self._name_prefix
         submodel._tensors = self._filter_tensor_list(
             self._tensors, name_prefix)
+        submodel._step_profiler = self._step_profiler
         return submodel
 
     def _is_batch_norm(self, name, mod):
@@ -224,6 +245,7 @@ class Model(object):
         self._collect_cast_operators()
         self._collect_dense_parameters()
         self._collect_dense_buffers()
+        self._configure_step_profiler()
 
     async def _init_tensors(self, trainer):
         futures = []
@@ -232,13 +254,15 @@ class Model(object):
             futures.append(future)
         await asyncio.gather(*futures)
 
-    async def _pull_tensors(self, *, force_mode=False):
+    async def _pull_tensors(self, *, force_mode=False, dense_only=False):
         futures = []
         for tensor in self._tensors:
             if not force_mode:
                 # Pulling dense parameters in prediction mode is redundant.
                 if not self.training and tensor.is_dense:
                     continue
+            if dense_only and not tensor.is_dense:
+                continue
             if not tensor.is_backing:
                 future = tensor._pull_tensor()
                 futures.append(future)
@@ -253,22 +277,32 @@ class Model(object):
                 futures.append(future)
         await asyncio.gather(*futures)
 
+    async def _flush_tensors(self):
+        futures = []
+        for tensor in self._tensors:
+            if not tensor.is_backing:
+                future = tensor._flush_tensor()
+                futures.append(future)
+        await asyncio.gather(*futures)
+
     async def _clear_tensors(self):
         pass
 
-    async def _load_tensors(self, dir_path, *, keep_meta=False):
+    async def _load_tensors(self, dir_path, *, keep_meta=False, delta_dir_paths=(), track_changes=False):
         futures = []
         for tensor in self._tensors:
             if not tensor.is_backing:
-                future = tensor._load_tensor(dir_path, keep_meta=keep_meta)
+                future = tensor._load_tensor(dir_path, keep_meta=keep_meta,
+                                             delta_dir_paths=delta_dir_paths,
+                                             track_changes=track_changes)
                 futures.append(future)
         await asyncio.gather(*futures)
 
-    async def _save_tensors(self, dir_path):
+    async def _save_tensors(self, dir_path, *, delta=False, track_changes=False):
         futures = []
         for tensor in self._tensors:
             if not tensor.is_backing:
-                future = tensor._save_tensor(dir_path)
+                future = tensor._save_tensor(dir_path, delta=delta, track_changes=track_changes)
                 futures.append(future)
         await asyncio.gather(*futures)
 
@@ -498,21 +532,24 @@ class Model(object):
             message += "call the 'eval' method to set it in evaluation mode explicitly"
             raise RuntimeError(message)
         self.agent.barrier()
-        asyncio.run(self._pull_tensors(force_mode=True))
+        run_sync(self._pull_tensors(force_mode=True))
         if self.agent.rank == 0:
             self._do_export(path, model_export_selector=model_export_selector, output_names=output_names)
         self.agent.barrier()
 
     def sync(self):
         self.agent.barrier()
-        asyncio.run(self._pull_tensors(force_mode=True))
+        run_sync(self._pull_tensors(force_mode=True))
         self.agent.barrier()
 
     def __call__(self, *inputs):
+        profiler = self._step_profiler
         # Pulling dense parameters in prediction mode is redundant.
         if self.training:
-            asyncio.run(self._pull_tensors())
-        return self.module(*inputs)
+            with profile_phase(profiler, 'pull'):
+                run_sync(self._pull_tensors())
+        with profile_phase(profiler, 'forward'):
+            return self.module(*inputs)
 
     def _zero_grad(self):
         for tensor in self._tensors:
@@ -546,6 +583,9 @@ class SparseModel(Model):
         super().__init__(agent, module, experiment_name, model_version, name_prefix)
         self._embedding_operators = []
         self._cast_operators = []
+        self._prefetch_executor = None
+        self._combine_executor = None
+        self._prefetched = collections.deque()
 
     def get_submodel(self, submodule, name_prefix):
         submodel = super().get_submodel(submodule, name_prefix)
@@ -553,8 +593,17 @@ class SparseModel(Model):
             self._embedding_operators, name_prefix)
         submodel._cast_operators = self._filter_tensor_list(
             self._cast_operators, name_prefix)
+        submodel._prefetch_executor = None
+        submodel._combine_executor = None
+        submodel._prefetched = collections.deque()
         return submodel
 
+    def _configure_step_profiler(self):
+        super()._configure_step_profiler()
+        for name, mod in self.module.named_modules():
+            if isinstance(mod, EmbeddingOperator):
+                mod._step_profiler = self._step_profiler
+
     def _collect_embedding_operators(self):
         for name, mod in self.module.named_modules():
             if isinstance(mod, EmbeddingOperator):
@@ -631,7 +680,7 @@ class SparseModel(Model):
         await asyncio.gather(*futures)
 
     def _do_export(self, path, *, model_export_selector=None, output_names=None):
-        asyncio.run(self._sparse_tensors_export(
+        run_sync(self._sparse_tensors_export(
             path, model_export_selector=model_export_selector))
         super()._do_export(path, model_export_selector=model_export_selector, output_names=output_names)
 
@@ -668,22 +717,100 @@ class SparseModel(Model):
     def _do_prune_small(self, epsilon):
         self.agent.barrier()
         if self.agent.rank == 0:
-            asyncio.run(self._sparse_tensors_prune_small(epsilon))
+            run_sync(self._sparse_tensors_prune_small(epsilon))
         self.agent.barrier()
 
     def _do_prune_old(self, max_age):
         self.agent.barrier()
         if self.agent.rank == 0:
-            asyncio.run(self._sparse_tensors_prune_old(max_age))
+            run_sync(self._sparse_tensors_prune_old(max_age))
         self.agent.barrier()
 
+    def _combine_all_detached(self, minibatch):
+        # Convert the minibatch to Arrow once for all the embedding operators
+        # and run their feature extractors in parallel; the extractors release
+        # the GIL. Operators of the same class and combine schema produce the
+        # same hash codes, so they are extracted once and shared.
+        import pyarrow as pa
+        tensors = [tensor for tensor in self._embedding_operators if not tensor.is_backing]
+        if not tensors:
+            return []
+        if not isinstance(minibatch, pa.RecordBatch):
+            with profile_phase(self._step_profiler, 'arrow_conversion'):
+                minibatch = pa.RecordBatch.from_pandas(minibatch)
+        groups = collections.OrderedDict()
+        for tensor in tensors:
+            tensor.item._ensure_combine_schema_loaded()
+            key = type(tensor.item), tensor.item._feature_extractor.schema_source
+            groups.setdefault(key, []).append(tensor)
+        leaders = [group[0].item for group in groups.values()]
+        if len(leaders) == 1:
+            results = [leaders[0]._combine_detached(minibatch)]
+        else:
+            if self._combine_executor is None:
+                max_workers = min(len(leaders), os.cpu_count() or 1)
+                self._combine_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='sparse_model_combine')
+            results = list(self._combine_executor.map(lambda op: op._combine_detached(minibatch), leaders))
+        combined = []
+        for group, result in zip(groups.values(), results):
+            for tensor in group:
+                combined.append((tensor, result))
+        return combined
+
     def _execute_combine(self, minibatch):
-        for tensor in self._embedding_operators:
-            if not tensor.is_backing:
-                tensor.item._combine(minibatch)
+        for tensor, combined in self._combine_all_detached(minibatch):
+            tensor.item._install_combined_indices(*combined)
 
-    def _execute_pull(self):
-        asyncio.run(self._pull_tensors())
+    def _execute_pull(self, *, dense_only=False):
+        run_sync(self._pull_tensors(dense_only=dense_only))
+
+    async def _prefetch_sparse_tensors(self, minibatch):
+        tensors = []
+        futures = []
+        for tensor, (indices, indices_meta, keys) in self._combine_all_detached(minibatch):
+            future = tensor._pull_sparse_tensor_data(keys)
+            tensors.append((tensor, indices, indices_meta, keys))
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+        prefetched = []
+        for (tensor, indices, indices_meta, keys), data in zip(tensors, results):
+            prefetched.append((tensor, indices, indices_meta, keys, data))
+        return prefetched
+
+    def _do_prefetch(self, minibatch):
+        return run_sync(self._prefetch_sparse_tensors(minibatch))
+
+    def prefetch(self, minibatch):
+        # Combine ``minibatch`` and pull its sparse embeddings in the background,
+        # while previous minibatches are being computed. Prefetched embeddings
+        # are pulled before the pushes of the minibatches in front of it, so
+        # their staleness is bounded by the number of pending prefetches.
+        if self._prefetch_executor is None:
+            self._prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='sparse_model_prefetch')
+        future = self._prefetch_executor.submit(self._do_prefetch, minibatch)
+        self._prefetched.append((minibatch, future))
+
+    def clear_prefetched(self):
+        while self._prefetched:
+            minibatch, future = self._prefetched.popleft()
+            if not future.cancel():
+                # Wait for the running prefetch, as feature extractors of
+                # the embedding operators must not be used concurrently.
+                concurrent.futures.wait((future,))
+
+    def _install_prefetched(self, minibatch):
+        if not self._prefetched:
+            return False
+        head, future = self._prefetched[0]
+        if head is not minibatch or not self.training:
+            self.clear_prefetched()
+            return False
+        self._prefetched.popleft()
+        for tensor, indices, indices_meta, keys, data in future.result():
+            tensor.item._install_combined(indices, indices_meta, keys, data)
+        return True
 
     def _execute_compute(self):
         for tensor in self._embedding_operators:
@@ -695,10 +822,20 @@ class SparseModel(Model):
             mod._cast(minibatch)
 
     def __call__(self, minibatch):
-        self._execute_combine(minibatch)
-        self._execute_pull()
-        self._execute_compute()
-        self._execute_cast(minibatch)
+        profiler = self._step_profiler
+        if self._install_prefetched(minibatch):
+            with profile_phase(profiler, 'pull'):
+                self._execute_pull(dense_only=True)
+        else:
+            with profile_phase(profiler, 'combine'):
+                self._execute_combine(minibatch)
+            with profile_phase(profiler, 'pull'):
+                self._execute_pull()
+        with profile_phase(profiler, 'embedding_bag'):
+            self._execute_compute()
+        with profile_phase(profiler, 'cast'):
+            self._execute_cast(minibatch)
         fake_input = torch.tensor(0.0)
-        x = self.module(fake_input)
+        with profile_phase(profiler, 'forward'):
+            x = self.module(fake_input)
         return x
@@ -102,3 +102,8 @@ else:
 
 load, loads = pickle.load, pickle.loads
 Pickler = SourcePatchingPickler
+
+# Patch on first import, so that the patches are in effect in every
+# process pickling or unpickling modules with this module.
+_patch_lookup_module_and_qualname()
+_patch_getsourcelines()
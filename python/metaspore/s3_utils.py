@@ -15,6 +15,7 @@
 #
 
 import collections
+import threading
 _cached_s3_config = None
 _cached_s3fs_config = None
 _cached_s3fs = None
@@ -78,19 +79,19 @@ def get_s3_config():
     if config.aws_region:
         os.environ['AWS_REGION'] = config.aws_region
     else:
-        os.environ.unsetenv('AWS_REGION')
+        os.environ.pop('AWS_REGION', None)
     if config.aws_endpoint:
         os.environ['AWS_ENDPOINT'] = config.aws_endpoint
     else:
-        os.environ.unsetenv('AWS_ENDPOINT')
+        os.environ.pop('AWS_ENDPOINT', None)
     if config.aws_access_key_id:
         os.environ['AWS_ACCESS_KEY_ID'] = config.aws_access_key_id
     else:
-        os.environ.unsetenv('AWS_ACCESS_KEY_ID')
+        os.environ.pop('AWS_ACCESS_KEY_ID', None)
     if config.aws_secret_access_key:
         os.environ['AWS_SECRET_ACCESS_KEY'] = config.aws_secret_access_key
     else:
-        os.environ.unsetenv('AWS_SECRET_ACCESS_KEY')
+        os.environ.pop('AWS_SECRET_ACCESS_KEY', None)
     _cached_s3_config = config
     return config
 
@@ -141,28 +142,88 @@ def get_aws_region():
     config = get_s3_config()
     return config.aws_region
 
+# Clients are cached per process, as boto3 clients are thread-safe but must
+# not be shared with forked children; resources are not thread-safe, so
+# they are cached per thread as well.
+_s3_client_cache = dict()
+_s3_client_cache_lock = threading.Lock()
+_s3_resource_cache = threading.local()
+
+# Object transfers of directory helpers run in one bounded pool, objects
+# larger than the threshold being transferred in parts concurrently.
+S3_TRANSFER_MAX_CONCURRENCY = 32
+S3_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = 64 * 1024 * 1024
+
+def clear_s3_client_cache():
+    global _s3_resource_cache
+    with _s3_client_cache_lock:
+        _s3_client_cache.clear()
+        _s3_resource_cache = threading.local()
+
 def get_s3_client():
+    import os
     import boto3
+    from botocore.config import Config
     endpoint = get_aws_endpoint()
     region = get_aws_region()
-    s3 = boto3.client('s3', endpoint_url=endpoint, region_name = region)
+    key = os.getpid(), endpoint, region
+    s3 = _s3_client_cache.get(key)
+    if s3 is not None:
+        return s3
+    with _s3_client_cache_lock:
+        s3 = _s3_client_cache.get(key)
+        if s3 is None:
+            # One connection per concurrent request of the transfer pool.
+            config = Config(max_pool_connections=S3_TRANSFER_MAX_CONCURRENCY)
+            session = boto3.session.Session()
+            s3 = session.client('s3', endpoint_url=endpoint, region_name=region, config=config)
+            _s3_client_cache[key] = s3
     return s3
 
 def get_s3_resource():
+    import os
     import boto3
     endpoint = get_aws_endpoint()
     region = get_aws_region()
-    s3 = boto3.resource('s3', endpoint_url=endpoint, region_name = region)
-    return s3
+    key = os.getpid(), endpoint, region
+    cache = _s3_resource_cache
+    if getattr(cache, 'key', None) != key:
+        session = boto3.session.Session()
+        cache.resource = session.resource('s3', endpoint_url=endpoint, region_name=region)
+        cache.key = key
+    return cache.resource
 
-def get_s3_dir_size(dir_path):
+def _get_s3_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    config = TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD,
+                            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+                            max_concurrency=S3_TRANSFER_MAX_CONCURRENCY)
+    return config
+
+def _run_s3_transfers(submit_all):
+    # ``submit_all`` submits the transfers to the manager and returns their
+    # futures. Leaving the manager on an error cancels the pending ones.
+    from boto3.s3.transfer import create_transfer_manager
+    s3 = get_s3_client()
+    with create_transfer_manager(s3, _get_s3_transfer_config()) as manager:
+        futures = submit_all(manager)
+        for future in futures:
+            future.result()
+
+def list_s3_objects(dir_path):
+    """Yield the keys and sizes of the objects under ``dir_path``."""
     bucket, path = parse_s3_dir_url(dir_path)
     s3 = get_s3_client()
-    objs = s3.list_objects(Bucket=bucket, Prefix=path)
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=path):
+        for obj in page.get('Contents', ()):
+            yield obj['Key'], obj['Size']
+
+def get_s3_dir_size(dir_path):
     size = 0
-    if 'Contents' in objs:
-        for obj in objs['Contents']:
-            size += obj['Size']
+    for key, obj_size in list_s3_objects(dir_path):
+        size += obj_size
     return size
 
 def s3_file_exists(file_path):
@@ -177,46 +238,62 @@ def s3_file_exists(file_path):
 
 def delete_s3_dir(dir_path):
     bucket, path = parse_s3_dir_url(dir_path)
-    s3 = get_s3_resource()
-    for object in s3.Bucket(bucket).objects.filter(Prefix=path).all():
-        object.delete()
+    s3 = get_s3_client()
+    keys = [key for key, size in list_s3_objects(dir_path)]
+    # At most 1000 keys can be deleted by one request.
+    for start in range(0, len(keys), 1000):
+        objects = [{'Key': key} for key in keys[start:start + 1000]]
+        response = s3.delete_objects(Bucket=bucket, Delete={'Objects': objects, 'Quiet': True})
+        errors = response.get('Errors')
+        if errors:
+            message = "fail to delete %d objects under %r: %r" % (len(errors), dir_path, errors[0])
+            raise RuntimeError(message)
 
 def delete_s3_file(file_path):
     bucket, path = parse_s3_url(file_path)
-    s3 = get_s3_resource()
-    s3.Object(bucket, path).delete()
+    s3 = get_s3_client()
+    s3.delete_object(Bucket=bucket, Key=path)
 
 def copy_s3_dir(src_dir_path, dst_dir_path):
     src_bucket, src_dir = parse_s3_dir_url(src_dir_path)
     dst_bucket, dst_dir = parse_s3_dir_url(dst_dir_path)
-    s3 = get_s3_resource()
-    bucket = s3.Bucket(dst_bucket)
-    for item in s3.Bucket(src_bucket).objects.filter(Prefix=src_dir):
-        src = { 'Bucket' : item.bucket_name, 'Key' : item.key }
-        dst = dst_dir + item.key[len(src_dir):]
-        bucket.copy(src, dst)
+    # List before copying, as the destination may be under the source.
+    items = list(list_s3_objects(src_dir_path))
+    def submit_all(manager):
+        futures = []
+        for key, size in items:
+            src = {'Bucket': src_bucket, 'Key': key}
+            dst = dst_dir + key[len(src_dir):]
+            futures.append(manager.copy(src, dst_bucket, dst))
+        return futures
+    _run_s3_transfers(submit_all)
 
 def download_s3_dir(src_dir_path, dst_dir_path):
     import os
-    from . import _metaspore
     src_bucket, src_dir = parse_s3_dir_url(src_dir_path)
-    s3 = get_s3_resource()
-    bucket = s3.Bucket(src_bucket)
-    for item in bucket.objects.filter(Prefix=src_dir):
-        src = item.key
-        dst = os.path.join(dst_dir_path, item.key[len(src_dir):])
-        _metaspore.ensure_local_directory(os.path.dirname(dst))
-        bucket.download_file(src, dst)
+    def submit_all(manager):
+        futures = []
+        for key, size in list_s3_objects(src_dir_path):
+            dst = os.path.join(dst_dir_path, key[len(src_dir):])
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if key.endswith('/'):
+                # Skip directory markers.
+                continue
+            futures.append(manager.download(src_bucket, key, dst))
+        return futures
+    _run_s3_transfers(submit_all)
 
 def upload_s3_dir(src_dir_path, dst_dir_path):
     import os
     if not src_dir_path.endswith('/'):
         src_dir_path += '/'
     dst_bucket, dst_dir = parse_s3_dir_url(dst_dir_path)
-    s3 = get_s3_resource()
-    bucket = s3.Bucket(dst_bucket)
-    for dirpath, dirnames, filenames in os.walk(src_dir_path):
-        for filename in filenames:
-            src = os.path.join(dirpath, filename)
-            dst = dst_dir + src[len(src_dir_path):]
-            bucket.upload_file(src, dst)
+    def submit_all(manager):
+        futures = []
+        for dirpath, dirnames, filenames in os.walk(src_dir_path):
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                dst = dst_dir + src[len(src_dir_path):]
+                futures.append(manager.upload(src, dst_bucket, dst))
+        return futures
+    _run_s3_transfers(submit_all)
@@ -0,0 +1,162 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import threading
+import contextlib
+import numpy
+from datetime import datetime
+
+# Shared no-op context manager returned when profiling is disabled,
+# so that instrumented code only pays for a function call.
+_NULL_PHASE = contextlib.nullcontext()
+
+def profile_phase(profiler, name):
+    if profiler is None:
+        return _NULL_PHASE
+    return profiler.phase(name)
+
+class _Phase(object):
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter_ns() - self._start
+        self._profiler.record(self._name, elapsed)
+        return False
+
+class StepProfiler(object):
+    """Per-phase latency histograms and transfer byte counters of training steps.
+
+    Latencies are kept in log2 histograms of microseconds, bucket ``i``
+    counting latencies in ``[2**(i-1), 2**i)`` microseconds, so that the
+    states of workers can be merged by addition on the coordinator.
+    Recording is thread-safe, as pulls complete on PS threads and
+    minibatches may be prefetched in the background.
+    """
+
+    bucket_count = 32
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = dict()
+        self._pulled_bytes = 0
+        self._pushed_bytes = 0
+
+    def _get_phase_state(self, name):
+        state = self._phases.get(name)
+        if state is None:
+            state = [numpy.zeros(self.bucket_count, dtype=numpy.int64), 0]
+            self._phases[name] = state
+        return state
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def record(self, name, elapsed_ns):
+        bucket = min((elapsed_ns // 1000).bit_length(), self.bucket_count - 1)
+        with self._lock:
+            state = self._get_phase_state(name)
+            state[0][bucket] += 1
+            state[1] += elapsed_ns
+
+    def add_pulled_bytes(self, size):
+        with self._lock:
+            self._pulled_bytes += size
+
+    def add_pushed_bytes(self, size):
+        with self._lock:
+            self._pushed_bytes += size
+
+    @property
+    def phase_names(self):
+        return tuple(self._phases)
+
+    @property
+    def pulled_bytes(self):
+        return self._pulled_bytes
+
+    @property
+    def pushed_bytes(self):
+        return self._pushed_bytes
+
+    @property
+    def is_empty(self):
+        return not self._phases and self._pulled_bytes == 0 and self._pushed_bytes == 0
+
+    def clear(self):
+        with self._lock:
+            self._phases.clear()
+            self._pulled_bytes = 0
+            self._pushed_bytes = 0
+
+    def get_states(self, *, clear=False):
+        with self._lock:
+            names = self.phase_names
+            counts = numpy.zeros((len(names), self.bucket_count), dtype=numpy.int64)
+            totals = numpy.zeros(len(names) + 2, dtype=numpy.int64)
+            for i, name in enumerate(names):
+                counts[i] = self._phases[name][0]
+                totals[i] = self._phases[name][1]
+            totals[-2] = self._pulled_bytes
+            totals[-1] = self._pushed_bytes
+            if clear:
+                self._phases.clear()
+                self._pulled_bytes = 0
+                self._pushed_bytes = 0
+        return names, (counts.reshape(-1), totals)
+
+    def merge_states(self, names, states):
+        counts, totals = states
+        counts = counts.reshape(len(names), self.bucket_count)
+        for i, name in enumerate(names):
+            state = self._get_phase_state(name)
+            state[0] += counts[i]
+            state[1] += int(totals[i])
+        self._pulled_bytes += int(totals[-2])
+        self._pushed_bytes += int(totals[-1])
+
+    def _get_percentile(self, counts, q):
+        # Report the upper bound of the bucket containing the percentile.
+        total = counts.sum()
+        if total == 0:
+            return float('nan')
+        bucket = int(numpy.searchsorted(numpy.cumsum(counts), q * total))
+        return float(2 ** bucket) / 1000.0
+
+    def format(self):
+        header = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        items = []
+        for name, (counts, total) in self._phases.items():
+            n = int(counts.sum())
+            if n == 0:
+                continue
+            mean = total / n / 1e6
+            p50 = self._get_percentile(counts, 0.5)
+            p99 = self._get_percentile(counts, 0.99)
+            items.append(f'{name}: n={n} mean={mean:.3f}ms p50<{p50:g}ms p99<{p99:g}ms')
+        items.append(f'pulled: {self._pulled_bytes / 2 ** 20:.2f}MiB')
+        items.append(f'pushed: {self._pushed_bytes / 2 ** 20:.2f}MiB')
+        string = header + ' -- step profile -- ' + ', '.join(items)
+        return string
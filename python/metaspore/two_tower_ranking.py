@@ -14,7 +14,6 @@
 # limitations under the License.
 #
 
-import asyncio
 import torch
 import pyspark
 from .embedding import EmbeddingOperator
@@ -22,6 +21,7 @@ from .estimator import PyTorchAgent
 from .estimator import PyTorchLauncher
 from .estimator import PyTorchModel
 from .estimator import PyTorchEstimator
+from .async_utils import run_sync
 
 class TwoTowerRankingModule(torch.nn.Module):
     def __init__(self, user_module, item_module, item_embedding_module, similarity_module):
@@ -120,7 +120,7 @@ class TwoTowerRankingAgent(PyTorchAgent):
     @classmethod
     def _pull_model_for_item_predict(cls, _):
         self = __class__.get_instance()
-        asyncio.run(self.model._pull_tensors(force_mode=True))
+        run_sync(self.model._pull_tensors(force_mode=True))
         return _
 
     @classmethod
@@ -215,7 +215,7 @@ class TwoTowerRankingAgent(PyTorchAgent):
             if isinstance(mod, EmbeddingOperator):
                 mod.keys_and_data = keys, embeddings
                 tensor = mod._distributed_tensor
-                asyncio.run(tensor._push_tensor(is_value=True))
+                run_sync(tensor._push_tensor(is_value=True))
                 mod._clean()
                 return
 
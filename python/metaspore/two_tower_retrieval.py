@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 
+import io
 import json
 import torch
 import numpy
@@ -26,6 +27,20 @@ from .estimator import PyTorchModel
 from .estimator import PyTorchEstimator
 from .metric import ModelMetric
 
+class _OutputStreamFile(io.RawIOBase):
+    # File object over ``_metaspore.OutputStream`` for ``pyarrow.PythonFile``,
+    # which tracks the position itself and never seeks when writing.
+    def __init__(self, stream):
+        super().__init__()
+        self._stream = stream
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._stream.write(bytes(data))
+        return len(data)
+
 class TwoTowerRetrievalModule(torch.nn.Module):
     def __init__(self, user_module, item_module, similarity_module):
         super().__init__()
@@ -109,7 +124,8 @@ class TwoTowerIndexBuilder(object):
         if not hasattr(self, '_item_ids_partition_file_name'):
             rank = self.agent.rank
             worker_count = self.agent.worker_count
-            self._item_ids_partition_file_name = 'part_%d_%d.dat' % (worker_count, rank)
+            extension = 'parquet' if self.item_ids_format == 'parquet' else 'dat'
+            self._item_ids_partition_file_name = 'part_%d_%d.%s' % (worker_count, rank, extension)
         return self._item_ids_partition_file_name
 
     @property
@@ -124,6 +140,10 @@ class TwoTowerIndexBuilder(object):
     def have_item_ids_partition_files(self):
         return self.agent.enable_item_id_mapping or self.agent.output_item_embeddings
 
+    @property
+    def item_ids_format(self):
+        return getattr(self.agent, 'item_ids_format', 'csv')
+
     def _make_index_meta(self):
         meta_version = 1
         index_type = self.index_type
@@ -131,6 +151,7 @@ class TwoTowerIndexBuilder(object):
         item_embedding_size = self.agent.item_embedding_size
         item_ids_field_delimiter = self.agent.item_ids_field_delimiter
         item_ids_value_delimiter = self.agent.item_ids_value_delimiter
+        item_ids_format = self.item_ids_format
         enable_item_id_mapping = self.agent.enable_item_id_mapping
         output_item_embeddings = self.agent.output_item_embeddings
         retrieval_item_count = self.agent.retrieval_item_count
@@ -143,6 +164,7 @@ class TwoTowerIndexBuilder(object):
             'item_embedding_size' : item_embedding_size,
             'item_ids_field_delimiter' : item_ids_field_delimiter,
             'item_ids_value_delimiter' : item_ids_value_delimiter,
+            'item_ids_format' : item_ids_format,
             'enable_item_id_mapping': enable_item_id_mapping,
             'output_item_embeddings' : output_item_embeddings,
             'retrieval_item_count' : retrieval_item_count,
@@ -173,8 +195,19 @@ class TwoTowerIndexBuilder(object):
         print("Open %s item ids mapping partition file: %s" % (self.index_type, self.item_ids_partition_path))
         _metaspore.ensure_local_directory(self.item_ids_dir)
         self._item_ids_partition_output_stream = _metaspore.OutputStream(self.item_ids_partition_path)
+        self._item_ids_partition_writer = None
+        if self.item_ids_format == 'parquet':
+            # Batches are written as row groups when they arrive; the footer
+            # is written on close.
+            import pyarrow
+            import pyarrow.parquet
+            sink = pyarrow.PythonFile(_OutputStreamFile(self._item_ids_partition_output_stream), mode='w')
+            self._item_ids_partition_writer = pyarrow.parquet.ParquetWriter(sink, self._make_item_ids_arrow_schema())
 
     def _close_item_ids_partition_output_stream(self):
+        if self._item_ids_partition_writer is not None:
+            self._item_ids_partition_writer.close()
+        self._item_ids_partition_writer = None
         self._item_ids_partition_output_stream = None
 
     def _convert_spark_item_id_column_type(self, data_type):
@@ -241,42 +274,75 @@ class TwoTowerIndexBuilder(object):
         id_ndarray = column.values
         return id_ndarray
 
-    def make_item_ids_mapping_batch(self, minibatch, embeddings, id_ndarray):
+    def _get_item_ids_name_frame(self, minibatch):
         item_ids_column_indices = self.agent.item_ids_column_indices
         item_ids_column_names = self.agent.item_ids_column_names
+        if item_ids_column_indices is not None:
+            return minibatch.iloc[:, list(item_ids_column_indices)]
+        else:
+            return minibatch.loc[:, list(item_ids_column_names)]
+
+    def _make_item_ids_name_column(self, minibatch):
+        # Join the name fields with the value delimiter, null fields being empty.
+        item_ids_value_delimiter = self.agent.item_ids_value_delimiter
+        frame = self._get_item_ids_name_frame(minibatch)
+        frame = frame.astype(object).where(frame.notna(), '').astype(str)
+        column = frame.iloc[:, 0]
+        for k in range(1, frame.shape[1]):
+            column = column + item_ids_value_delimiter + frame.iloc[:, k]
+        return column.values
+
+    def make_item_ids_mapping_batch(self, minibatch, embeddings, id_ndarray):
+        if self.item_ids_format == 'parquet':
+            return self._make_item_ids_arrow_batch(minibatch, embeddings, id_ndarray)
+        else:
+            return self._make_item_ids_csv_batch(minibatch, embeddings, id_ndarray)
+
+    def _make_item_ids_csv_batch(self, minibatch, embeddings, id_ndarray):
         item_ids_field_delimiter = self.agent.item_ids_field_delimiter
         item_ids_value_delimiter = self.agent.item_ids_value_delimiter
         enable_item_id_mapping = self.agent.enable_item_id_mapping
         output_item_embeddings = self.agent.output_item_embeddings
-        ids_data = ''
-        for i in range(len(id_ndarray)):
-            ids_data += str(id_ndarray[i])
-            ids_data += item_ids_field_delimiter
-            if enable_item_id_mapping:
-                if item_ids_column_indices is not None:
-                    for j, index in enumerate(item_ids_column_indices):
-                        if j > 0:
-                            ids_data += item_ids_value_delimiter
-                        field = minibatch.iloc[i, index]
-                        if field is not None:
-                            ids_data += str(field)
-                else:
-                    for j, column_name in enumerate(item_ids_column_names):
-                        if j > 0:
-                            ids_data += item_ids_value_delimiter
-                        field = minibatch.loc[i, column_name]
-                        if field is not None:
-                            ids_data += str(field)
-            if output_item_embeddings:
-                ids_data += item_ids_field_delimiter
-                for k, value in enumerate(embeddings[i]):
-                    if k > 0:
-                        ids_data += item_ids_value_delimiter
-                    ids_data += str(value)
-            ids_data += '\n'
-        return ids_data
+        columns = [numpy.asarray(id_ndarray).astype(str)]
+        if enable_item_id_mapping:
+            columns.append(self._make_item_ids_name_column(minibatch))
+        if output_item_embeddings:
+            values = numpy.asarray(embeddings).astype(str)
+            columns.append([item_ids_value_delimiter.join(row) for row in values])
+        lines = [item_ids_field_delimiter.join(fields) for fields in zip(*columns)]
+        if not lines:
+            return ''
+        return '\n'.join(lines) + '\n'
+
+    def _make_item_ids_arrow_schema(self):
+        import pyarrow
+        fields = []
+        if self.agent.enable_item_id_mapping:
+            fields.append(pyarrow.field('id', pyarrow.int64()))
+            fields.append(pyarrow.field('name', pyarrow.string()))
+        else:
+            id_type = pyarrow.int64() if self.item_id_column_type == 'int64' else pyarrow.string()
+            fields.append(pyarrow.field('id', id_type))
+        if self.agent.output_item_embeddings:
+            fields.append(pyarrow.field('item_embedding', pyarrow.list_(pyarrow.float32())))
+        return pyarrow.schema(fields)
+
+    def _make_item_ids_arrow_batch(self, minibatch, embeddings, id_ndarray):
+        import pyarrow
+        schema = self._make_item_ids_arrow_schema()
+        arrays = [pyarrow.array(id_ndarray, type=schema.field('id').type)]
+        if self.agent.enable_item_id_mapping:
+            arrays.append(pyarrow.array(self._make_item_ids_name_column(minibatch), type=pyarrow.string()))
+        if self.agent.output_item_embeddings:
+            values = numpy.ascontiguousarray(embeddings, dtype=numpy.float32)
+            offsets = numpy.arange(0, values.size + 1, values.shape[1], dtype=numpy.int32)
+            arrays.append(pyarrow.ListArray.from_arrays(offsets, values.reshape(-1)))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
 
     def output_item_ids_mapping_batch(self, ids_data):
+        if self.item_ids_format == 'parquet':
+            self._item_ids_partition_writer.write_batch(ids_data)
+            return
         ids_data = ids_data.encode('utf-8')
         self._item_ids_partition_output_stream.write(ids_data)
 
@@ -312,6 +378,10 @@ class TwoTowerIndexBuilder(object):
             return None
         spark = self.agent.spark_session
         schema = self._make_item_ids_schema(meta)
+        if meta.get('item_ids_format', 'csv') == 'parquet':
+            from .url_utils import use_s3a
+            df = spark.read.parquet(use_s3a(self.item_ids_dir))
+            return df.select(*[df[field.name].cast(field.dataType) for field in schema.fields])
         df = read_s3_csv(spark, self.item_ids_dir,
                          schema=schema,
                          delimiter=item_ids_field_delimiter,
@@ -364,6 +434,16 @@ class TwoTowerFaissIndexBuilder(TwoTowerIndexBuilder):
             raise TypeError(f"faiss_metric_type must be non-empty string; {self.faiss_metric_type!r} is invalid")
         if not isinstance(getattr(faiss, self.faiss_metric_type, None), int):
             raise ValueError(f"faiss_metric_type must specify a valid Faiss metric type; {self.faiss_metric_type!r} is invalid")
+        # With ``faiss_mmap_cache_dir``, index partitions are copied to this
+        # local directory and memory-mapped. Faiss maps the inverted lists of
+        # IVF indices only, so the option is ignored for other indices,
+        # which are read in memory.
+        self.faiss_mmap_cache_dir = getattr(agent, 'faiss_mmap_cache_dir', None)
+        self.faiss_search_threads = getattr(agent, 'faiss_search_threads', None)
+        if self.faiss_mmap_cache_dir is not None and (not isinstance(self.faiss_mmap_cache_dir, str) or not self.faiss_mmap_cache_dir):
+            raise TypeError(f"faiss_mmap_cache_dir must be non-empty string; {self.faiss_mmap_cache_dir!r} is invalid")
+        if self.faiss_search_threads is not None and (not isinstance(self.faiss_search_threads, int) or self.faiss_search_threads <= 0):
+            raise TypeError(f"faiss_search_threads must be positive integer; {self.faiss_search_threads!r} is invalid")
 
     @property
     def item_index_dir(self):
@@ -393,8 +473,17 @@ class TwoTowerFaissIndexBuilder(TwoTowerIndexBuilder):
         meta = super()._make_index_meta()
         meta['faiss_index_description'] = self.faiss_index_description
         meta['faiss_metric_type'] = self.faiss_metric_type
+        meta['faiss_index_build_id'] = self._get_faiss_index_build_id()
         return meta
 
+    def _get_faiss_index_build_id(self):
+        # Identify the index files of this build, so that stale copies in
+        # ``faiss_mmap_cache_dir`` are never mapped after a rebuild.
+        if not hasattr(self, '_faiss_index_build_id'):
+            import uuid
+            self._faiss_index_build_id = uuid.uuid4().hex
+        return self._faiss_index_build_id
+
     def _get_index_pattition_path(self, item_index_dir, partition_count, rank):
         partition_path = '%spart_%d_%d.dat' % (item_index_dir, partition_count, rank)
         return partition_path
@@ -437,19 +526,83 @@ class TwoTowerFaissIndexBuilder(TwoTowerIndexBuilder):
     def output_item_embedding_batch(self, minibatch, embeddings, id_ndarray):
         self._faiss_index.add_with_ids(embeddings, id_ndarray)
 
+    def _get_faiss_mmap_cache_dir(self, meta):
+        import os
+        import tempfile
+        build_id = meta.get('faiss_index_build_id')
+        if build_id is None:
+            # Indices built before the build id was recorded can not be
+            # identified, so they are cached in a private directory,
+            # which is removed when the index is unloaded.
+            os.makedirs(self.faiss_mmap_cache_dir, exist_ok=True)
+            self._faiss_mmap_private_dir = tempfile.mkdtemp(dir=self.faiss_mmap_cache_dir)
+            return self._faiss_mmap_private_dir
+        cache_dir = os.path.join(self.faiss_mmap_cache_dir, self.index_type, build_id)
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+    def _cache_faiss_index_partition(self, index_partition_path, cache_dir):
+        import os
+        import tempfile
+        file_name = index_partition_path.rsplit('/', 1)[-1]
+        local_path = os.path.join(cache_dir, file_name)
+        if os.path.isfile(local_path):
+            return local_path
+        # Workers on the same host may cache the partition concurrently;
+        # the complete file is renamed into place atomically.
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.' + file_name)
+        try:
+            item_index_stream = _metaspore.InputStream(index_partition_path)
+            with os.fdopen(fd, 'wb') as fout:
+                while True:
+                    data = item_index_stream.read(64 * 1024 * 1024)
+                    if not data:
+                        break
+                    fout.write(data)
+            os.replace(temp_path, local_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return local_path
+
+    def _is_faiss_ivf_index(self, meta):
+        # Coarse quantizers of IVF indices are specified as ``IVF...`` or
+        # ``IMI...`` components of the index factory string.
+        description = meta.get('faiss_index_description', '')
+        components = description.upper().split(',')
+        return any(c.strip().startswith(('IVF', 'IMI')) for c in components)
+
+    def _read_faiss_index_partition(self, index_partition_path, cache_dir):
+        if cache_dir is not None:
+            # Memory-map the local copy, so that the pages are loaded on demand
+            # and shared by the workers on the same host.
+            local_path = self._cache_faiss_index_partition(index_partition_path, cache_dir)
+            return faiss.read_index(local_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        item_index_stream = _metaspore.InputStream(index_partition_path)
+        item_index_reader = faiss.PyCallbackIOReader(item_index_stream.read)
+        index = faiss.read_index(item_index_reader)
+        return index
+
     def _load_faiss_index(self):
         item_index_dir = self.item_index_dir
         meta = self.get_index_meta()
         partition_count = meta['partition_count']
         item_embedding_size = meta['item_embedding_size']
+        if self.faiss_search_threads is not None:
+            faiss.omp_set_num_threads(self.faiss_search_threads)
+        cache_dir = None
+        if self.faiss_mmap_cache_dir is not None:
+            if self._is_faiss_ivf_index(meta):
+                cache_dir = self._get_faiss_mmap_cache_dir(meta)
+            else:
+                description = meta.get('faiss_index_description')
+                print('faiss_mmap_cache_dir is ignored for non-IVF index %r, '
+                      'only the inverted lists of IVF indices can be memory-mapped' % description)
         self._faiss_index = faiss.IndexShards(item_embedding_size, True, False)
         for rank in range(partition_count):
             index_partition_path = self._get_index_pattition_path(item_index_dir, partition_count, rank)
-            item_index_stream = _metaspore.InputStream(index_partition_path)
-            item_index_reader = faiss.PyCallbackIOReader(item_index_stream.read)
-            index = faiss.read_index(item_index_reader)
+            index = self._read_faiss_index_partition(index_partition_path, cache_dir)
             self._faiss_index.add_shard(index)
-            item_index_stream = None
         print('faiss index ntotal: %d' % self._faiss_index.ntotal)
 
     def search_item_embedding_batch(self, embeddings):
@@ -463,6 +616,11 @@ class TwoTowerFaissIndexBuilder(TwoTowerIndexBuilder):
 
     def _unload_faiss_index(self):
         del self._faiss_index
+        private_dir = getattr(self, '_faiss_mmap_private_dir', None)
+        if private_dir is not None:
+            import shutil
+            shutil.rmtree(private_dir, ignore_errors=True)
+            self._faiss_mmap_private_dir = None
 
     def begin_creating_index_partition(self):
         super().begin_creating_index_partition()
@@ -1045,6 +1203,7 @@ class TwoTowerRetrievalHelperMixin(object):
                  item_ids_column_names=None,
                  item_ids_field_delimiter='\002',
                  item_ids_value_delimiter='\001',
+                 item_ids_format='csv',
                  enable_item_id_mapping=False,
                  output_item_embeddings=False,
                  output_user_embeddings=False,
@@ -1064,6 +1223,7 @@ class TwoTowerRetrievalHelperMixin(object):
         self.item_ids_column_names = item_ids_column_names
         self.item_ids_field_delimiter = item_ids_field_delimiter
         self.item_ids_value_delimiter = item_ids_value_delimiter
+        self.item_ids_format = item_ids_format
         self.enable_item_id_mapping = enable_item_id_mapping
         self.output_item_embeddings = output_item_embeddings
         self.output_user_embeddings = output_user_embeddings
@@ -1077,6 +1237,7 @@ class TwoTowerRetrievalHelperMixin(object):
         self.extra_agent_attributes['item_ids_column_names'] = self.item_ids_column_names
         self.extra_agent_attributes['item_ids_field_delimiter'] = self.item_ids_field_delimiter
         self.extra_agent_attributes['item_ids_value_delimiter'] = self.item_ids_value_delimiter
+        self.extra_agent_attributes['item_ids_format'] = self.item_ids_format
         self.extra_agent_attributes['enable_item_id_mapping'] = self.enable_item_id_mapping
         self.extra_agent_attributes['output_item_embeddings'] = self.output_item_embeddings
         self.extra_agent_attributes['output_user_embeddings'] = self.output_user_embeddings
@@ -1115,6 +1276,8 @@ class TwoTowerRetrievalHelperMixin(object):
             raise TypeError(f"item_ids_field_delimiter must be string of length 1; {self.item_ids_field_delimiter!r} is invalid")
         if not isinstance(self.item_ids_value_delimiter, str) or len(self.item_ids_value_delimiter) != 1:
             raise TypeError(f"item_ids_value_delimiter must be string of length 1; {self.item_ids_value_delimiter!r} is invalid")
+        if self.item_ids_format not in ('csv', 'parquet'):
+            raise ValueError(f"item_ids_format must be one of: 'csv', 'parquet'; {self.item_ids_format!r} is invalid")
         if not isinstance(self.increasing_id_column_name, str) or not self.increasing_id_column_name:
             raise TypeError(f"increasing_id_column_name must be non-empty string; {self.increasing_id_column_name!r} is invalid")
         if not isinstance(self.recommendation_info_column_name, str) or not self.recommendation_info_column_name:
@@ -1153,6 +1316,7 @@ class TwoTowerRetrievalHelperMixin(object):
         args['item_ids_column_names'] = self.item_ids_column_names
         args['item_ids_field_delimiter'] = self.item_ids_field_delimiter
         args['item_ids_value_delimiter'] = self.item_ids_value_delimiter
+        args['item_ids_format'] = self.item_ids_format
         args['enable_item_id_mapping'] = self.enable_item_id_mapping
         args['output_item_embeddings'] = self.output_item_embeddings
         args['output_user_embeddings'] = self.output_user_embeddings
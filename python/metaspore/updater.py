@@ -18,6 +18,7 @@ import abc
 import operator
 import torch
 import numpy
+from ._metaspore import SparseUpdaterKernels
 
 class TensorUpdater(abc.ABC):
     def __init__(self, learning_rate):
@@ -92,9 +93,43 @@ class TensorUpdater(abc.ABC):
     def update_sparse(self, name, param, grad, state, indices, keys):
         raise NotImplementedError
 
+    @staticmethod
+    def _is_native_row_view(arr, dtype, writeable):
+        # The kernels take 2-D arrays whose rows may be strided but whose
+        # columns are contiguous, as is.
+        if arr.dtype != dtype or arr.ndim != 2 or arr.strides[1] != arr.itemsize:
+            return False
+        return arr.flags.aligned and (arr.flags.writeable or not writeable)
+
+    def _can_update_sparse_natively(self, class_, param, grad, state, indices):
+        # Subclasses overriding ``update_sparse`` keep running their Python code.
+        if type(self).update_sparse is not class_.update_sparse:
+            return False
+        # Arrays the kernels could only use after a conversion, which would
+        # update a temporary copy, are left to the Python code.
+        if param.dtype not in (numpy.float32, numpy.float64):
+            return False
+        if not self._is_native_row_view(param, param.dtype, True):
+            return False
+        if not self._is_native_row_view(grad, param.dtype, False):
+            return False
+        if state is not None and not self._is_native_row_view(state, param.dtype, True):
+            return False
+        if indices.dtype != numpy.uint64 or indices.ndim != 1 or not indices.flags.c_contiguous:
+            return False
+        return True
+
+    def _update_sparse_natively(self, name, param, grad, state, indices, keys):
+        # Built-in updaters override this method to run their fused native
+        # kernel and return True; the Python ``update_sparse`` is used otherwise.
+        return False
+
     def __call__(self, name, param, grad, state, indices, keys):
         if grad.size == 0:
             return
+        if indices is not None:
+            if self._update_sparse_natively(name, param, grad, state, indices, keys):
+                return
         param = torch.from_numpy(param)
         grad = torch.from_numpy(grad)
         if state is not None:
@@ -128,6 +163,12 @@ class SGDTensorUpdater(TensorUpdater):
     def update_sparse(self, name, param, grad, state, indices, keys):
         param[indices] -= self.learning_rate * grad
 
+    def _update_sparse_natively(self, name, param, grad, state, indices, keys):
+        if not self._can_update_sparse_natively(SGDTensorUpdater, param, grad, state, indices):
+            return False
+        SparseUpdaterKernels.update_sgd(param, grad, indices, self.learning_rate)
+        return True
+
 class AdaGradTensorUpdater(TensorUpdater):
     def __init__(self, learning_rate, float_stable_eps=0.0, l2=0.0):
         super().__init__(learning_rate)
@@ -172,6 +213,13 @@ class AdaGradTensorUpdater(TensorUpdater):
         square_sum[indices] += grad_tmp * grad_tmp
         param[indices] -= self.learning_rate * grad_tmp / (square_sum[indices] + self.float_stable_eps).sqrt()
 
+    def _update_sparse_natively(self, name, param, grad, state, indices, keys):
+        if not self._can_update_sparse_natively(AdaGradTensorUpdater, param, grad, state, indices):
+            return False
+        SparseUpdaterKernels.update_adagrad(param, grad, state, indices,
+                                            self.learning_rate, self.float_stable_eps, self.l2)
+        return True
+
 class AdamTensorUpdater(TensorUpdater):
     def __init__(self, learning_rate, beta1=0.9, beta2=0.999, epsilon=1e-8):
         super().__init__(learning_rate)
@@ -216,6 +264,13 @@ class AdamTensorUpdater(TensorUpdater):
         v[indices] = self._beta2 * v[indices] + (1.0 - self._beta2) * grad * grad
         param[indices] -= self.learning_rate * m[indices] / (v[indices].sqrt() + self._epsilon)
 
+    def _update_sparse_natively(self, name, param, grad, state, indices, keys):
+        if not self._can_update_sparse_natively(AdamTensorUpdater, param, grad, state, indices):
+            return False
+        SparseUpdaterKernels.update_adam(param, grad, state, indices,
+                                         self.learning_rate, self._beta1, self._beta2, self._epsilon)
+        return True
+
 class AdamWTensorUpdater(TensorUpdater):
     def __init__(self, learning_rate, beta1=0.9, beta2=0.999, epsilon=1e-8, weight_decay=1e-2, amsgrad=False):
         super().__init__(learning_rate)
@@ -328,7 +383,7 @@ class FTRLTensorUpdater(TensorUpdater):
             -(z - torch.sign(z) * self._l1) / ((self._beta + n.sqrt()) / self._alpha + self._l2))
 
     def _sign(self, x):
-        return torch.where(x > 0.0, torch.tensor(1.0), torch.tensor(-1.0))
+        return torch.where(x > 0.0, torch.tensor(1.0, dtype=x.dtype), torch.tensor(-1.0, dtype=x.dtype))
 
     def update_sparse(self, name, param, grad, state, indices, keys):
         n = self.get_sparse_state_tensor(state, 0)
@@ -342,6 +397,13 @@ class FTRLTensorUpdater(TensorUpdater):
         condition = torch.abs(z[indices]) <= self._l1
         param[indices] = torch.where(condition, x, y)
 
+    def _update_sparse_natively(self, name, param, grad, state, indices, keys):
+        if not self._can_update_sparse_natively(FTRLTensorUpdater, param, grad, state, indices):
+            return False
+        SparseUpdaterKernels.update_ftrl(param, grad, state, indices,
+                                         self._l1, self._l2, self._alpha, self._beta)
+        return True
+
 # Exponential Moving Average tensor updater
 # Useful for running_mean and running_var of BatchNorm operators.
 # This is a very special updater.
@@ -17,11 +17,15 @@
 import argparse
 import asyncio
 import base64
+import bisect
 import collections
+import contextlib
 import dataclasses
+import hashlib
 import json
 import logging
 import os
+import shutil
 import sys
 import traceback
 
@@ -56,6 +60,231 @@ class DecodedConsulKeyChange:
     Session: str
     Value: ModelInfo
 
+class ModelDownloader():
+    """Download model directories from S3 with parallel ranged GETs.
+
+    Downloaded files are kept in a content-addressed cache under
+    ``cache_dir``, keyed by their ETag and size, and hard linked into the
+    model directories, so that files unchanged across versions are
+    downloaded once. Chunks of interrupted downloads are kept and not
+    fetched again. At most ``concurrency`` requests run at the same time.
+
+    Cached files whose link count dropped to 1 are not used by any model
+    directory any more, as old versions were removed. After each download,
+    they are evicted least recently unlinked first, until their total size
+    is at most ``cache_max_size``.
+    """
+
+    def __init__(self, cache_dir, concurrency, chunk_size, endpoint_url=None, cache_max_size=0):
+        self._cache_dir = cache_dir
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chunk_size = chunk_size
+        self._endpoint_url = endpoint_url
+        self._cache_max_size = cache_max_size
+        self._client = None
+        self._file_locks = dict()
+        # Cache paths of the running downloads, which are not evicted
+        # before they are linked into the model directories.
+        self._pinned_paths = collections.Counter()
+
+    def _get_client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=self._endpoint_url)
+        return self._client
+
+    async def _call(self, func, *args, **kwargs):
+        # boto3 is synchronous; run the requests in the default thread pool.
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+    def _parse_s3_path(self, path):
+        if not path.startswith(('s3://', 's3a://')):
+            message = f"model path must be an S3 url; {path!r} is invalid"
+            raise RuntimeError(message)
+        bucket, _, prefix = path.split('://', 1)[1].partition('/')
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return bucket, prefix
+
+    def _list_objects(self, bucket, prefix):
+        client = self._get_client()
+        paginator = client.get_paginator('list_objects_v2')
+        objects = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                if item['Key'].endswith('/'):
+                    continue
+                objects.append((item['Key'][len(prefix):], item['Size'], item['ETag'].strip('"')))
+        return objects
+
+    def _get_cache_path(self, size, etag):
+        digest = hashlib.sha256(f'{etag}:{size}'.encode('utf-8')).hexdigest()
+        return os.path.join(self._cache_dir, digest[:2], digest)
+
+    def _get_range(self, bucket, key, etag, byte_range):
+        client = self._get_client()
+        response = client.get_object(Bucket=bucket, Key=key, Range=byte_range, IfMatch='"%s"' % etag)
+        return response['Body'].read()
+
+    async def _download_chunk(self, bucket, key, etag, fd, offset, length):
+        byte_range = 'bytes=%d-%d' % (offset, offset + length - 1)
+        data = await self._call(self._get_range, bucket, key, etag, byte_range)
+        if len(data) != length:
+            message = f"incomplete chunk {byte_range} of s3://{bucket}/{key}; {len(data)} bytes received"
+            raise RuntimeError(message)
+        os.pwrite(fd, data, offset)
+
+    @contextlib.asynccontextmanager
+    async def _lock_file(self, cache_path):
+        # Locks are dropped when no download waits for them any more, so
+        # that they do not accumulate for every file ever downloaded.
+        entry = self._file_locks.get(cache_path)
+        if entry is None:
+            entry = self._file_locks[cache_path] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._file_locks[cache_path]
+
+    @staticmethod
+    def _read_done_ranges(done_path):
+        # The .done file lists the byte ranges already written to the .part
+        # file as "offset,length" lines; they do not depend on the chunk
+        # size, which may change between runs. A line cut short by an
+        # interruption is ignored.
+        ranges = []
+        with open(done_path) as fin:
+            for line in fin:
+                if not line.endswith('\n'):
+                    continue
+                fields = line.strip().split(',')
+                if len(fields) == 2 and all(field.isdigit() for field in fields):
+                    offset, length = map(int, fields)
+                    ranges.append((offset, offset + length))
+        ranges.sort()
+        merged = []
+        for begin, end in ranges:
+            if merged and begin <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([begin, end])
+        return merged
+
+    @staticmethod
+    def _is_range_done(merged, offset, length):
+        index = bisect.bisect_right(merged, [offset, float('inf')]) - 1
+        return index >= 0 and merged[index][1] >= offset + length
+
+    async def _download_file(self, bucket, key, size, etag, cache_path):
+        async with self._lock_file(cache_path):
+            if os.path.isfile(cache_path):
+                return
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            part_path = cache_path + '.part'
+            done_path = cache_path + '.done'
+            merged = []
+            if os.path.isfile(part_path) and os.path.isfile(done_path):
+                merged = self._read_done_ranges(done_path)
+            elif os.path.isfile(done_path):
+                os.remove(done_path)
+            fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                with open(done_path, 'a') as done_file:
+                    async def download(offset, length):
+                        await self._download_chunk(bucket, key, etag, fd, offset, length)
+                        # Record finished ranges, so that an interrupted download resumes.
+                        done_file.write('%d,%d\n' % (offset, length))
+                        done_file.flush()
+                    chunks = [(offset, min(self._chunk_size, size - offset))
+                              for offset in range(0, size, self._chunk_size)]
+                    await asyncio.gather(*[download(offset, length) for offset, length in chunks
+                                           if not self._is_range_done(merged, offset, length)])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(part_path, cache_path)
+            os.remove(done_path)
+
+    def _link_file(self, cache_path, local_file_path):
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+        if os.path.lexists(local_file_path):
+            if os.path.samefile(cache_path, local_file_path):
+                return
+            os.remove(local_file_path)
+        try:
+            os.link(cache_path, local_file_path)
+        except OSError:
+            shutil.copyfile(cache_path, local_file_path)
+
+    def _delete_extra_files(self, local_path, names):
+        expected = set(os.path.normpath(os.path.join(local_path, name)) for name in names)
+        for dir_path, _, file_names in os.walk(local_path):
+            for file_name in file_names:
+                file_path = os.path.normpath(os.path.join(dir_path, file_name))
+                if file_path not in expected:
+                    os.remove(file_path)
+
+    def _evict_unlinked_files(self):
+        # Runs on the event loop thread, so that no download pins a path or
+        # finds it cached while the cache is scanned.
+        entries = []
+        total_size = 0
+        for dir_path, _, file_names in os.walk(self._cache_dir):
+            for file_name in file_names:
+                if file_name.endswith(('.part', '.done')):
+                    continue
+                file_path = os.path.join(dir_path, file_name)
+                if file_path in self._pinned_paths:
+                    continue
+                try:
+                    st = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                if st.st_nlink == 1:
+                    # The change time of the inode is updated when its last
+                    # model directory link is removed.
+                    entries.append((st.st_ctime, st.st_size, file_path))
+                    total_size += st.st_size
+        entries.sort()
+        for _, size, file_path in entries:
+            if total_size <= self._cache_max_size:
+                break
+            os.remove(file_path)
+            total_size -= size
+
+    async def download(self, path, local_path):
+        """Make ``local_path`` a copy of the S3 directory ``path``; return the number of bytes fetched."""
+        bucket, prefix = self._parse_s3_path(path)
+        objects = await self._call(self._list_objects, bucket, prefix)
+        cache_paths = [self._get_cache_path(size, etag) for _, size, etag in objects]
+        self._pinned_paths.update(cache_paths)
+        try:
+            os.makedirs(local_path, exist_ok=True)
+            fetched = 0
+            tasks = []
+            for (name, size, etag), cache_path in zip(objects, cache_paths):
+                if not os.path.isfile(cache_path):
+                    fetched += size
+                    tasks.append(self._download_file(bucket, prefix + name, size, etag, cache_path))
+            await asyncio.gather(*tasks)
+            for (name, _, _), cache_path in zip(objects, cache_paths):
+                self._link_file(cache_path, os.path.join(local_path, name))
+            self._delete_extra_files(local_path, [name for name, _, _ in objects])
+        finally:
+            for cache_path in cache_paths:
+                self._pinned_paths[cache_path] -= 1
+                if self._pinned_paths[cache_path] == 0:
+                    del self._pinned_paths[cache_path]
+        self._evict_unlinked_files()
+        return fetched
+
 class ModelWatcher():
     def __init__(self):
         self._key_info_dict = {}
@@ -72,6 +301,25 @@ class ModelWatcher():
                             help=f"model root dir; default to {default_model_root!r}")
         parser.add_argument('--notify-port', type=int,
                             help=f"model load notify port; default to {default_notify_port!r}")
+        parser.add_argument('--downloader', type=str, choices=('awscli', 'native'), default='awscli',
+                            help="download models with 'aws s3 sync' or with the native parallel downloader, "
+                                 "which caches files by content and resumes interrupted downloads")
+        parser.add_argument('--cache-dir', type=str,
+                            help="content-addressed file cache of the native downloader; "
+                                 "default to '.cache/' under the model root")
+        parser.add_argument('--cache-max-size', type=int, default=0,
+                            help="total size in bytes of the cached files no model directory links to "
+                                 "kept by the native downloader, for rollbacks; default to 0")
+        parser.add_argument('--download-concurrency', type=int, default=16,
+                            help="maximum number of concurrent S3 requests of the native downloader")
+        parser.add_argument('--download-chunk-size', type=int, default=64 * 1024 * 1024,
+                            help="size in bytes of the ranged GETs of the native downloader")
+        parser.add_argument('--s3-endpoint', type=str,
+                            help="endpoint url of an S3 compatible storage for the native downloader")
+        parser.add_argument('--warmup-cmd', type=str,
+                            help="optional command run after downloading and before notifying the service, "
+                                 "with the environment variables MODEL_NAME, MODEL_VERSION and MODEL_DIR; "
+                                 "the service is not notified if it fails")
         args, left = parser.parse_known_args()
         sys.argv = sys.argv[:1] + left
 
@@ -93,6 +341,25 @@ class ModelWatcher():
             self._notify_port = default_notify_port
             print(f'Using default notify port {self._notify_port!r}', file=sys.stderr)
 
+        if args.download_concurrency <= 0:
+            message = f"download concurrency must be positive integer; {args.download_concurrency!r} is invalid"
+            raise RuntimeError(message)
+        if args.download_chunk_size <= 0:
+            message = f"download chunk size must be positive integer; {args.download_chunk_size!r} is invalid"
+            raise RuntimeError(message)
+        if args.cache_max_size < 0:
+            message = f"cache max size must be non-negative integer; {args.cache_max_size!r} is invalid"
+            raise RuntimeError(message)
+        self._downloader = None
+        if args.downloader == 'native':
+            cache_dir = args.cache_dir
+            if cache_dir is None:
+                cache_dir = os.path.join(self._model_root, '.cache')
+            self._downloader = ModelDownloader(cache_dir, args.download_concurrency,
+                                               args.download_chunk_size, args.s3_endpoint,
+                                               args.cache_max_size)
+        self._warmup_cmd = args.warmup_cmd
+
         pod_ip = os.environ.get('POD_IP')
         if pod_ip is None:
             pod_ip = '127.0.0.1'
@@ -189,6 +456,16 @@ class ModelWatcher():
     async def _download_model(self, model_info):
         self._logger.info('Downloading model %s', model_info, extra=self._log_extra)
         local_path = self._get_model_local_path(model_info)
+        if self._downloader is not None:
+            try:
+                fetched = await self._downloader.download(model_info.path, local_path)
+                self._logger.info('Successfully downloaded model %s, %d bytes fetched',
+                                  model_info, fetched, extra=self._log_extra)
+                return True
+            except Exception:
+                traceback.print_exc()
+                self._logger.error('Fail to download model %s', model_info, extra=self._log_extra)
+                return False
         proc = await asyncio.create_subprocess_exec(
                 'aws', 's3', 'sync', '--delete', model_info.path, local_path)
         retcode = await proc.wait()
@@ -199,6 +476,23 @@ class ModelWatcher():
             self._logger.error('Fail to download model %s', model_info, extra=self._log_extra)
             return False
 
+    async def _warm_up_model(self, model_info):
+        if self._warmup_cmd is None:
+            return True
+        self._logger.info('Warming up model %s', model_info, extra=self._log_extra)
+        env = dict(os.environ)
+        env['MODEL_NAME'] = model_info.name
+        env['MODEL_VERSION'] = model_info.version
+        env['MODEL_DIR'] = self._get_model_local_path(model_info)
+        proc = await asyncio.create_subprocess_shell(self._warmup_cmd, env=env)
+        retcode = await proc.wait()
+        if retcode == 0:
+            self._logger.info('Successfully warmed up model %s', model_info, extra=self._log_extra)
+            return True
+        else:
+            self._logger.error('Fail to warm up model %s', model_info, extra=self._log_extra)
+            return False
+
     async def _notify_loading_model(self, model_info):
         import grpc
         import metaspore_pb2
@@ -227,6 +521,9 @@ class ModelWatcher():
         key_info = DecodedConsulKeyChange(**kwargs)
         async with self._key_lock_dict[key_info.Key]:
             succ = await self._download_model(model_info)
+            if not succ:
+                return
+            succ = await self._warm_up_model(model_info)
             if not succ:
                 return
             succ = await self._notify_loading_model(model_info)
@@ -40,3 +40,8 @@ class ExamplePreprocessor(object):
         outputs['output_key1'] = output1
         outputs['output_key2'] = output2
         return outputs
+
+    def predict_batch(self, batch):
+        # Optional; called with the inputs of concurrent requests when the
+        # service runs with --max-batch-size greater than 1.
+        return [self.predict(inputs) for inputs in batch]
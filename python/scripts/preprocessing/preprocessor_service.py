@@ -18,77 +18,260 @@ import os
 import sys
 import importlib
 import inspect
+import time
 import argparse
 import asyncio
+import concurrent.futures
+import multiprocessing
 import grpc
 import metaspore_pb2
 import metaspore_pb2_grpc
 import numpy as np
 import pyarrow as pa
 
+def find_preprocessor_class(config_dir):
+    sys.path.insert(0, config_dir)
+    module = importlib.import_module('preprocessor')
+    preprocessor_classes = []
+    for name in dir(module):
+        if name.endswith('Preprocessor'):
+            item = getattr(module, name)
+            if isinstance(item, type):
+                preprocessor_classes.append(item)
+    py_path = os.path.join(config_dir, 'preprocessor.py')
+    if not preprocessor_classes:
+        message = "no preprocessor class found in %r" % py_path
+        raise RuntimeError(message)
+    if len(preprocessor_classes) == 1:
+        return preprocessor_classes[0]
+    exported = getattr(module, '__all__', None)
+    if exported is not None:
+        candicates = [c for c in preprocessor_classes if c.__name__ in exported]
+        if len(candicates) == 1:
+            return candicates[0]
+    message = "more than one preprocessor classes found in %r" % py_path
+    raise RuntimeError(message)
+
+def load_preprocessor(config_dir):
+    preprocessor_class = find_preprocessor_class(config_dir)
+    return preprocessor_class(config_dir)
+
+def _encode_tensor(tensor):
+    sink = pa.BufferOutputStream()
+    buf = pa.ipc.write_tensor(tensor, sink)
+    bs = sink.getvalue().to_pybytes()
+    return bs
+
+def _encode_ndarray(arr):
+    tensor = pa.Tensor.from_numpy(arr)
+    return _encode_tensor(tensor)
+
+def _is_torch_tensor(value):
+    try:
+        import torch
+        return isinstance(value, torch.Tensor)
+    except ImportError:
+        return False
+
+def encode_outputs(outputs, output_names):
+    if not isinstance(outputs, dict):
+        message = f"outputs must be dict; {outputs!r} is invalid"
+        raise TypeError(message)
+    if not all(isinstance(k, str) for k in outputs.keys()):
+        message = f"all keys of outputs must be string; {outputs!r} is invalid"
+        raise TypeError(message)
+    for name in output_names:
+        if name not in outputs:
+            message = f"declared output {name!r} not found in outputs; "
+            message += f"{outputs!r} is invalid"
+            raise ValueError(message)
+    if all(isinstance(v, bytes) for v in outputs.values()):
+        return outputs
+    payload = dict()
+    for name, value in outputs.items():
+        if isinstance(value, bytes):
+            payload[name] = value
+        elif isinstance(value, pa.Tensor):
+            payload[name] = _encode_tensor(value)
+        elif isinstance(value, np.ndarray):
+            payload[name] = _encode_ndarray(value)
+        elif _is_torch_tensor(value):
+            payload[name] = _encode_ndarray(value.numpy())
+        else:
+            message = f"output {name!r} must be bytes, pa.Tensor, np.ndarray or torch.Tensor; "
+            message += f"{value!r} is invalid"
+            raise TypeError(message)
+    return payload
+
+def run_predict(preprocessor_object, inputs):
+    outputs = preprocessor_object.predict(inputs)
+    return encode_outputs(outputs, preprocessor_object.output_names)
+
+def run_predict_batch(preprocessor_object, batch):
+    # ``predict_batch`` takes the list of the inputs of the coalesced
+    # requests and returns the list of their outputs in the same order.
+    outputs_list = preprocessor_object.predict_batch(batch)
+    if len(outputs_list) != len(batch):
+        message = f"predict_batch must return {len(batch)} outputs; "
+        message += f"{len(outputs_list)} outputs are returned"
+        raise ValueError(message)
+    return [encode_outputs(outputs, preprocessor_object.output_names) for outputs in outputs_list]
+
+# The preprocessor object of the worker processes of the process pool.
+_worker_preprocessor_object = None
+
+def _init_worker_process(config_dir):
+    global _worker_preprocessor_object
+    _worker_preprocessor_object = load_preprocessor(config_dir)
+
+def _get_worker_pid(_):
+    return os.getpid()
+
+def _run_worker_predict(inputs):
+    return run_predict(_worker_preprocessor_object, inputs)
+
+def _run_worker_predict_batch(batch):
+    return run_predict_batch(_worker_preprocessor_object, batch)
+
+class LatencyMetrics(object):
+    """Count, mean and max latencies of the stages of the requests.
+
+    The stages are ``queue`` (waiting for a batch to be formed and for a
+    free worker), ``predict`` (running and encoding the batch) and
+    ``total``; ``batch_size`` records the sizes of the batches.
+    """
+
+    def __init__(self):
+        self._stats = dict()
+
+    def record(self, name, value):
+        stat = self._stats.get(name)
+        if stat is None:
+            stat = [0, 0.0, 0.0]
+            self._stats[name] = stat
+        stat[0] += 1
+        stat[1] += value
+        stat[2] = max(stat[2], value)
+
+    def format(self):
+        items = []
+        for name, (count, total, max_value) in self._stats.items():
+            items.append(f'{name}: n={count} mean={total / count:.3f} max={max_value:.3f}')
+        return 'preprocessor metrics -- ' + ', '.join(items)
+
+    def clear(self):
+        self._stats.clear()
+
+class DynamicBatcher(object):
+    """Coalesce concurrent requests into batches.
+
+    A batch is dispatched when it has ``max_batch_size`` requests or when
+    its first request has waited ``max_batch_delay`` seconds, whichever
+    comes first. At most ``max_concurrency`` batches run at the same time.
+    """
+
+    def __init__(self, run_batch, max_batch_size, max_batch_delay, max_concurrency, metrics):
+        self._run_batch = run_batch
+        self._max_batch_size = max_batch_size
+        self._max_batch_delay = max_batch_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._metrics = metrics
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._collect())
+
+    async def submit(self, inputs):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_batch_delay
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._semaphore.acquire()
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            start = time.perf_counter()
+            if self._metrics is not None:
+                for _, _, enqueued in batch:
+                    self._metrics.record('queue', start - enqueued)
+                self._metrics.record('batch_size', len(batch))
+            try:
+                results = await self._run_batch([inputs for inputs, _, _ in batch])
+            except Exception as ex:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(ex)
+                return
+            if self._metrics is not None:
+                self._metrics.record('predict', time.perf_counter() - start)
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._semaphore.release()
+
 class PreprocessorServicer(metaspore_pb2_grpc.PredictServicer):
-    def __init__(self, preprocessor_object):
+    def __init__(self, preprocessor_object, executor=None, metrics=None):
         super().__init__()
         self._preprocessor_object = preprocessor_object
+        self._executor = executor
+        self._metrics = metrics
+        self._batcher = None
+
+    def start_batcher(self, max_batch_size, max_batch_delay, max_concurrency):
+        if not hasattr(self._preprocessor_object, 'predict_batch'):
+            message = "the preprocessor must implement 'predict_batch' to batch requests; "
+            message += f"max_batch_size {max_batch_size!r} is invalid"
+            raise RuntimeError(message)
+        self._batcher = DynamicBatcher(self._run_batch, max_batch_size, max_batch_delay,
+                                       max_concurrency, self._metrics)
+        self._batcher.start()
 
     async def Predict(self,
                       request: metaspore_pb2.PredictRequest,
                       context: grpc.aio.ServicerContext) -> metaspore_pb2.PredictReply:
-        inputs = request.payload
+        start = time.perf_counter()
+        inputs = dict(request.payload)
         if inspect.iscoroutinefunction(self._preprocessor_object.predict):
             outputs = await self._preprocessor_object.predict(inputs)
+            payload = self._encode_outputs(outputs)
+        elif self._batcher is not None:
+            payload = await self._batcher.submit(inputs)
         else:
-            outputs = self._preprocessor_object.predict(inputs)
-        payload = self._encode_outputs(outputs)
+            payload = await self._run_in_executor(_run_worker_predict, run_predict, inputs)
         reply = metaspore_pb2.PredictReply(payload=payload)
+        if self._metrics is not None:
+            self._metrics.record('total', time.perf_counter() - start)
         return reply
 
-    def _encode_tensor(self, tensor):
-        sink = pa.BufferOutputStream()
-        buf = pa.ipc.write_tensor(tensor, sink)
-        bs = sink.getvalue().to_pybytes()
-        return bs
+    async def _run_batch(self, batch):
+        return await self._run_in_executor(_run_worker_predict_batch, run_predict_batch, batch)
 
-    def _encode_ndarray(self, arr):
-        tensor = pa.Tensor.from_numpy(arr)
-        return self._encode_tensor(tensor)
-
-    def _is_torch_tensor(self, value):
-        try:
-            import torch
-            return isinstance(value, torch.Tensor)
-        except ImportError:
-            return False
+    async def _run_in_executor(self, process_func, thread_func, arg):
+        # Run the synchronous preprocessor off the event loop, so that a
+        # slow request does not stall the others.
+        loop = asyncio.get_running_loop()
+        if isinstance(self._executor, concurrent.futures.ProcessPoolExecutor):
+            return await loop.run_in_executor(self._executor, process_func, arg)
+        return await loop.run_in_executor(self._executor, thread_func, self._preprocessor_object, arg)
 
     def _encode_outputs(self, outputs):
-        if not isinstance(outputs, dict):
-            message = f"outputs must be dict; {outputs!r} is invalid"
-            raise TypeError(message)
-        if not all(isinstance(k, str) for k in outputs.keys()):
-            message = f"all keys of outputs must be string; {outputs!r} is invalid"
-            raise TypeError(message)
-        for name in self._preprocessor_object.output_names:
-            if name not in outputs:
-                message = f"declared output {name!r} not found in outputs; "
-                message += f"{outputs!r} is invalid"
-                raise ValueError(message)
-        if all(isinstance(v, bytes) for v in outputs.values()):
-            return outputs
-        payload = dict()
-        for name, value in outputs.items():
-            if isinstance(value, bytes):
-                payload[name] = value
-            elif isinstance(value, pa.Tensor):
-                payload[name] = self._encode_tensor(value)
-            elif isinstance(value, np.ndarray):
-                payload[name] = self._encode_ndarray(value)
-            elif self._is_torch_tensor(value):
-                payload[name] = self._encode_ndarray(value.numpy())
-            else:
-                message = f"output {name!r} must be bytes, pa.Tensor, np.ndarray or torch.Tensor; "
-                message += f"{value!r} is invalid"
-                raise TypeError(message)
-        return payload
+        return encode_outputs(outputs, self._preprocessor_object.output_names)
 
 class PreprocessorService(object):
     def __init__(self):
@@ -101,37 +284,36 @@ class PreprocessorService(object):
                  "its support files")
         parser.add_argument('-a', '--listen-addr', type=str, required=True,
             help="gRPC listen address of the preprocessor service")
+        parser.add_argument('--executor', type=str, choices=('thread', 'process'), default='thread',
+            help="pool running the synchronous 'predict' of the preprocessor; the process pool "
+                 "loads one preprocessor object per worker process")
+        parser.add_argument('--num-workers', type=int, default=1,
+            help="number of workers of the pool")
+        parser.add_argument('--max-batch-size', type=int, default=1,
+            help="maximum number of concurrent requests coalesced into one 'predict_batch' call; "
+                 "the preprocessor must implement 'predict_batch' when it is greater than 1")
+        parser.add_argument('--max-batch-delay-ms', type=float, default=2.0,
+            help="maximum time the first request of a batch waits for other requests")
+        parser.add_argument('--metrics-interval', type=float, default=0.0,
+            help="interval in seconds of printing the latency metrics; 0 to disable")
         args = parser.parse_args()
+        if args.num_workers <= 0:
+            parser.error(f"--num-workers must be positive integer; {args.num_workers!r} is invalid")
+        if args.max_batch_size <= 0:
+            parser.error(f"--max-batch-size must be positive integer; {args.max_batch_size!r} is invalid")
         self._config_dir = args.config_dir
         self._listen_addr = args.listen_addr
+        self._executor_type = args.executor
+        self._num_workers = args.num_workers
+        self._max_batch_size = args.max_batch_size
+        self._max_batch_delay = args.max_batch_delay_ms / 1000.0
+        self._metrics_interval = args.metrics_interval
 
     def _get_preprocessor_class(self):
-        sys.path.insert(0, self._config_dir)
-        module = importlib.import_module('preprocessor')
-        preprocessor_classes = []
-        for name in dir(module):
-            if name.endswith('Preprocessor'):
-                item = getattr(module, name)
-                if isinstance(item, type):
-                    preprocessor_classes.append(item)
-        py_path = os.path.join(self._config_dir, 'preprocessor.py')
-        if not preprocessor_classes:
-            message = "no preprocessor class found in %r" % py_path
-            raise RuntimeError(message)
-        if len(preprocessor_classes) == 1:
-            return preprocessor_classes[0]
-        exported = getattr(module, '__all__', None)
-        if exported is not None:
-            candicates = [c for c in preprocessor_classes if c.__name__ in exported]
-            if len(candicates) == 1:
-                return candicates[0]
-        message = "more than one preprocessor classes found in %r" % py_path
-        raise RuntimeError(message)
+        return find_preprocessor_class(self._config_dir)
 
     def _load_preprocessor(self):
-        preprocessor_class = self._get_preprocessor_class()
-        preprocessor = preprocessor_class(self._config_dir)
-        self._preprocessor_object = preprocessor
+        self._preprocessor_object = load_preprocessor(self._config_dir)
 
     def _print_input_output_names(self):
         input_names = ','.join(self._preprocessor_object.input_names)
@@ -140,8 +322,35 @@ class PreprocessorService(object):
         print('output_names=%s' % output_names)
         sys.stdout.flush()
 
+    def _create_executor(self):
+        if self._executor_type == 'process':
+            # Worker processes are spawned rather than forked, so that they do not
+            # inherit the threads and locks of gRPC and the event loop; they are
+            # all started here, before the server, and a preprocessor failing to
+            # load in them fails the service at startup.
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._num_workers,
+                                                              mp_context=multiprocessing.get_context('spawn'),
+                                                              initializer=_init_worker_process,
+                                                              initargs=(self._config_dir,))
+            list(executor.map(_get_worker_pid, range(self._num_workers)))
+            return executor
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self._num_workers)
+
+    async def _print_metrics(self, metrics):
+        while True:
+            await asyncio.sleep(self._metrics_interval)
+            print(metrics.format())
+            sys.stdout.flush()
+            metrics.clear()
+
     async def _serve(self):
-        servicer = PreprocessorServicer(self._preprocessor_object)
+        metrics = LatencyMetrics() if self._metrics_interval > 0 else None
+        executor = self._create_executor()
+        servicer = PreprocessorServicer(self._preprocessor_object, executor, metrics=metrics)
+        if self._max_batch_size > 1:
+            servicer.start_batcher(self._max_batch_size, self._max_batch_delay, self._num_workers)
+        if metrics is not None:
+            asyncio.create_task(self._print_metrics(metrics))
         server = grpc.aio.server()
         metaspore_pb2_grpc.add_PredictServicer_to_server(servicer, server)
         server.add_insecure_port(self._listen_addr)
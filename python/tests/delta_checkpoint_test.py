@@ -0,0 +1,138 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Save a chain of a base and two deltas with a local parameter server,
+# with keys pruned and cleared between the saves, and check that loading
+# the chain gives the same sparse tensors as a full checkpoint of the
+# same model. Then check that compaction in the directory the chain was
+# loaded from folds it into a fresh base:
+#
+#   python delta_checkpoint_test.py
+
+import os
+import glob
+import json
+import tempfile
+import numpy
+import pandas
+import torch
+import metaspore as ms
+from metaspore.async_utils import run_sync
+
+class DemoModule(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.sparse = ms.EmbeddingSumConcat(4, combine_schema_source='user_id\nitem_id\n')
+        self.sparse.updater = ms.FTRLTensorUpdater()
+        self.sparse.initializer = ms.NormalTensorInitializer(var=0.01)
+        self.dense = torch.nn.Sequential(
+            torch.nn.Linear(self.sparse.feature_count * 4, 1),
+            torch.nn.Sigmoid(),
+        )
+
+    def forward(self, x):
+        return self.dense(self.sparse(x))
+
+def make_dataset(spark_session, round_index, size=500):
+    # Each round sees new users, so that keys are added and aged.
+    rng = numpy.random.default_rng(round_index)
+    df = pandas.DataFrame({
+        'label': rng.integers(0, 2, size=size).astype(str),
+        'user_id': ['u%d' % i for i in rng.integers(0, 100, size=size) + 50 * round_index],
+        'item_id': ['i%d' % i for i in rng.integers(0, 30, size=size)],
+    })
+    return spark_session.createDataFrame(df)
+
+def fit(module, spark_session, round_index, **kwargs):
+    estimator = ms.PyTorchEstimator(module=module,
+                                    worker_count=1,
+                                    server_count=1,
+                                    input_label_column_index=0,
+                                    checkpoint_mode='delta',
+                                    max_sparse_feature_age=2,
+                                    **kwargs)
+    estimator.fit(make_dataset(spark_session, round_index))
+
+def prune_small(self):
+    self.model.prune_small(0.001)
+
+def clear(self):
+    self.model.agent.barrier()
+    if self.model.agent.rank == 0:
+        run_sync(self.model._clear_tensors())
+    self.model.agent.barrier()
+
+def save_full(dir_path):
+    def hook(self):
+        ms.DistributedTrainer(self.model, updater=self.updater).save(dir_path)
+    return hook
+
+def dump_as_text(dir_path):
+    # Text mode checkpoints list every key with its values, which can be
+    # compared regardless of the order in the hash maps.
+    def hook(self):
+        self.module.sparse.save_as_text = True
+        ms.DistributedTrainer(self.model, updater=self.updater).save(dir_path)
+        self.module.sparse.save_as_text = False
+    return hook
+
+def read_text_dump(dir_path):
+    lines = []
+    for path in glob.glob(os.path.join(dir_path, '*__sparse_*.dat')):
+        with open(path) as fin:
+            lines.extend(fin.read().splitlines())
+    assert lines, dir_path
+    return sorted(lines)
+
+def read_manifest(dir_path):
+    with open(os.path.join(dir_path, 'checkpoint_manifest.json')) as fin:
+        return json.load(fin)
+
+def main():
+    spark_session = ms.spark.get_session(local=True, batch_size=100,
+                                         worker_count=1, server_count=1)
+    module = DemoModule()
+    with tempfile.TemporaryDirectory() as tmp:
+        chain_dir = os.path.join(tmp, 'chain') + '/'
+        full_dir = os.path.join(tmp, 'full') + '/'
+        # Base, then two deltas saved to where the chain is loaded from.
+        fit(module, spark_session, 0, model_out_path=chain_dir)
+        fit(module, spark_session, 1, model_in_path=chain_dir, model_out_path=chain_dir,
+            worker_start_hook=prune_small)
+        fit(module, spark_session, 2, model_in_path=chain_dir, model_out_path=chain_dir,
+            worker_start_hook=clear, worker_stop_hook=save_full(full_dir))
+        manifest = read_manifest(chain_dir)
+        assert manifest['base'] == chain_dir + 'base_00001/', manifest
+        assert manifest['deltas'] == [chain_dir + 'delta_00002/', chain_dir + 'delta_00003/'], manifest
+        assert not os.path.exists(os.path.join(full_dir, 'checkpoint_manifest.json'))
+
+        chain_dump = os.path.join(tmp, 'chain_dump') + '/'
+        full_dump = os.path.join(tmp, 'full_dump') + '/'
+        fit(module, spark_session, 3, model_in_path=chain_dir, worker_start_hook=dump_as_text(chain_dump))
+        fit(module, spark_session, 3, model_in_path=full_dir, worker_start_hook=dump_as_text(full_dump))
+        assert read_text_dump(chain_dump) == read_text_dump(full_dump)
+
+        # Compaction into the directory the chain is loaded from.
+        fit(module, spark_session, 4, model_in_path=chain_dir, model_out_path=chain_dir,
+            checkpoint_compaction_interval=2)
+        manifest = read_manifest(chain_dir)
+        assert manifest['base'] == chain_dir + 'base_00004/' and not manifest['deltas'], manifest
+        for name in 'base_00001', 'delta_00002', 'delta_00003':
+            assert not os.path.exists(os.path.join(chain_dir, name)), name
+    print('delta checkpoint chain passed')
+
+if __name__ == '__main__':
+    main()
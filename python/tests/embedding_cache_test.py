@@ -0,0 +1,87 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Round trip an embedding operator with a worker side cache the way
+# ``PyTorchAgent.distribute_module`` sends it to the workers, and check
+# the cache still works afterwards:
+#
+#   python embedding_cache_test.py
+
+import io
+import numpy
+import torch
+import metaspore as ms
+from metaspore import patching_pickle
+
+def round_trip(module):
+    buf = io.BytesIO()
+    torch.save(module, buf, pickle_module=patching_pickle)
+    buf.seek(0)
+    return torch.load(buf, weights_only=False)
+
+def make_rows(keys):
+    return numpy.repeat(keys.astype(numpy.float32).reshape(-1, 1), 4, axis=1)
+
+def make_loaded_cache():
+    cache = ms.EmbeddingCache(capacity=4, policy='lfu', refresh_interval=10)
+    module = ms.EmbeddingSumConcat(4, combine_schema_source='user_id\nitem_id\n', cache=cache)
+    module.cache.update(numpy.array([1, 2, 3], dtype=numpy.uint64), make_rows(numpy.array([1, 2, 3])))
+    module.cache.lookup(numpy.array([1, 2], dtype=numpy.uint64))
+    assert module.cache.size == 3 and module.cache.hit_count == 2
+
+    loaded = round_trip(module)
+    cache = loaded.cache
+    assert cache is not module.cache
+    assert repr(cache) == repr(module.cache)
+    # Cached rows and counters are not pickled.
+    assert cache.size == 0 and cache.hit_count == 0 and cache.miss_count == 0
+    return cache
+
+def test_round_trip():
+    make_loaded_cache()
+
+def test_hit_and_miss():
+    cache = make_loaded_cache()
+    keys = numpy.array([1, 2, 3], dtype=numpy.uint64)
+    hit, rows = cache.lookup(keys)
+    assert not hit.any() and rows is None
+    cache.update(keys, make_rows(keys))
+    hit, rows = cache.lookup(numpy.array([3, 5, 1], dtype=numpy.uint64))
+    assert hit.tolist() == [True, False, True]
+    assert rows[:, 0].tolist() == [3.0, 1.0]
+    assert cache.hit_count == 2 and cache.miss_count == 4
+
+def test_eviction():
+    cache = make_loaded_cache()
+    keys = numpy.array([1, 2, 3], dtype=numpy.uint64)
+    cache.update(keys, make_rows(keys))
+    cache.lookup(numpy.array([1, 3], dtype=numpy.uint64))
+    # Keys 1 and 3 have been hit, so the least frequently used key 2 is
+    # evicted first when the capacity of 4 rows is exceeded.
+    keys = numpy.array([4, 5], dtype=numpy.uint64)
+    cache.update(keys, make_rows(keys))
+    assert cache.size == 4
+    hit, _ = cache.lookup(numpy.array([1, 2, 3, 4, 5], dtype=numpy.uint64))
+    assert hit.tolist() == [True, False, True, True, True]
+
+def main():
+    test_round_trip()
+    test_hit_and_miss()
+    test_eviction()
+    print('embedding cache round trip passed')
+
+if __name__ == '__main__':
+    main()
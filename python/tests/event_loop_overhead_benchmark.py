@@ -0,0 +1,61 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Micro-benchmark of the per-step overhead of running the PS operations of
+# a training step (pull, push) with ``asyncio.run`` versus the persistent
+# event loop of ``metaspore.async_utils.run_sync``. The PS callbacks are
+# simulated by a thread completing the futures with ``call_soon_threadsafe``,
+# as the C++ agent does.
+
+import time
+import asyncio
+import argparse
+import concurrent.futures
+from metaspore.async_utils import run_sync
+
+_callback_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+def fake_ps_request():
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    def done():
+        loop.call_soon_threadsafe(future.set_result, None)
+    _callback_executor.submit(done)
+    return future
+
+async def fake_step(tensor_count):
+    await asyncio.gather(*[fake_ps_request() for _ in range(tensor_count)])
+
+def benchmark(runner, steps, tensor_count):
+    begin = time.perf_counter()
+    for _ in range(steps):
+        # one pull and one push per step
+        runner(fake_step(tensor_count))
+        runner(fake_step(tensor_count))
+    return (time.perf_counter() - begin) / steps * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='event loop overhead per training step')
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--tensor-count', type=int, default=8)
+    args = parser.parse_args()
+    for name, runner in (('asyncio.run', asyncio.run), ('run_sync', run_sync)):
+        benchmark(runner, 100, args.tensor_count)
+        elapsed = benchmark(runner, args.steps, args.tensor_count)
+        print('%-12s %8.1f us/step' % (name, elapsed))
+
+if __name__ == '__main__':
+    main()
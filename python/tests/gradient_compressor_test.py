@@ -0,0 +1,114 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Check that gradient compression loses no update: the gradients pushed
+# plus those flushed at the end sum to the uncompressed gradients.
+#
+#   python gradient_compressor_test.py
+
+import numpy
+import metaspore as ms
+
+class FakeTensor(object):
+    # Compressors keep their per tensor state in this attribute only.
+    def __init__(self):
+        self._compression_state = None
+
+def add_rows(totals, keys, rows):
+    for key, row in zip(keys.tolist(), rows):
+        totals[key] = totals.get(key, 0.0) + row.astype(numpy.float64)
+
+def assert_same_rows(totals, expected):
+    assert sorted(totals) == sorted(expected)
+    for key, row in expected.items():
+        assert numpy.allclose(totals[key], row, atol=1e-5), key
+
+def test_dense_flush():
+    rng = numpy.random.default_rng(0)
+    compressor = ms.GradientCompressor(accumulation_steps=3)
+    tensor = FakeTensor()
+    expected = numpy.zeros((4, 5))
+    pushed = numpy.zeros((4, 5))
+    for _ in range(8):
+        grad = rng.normal(size=(4, 5)).astype(numpy.float32)
+        expected += grad
+        result = compressor.compress_dense(tensor, grad)
+        if result is not None:
+            pushed += result
+    # 8 steps with 3 accumulation steps leave 2 steps pending.
+    result = compressor.flush_dense(tensor)
+    assert result is not None
+    pushed += result
+    assert numpy.allclose(pushed, expected, atol=1e-5)
+    assert compressor.flush_dense(tensor) is None
+
+def check_sparse_flush(compressor):
+    rng = numpy.random.default_rng(1)
+    tensor = FakeTensor()
+    expected = {}
+    pushed = {}
+    for _ in range(10):
+        # Duplicate keys within and across minibatches.
+        keys = rng.integers(0, 50, size=40).astype(numpy.uint64)
+        grad = rng.normal(size=(40, 4)).astype(numpy.float32)
+        add_rows(expected, keys, grad)
+        result = compressor.compress_sparse(tensor, keys, grad)
+        if result is not None:
+            add_rows(pushed, *result)
+    result = compressor.flush_sparse(tensor)
+    assert result is not None
+    keys, grad = result
+    assert len(numpy.unique(keys)) == len(keys)
+    add_rows(pushed, keys, grad)
+    assert_same_rows(pushed, expected)
+    assert compressor.flush_sparse(tensor) is None
+
+def test_sparse_accumulation_flush():
+    check_sparse_flush(ms.GradientCompressor(accumulation_steps=4))
+
+def test_sparse_top_k_flush():
+    check_sparse_flush(ms.GradientCompressor(top_k_ratio=0.1))
+
+def test_sparse_accumulation_and_top_k_flush():
+    check_sparse_flush(ms.GradientCompressor(top_k_ratio=0.25, accumulation_steps=3))
+
+def test_float16_flush():
+    compressor = ms.GradientCompressor(float16=True, top_k_ratio=0.5)
+    tensor = FakeTensor()
+    keys = numpy.arange(8, dtype=numpy.uint64)
+    grad = numpy.arange(16, dtype=numpy.float32).reshape(8, 2)
+    compressor.compress_sparse(tensor, keys, grad)
+    keys, grad = compressor.flush_sparse(tensor)
+    assert keys.tolist() == [0, 1, 2, 3]
+    assert grad.dtype == numpy.float16
+
+def test_empty_flush():
+    compressor = ms.GradientCompressor(top_k_ratio=0.5, accumulation_steps=2)
+    tensor = FakeTensor()
+    assert compressor.flush_dense(tensor) is None
+    assert compressor.flush_sparse(tensor) is None
+
+def main():
+    test_dense_flush()
+    test_sparse_accumulation_flush()
+    test_sparse_top_k_flush()
+    test_sparse_accumulation_and_top_k_flush()
+    test_float16_flush()
+    test_empty_flush()
+    print('gradient compressor flush passed')
+
+if __name__ == '__main__':
+    main()
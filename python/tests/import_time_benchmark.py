@@ -0,0 +1,98 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Measure the time and memory ``import metaspore`` takes in a fresh
+# interpreter, and check that the heavy subsystems are not imported.
+# Exit with a non-zero status on regressions, so that it can run in CI:
+#
+#   python import_time_benchmark.py --repeat 5 --max-seconds 1.0
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = 'torch', 'pyspark', 'faiss', 'pymilvus', 'metaspore.estimator', 'metaspore.demo'
+
+PROBE = '''
+import sys
+import json
+import time
+import resource
+start = time.perf_counter()
+import metaspore
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+def run_probe(import_expr):
+    probe = PROBE.replace('import metaspore\n', import_expr + '\n', 1)
+    output = subprocess.check_output([sys.executable, '-c', probe], text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def get_slowest_imports(import_expr, count):
+    # ``-X importtime`` reports on stderr: self us | cumulative us | module.
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', import_expr],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name.startswith(' ' * 3):
+            rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:count]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='benchmark the import time of metaspore')
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh interpreters')
+    parser.add_argument('--import-expr', default='import metaspore', help='statement to measure')
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail above this median time')
+    parser.add_argument('--max-rss-mb', type=float, default=None, help='fail above this median RSS')
+    parser.add_argument('--allow-heavy', action='store_true', help='do not fail on heavy imports')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = [run_probe(args.import_expr) for _ in range(args.repeat)]
+    seconds = statistics.median(r['seconds'] for r in results)
+    max_rss_mb = statistics.median(r['max_rss_mb'] for r in results)
+    heavy = [name for name in HEAVY_MODULES if name in results[0]['modules']]
+    print(f'{args.import_expr!r}: median {seconds:.3f}s, max RSS {max_rss_mb:.1f}MiB, '
+          f'{len(results[0]["modules"])} modules')
+    print('heavy modules imported: %s' % (', '.join(heavy) or 'none'))
+    print('slowest top-level imports:')
+    for cumulative_us, name in get_slowest_imports(args.import_expr, 10):
+        print(f'  {cumulative_us / 1e6:8.3f}s  {name}')
+    failures = []
+    if args.max_seconds is not None and seconds > args.max_seconds:
+        failures.append(f'import time {seconds:.3f}s exceeds {args.max_seconds:.3f}s')
+    if args.max_rss_mb is not None and max_rss_mb > args.max_rss_mb:
+        failures.append(f'max RSS {max_rss_mb:.1f}MiB exceeds {args.max_rss_mb:.1f}MiB')
+    if heavy and not args.allow_heavy:
+        failures.append('heavy modules imported eagerly: %s' % ', '.join(heavy))
+    for failure in failures:
+        print('FAILED: ' + failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Check that binary classification metrics pushed by the workers as
+# compact states merge on the coordinator into the same AUC:
+#
+#   python metric_states_test.py
+
+import numpy
+import metaspore as ms
+
+BUFFER_SIZE = 10000
+
+def make_batches(worker_count, batch_size, seed=0):
+    rng = numpy.random.default_rng(seed)
+    batches = []
+    for _ in range(worker_count):
+        labels = (rng.random(batch_size) < 0.3).astype(numpy.float32)
+        predictions = numpy.clip(rng.normal(0.3 + 0.3 * labels, 0.2), 0.0, 1.0).astype(numpy.float32)
+        batches.append((predictions, labels))
+    return batches
+
+def push(worker, coordinator):
+    # What ``Agent.push_metric`` and the ``PushMetric`` handler do.
+    states = worker.get_states()
+    for state in states:
+        assert len(state) > 0, 'message slices can not be empty'
+    delta = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    delta.from_states(states)
+    coordinator.merge(delta)
+    worker.clear()
+    return delta
+
+def accumulate(metric, predictions, labels):
+    metric.accumulate(predictions=predictions, labels=labels,
+                      batch_size=len(labels), batch_loss=0.0)
+
+def test_merge(max_push_bins=None):
+    batches = make_batches(4, 1000)
+    expected = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    coordinator = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    for predictions, labels in batches:
+        accumulate(expected, predictions, labels)
+        worker = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE, max_push_bins=max_push_bins)
+        accumulate(worker, predictions, labels)
+        delta = push(worker, coordinator)
+        if max_push_bins is not None:
+            assert len(delta._bin_indices) <= max_push_bins
+    assert coordinator.instance_count == expected.instance_count
+    assert coordinator._positive_buffer.sum() == expected._positive_buffer.sum()
+    assert coordinator._negative_buffer.sum() == expected._negative_buffer.sum()
+    if max_push_bins is None:
+        assert coordinator.compute_auc() == expected.compute_auc()
+    else:
+        # Merged bins lower the resolution of the histograms only.
+        assert abs(coordinator.compute_auc() - expected.compute_auc()) < 0.01
+
+def test_compact_auc():
+    predictions, labels = make_batches(1, 1000)[0]
+    worker = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    accumulate(worker, predictions, labels)
+    expected = worker.compute_auc()
+    delta = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    delta.from_states(worker.get_states())
+    assert not delta._is_dense
+    assert delta.compute_auc() == expected
+
+def test_empty():
+    predictions, labels = make_batches(1, 1000)[0]
+    coordinator = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    worker = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE)
+    accumulate(worker, predictions, labels)
+    push(worker, coordinator)
+    auc = coordinator.compute_auc()
+    # The worker has seen no instances since the last push, as happens
+    # on worker shutdown.
+    delta = push(worker, coordinator)
+    assert delta.instance_count == 0
+    assert coordinator.instance_count == len(labels)
+    assert coordinator.compute_auc() == auc
+    # A worker that never saw any instance.
+    idle = ms.BinaryClassificationModelMetric(buffer_size=BUFFER_SIZE, max_push_bins=16)
+    push(idle, coordinator)
+    assert coordinator.compute_auc() == auc
+
+def main():
+    test_merge()
+    test_merge(max_push_bins=64)
+    test_compact_auc()
+    test_empty()
+    print('metric states round trip passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Round trip the directory helpers of ``metaspore.s3_utils`` through an
+# in-process S3 stand-in. Requires ``moto>=5``:
+#
+#   python s3_utils_moto_test.py
+
+import os
+import filecmp
+import tempfile
+
+os.environ['AWS_REGION'] = 'us-east-1'
+os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+os.environ.pop('AWS_ENDPOINT', None)
+
+from moto import mock_aws
+from metaspore import s3_utils
+
+def make_files(dir_path, file_count, large_file_size):
+    os.makedirs(os.path.join(dir_path, 'sub'))
+    for i in range(file_count):
+        name = 'part_%d.dat' % i if i % 2 else 'sub/part_%d.dat' % i
+        with open(os.path.join(dir_path, name), 'wb') as fout:
+            fout.write(os.urandom(1024 + i))
+    with open(os.path.join(dir_path, 'large.dat'), 'wb') as fout:
+        fout.write(os.urandom(large_file_size))
+
+def assert_same_dirs(dir_path_1, dir_path_2):
+    cmp = filecmp.dircmp(dir_path_1, dir_path_2)
+    assert not cmp.left_only and not cmp.right_only and not cmp.diff_files, cmp.report()
+    for sub in cmp.common_dirs:
+        assert_same_dirs(os.path.join(dir_path_1, sub), os.path.join(dir_path_2, sub))
+
+@mock_aws
+def main():
+    # Use the smallest part size S3 accepts, so that the large file is
+    # transferred in several parts.
+    s3_utils.S3_MULTIPART_THRESHOLD = 5 * 1024 * 1024
+    s3_utils.S3_MULTIPART_CHUNK_SIZE = 5 * 1024 * 1024
+    s3_utils.clear_s3_client_cache()
+    s3 = s3_utils.get_s3_client()
+    s3.create_bucket(Bucket='metaspore-test')
+    file_count = 1500
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'src')
+        dst = os.path.join(tmp, 'dst')
+        make_files(src, file_count, 12 * 1024 * 1024)
+        total_size = sum(os.path.getsize(os.path.join(dirpath, name))
+                         for dirpath, dirnames, filenames in os.walk(src) for name in filenames)
+
+        s3_utils.upload_s3_dir(src, 's3://metaspore-test/model/')
+        # More than one page of listing.
+        assert s3_utils.get_s3_dir_size('s3://metaspore-test/model/') == total_size
+
+        s3_utils.copy_s3_dir('s3://metaspore-test/model/', 's3://metaspore-test/model_copy/')
+        assert s3_utils.get_s3_dir_size('s3://metaspore-test/model_copy/') == total_size
+
+        s3_utils.download_s3_dir('s3://metaspore-test/model_copy/', dst)
+        assert_same_dirs(src, dst)
+
+        s3_utils.delete_s3_dir('s3://metaspore-test/model/')
+        assert s3_utils.get_s3_dir_size('s3://metaspore-test/model/') == 0
+        assert s3_utils.s3_file_exists('s3://metaspore-test/model_copy/large.dat')
+        s3_utils.delete_s3_file('s3://metaspore-test/model_copy/large.dat')
+        assert not s3_utils.s3_file_exists('s3://metaspore-test/model_copy/large.dat')
+    print('s3_utils round trip of %d files passed' % (file_count + 1))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Check the helpers of the batch negative sampling DSSM agent: accidental
+# hits masked from the sorted ids match the dense B x B comparison, the
+# negative queue keeps the latest items only, and the streaming frequency
+# estimator converges to the occurrence probabilities of the items:
+#
+#   python sampled_softmax_test.py
+
+import numpy
+import torch
+from metaspore.algos.twotower.dssm.dssm_agent import MIN_FLOAT
+from metaspore.algos.twotower.dssm.dssm_agent import TwoTowerBatchNegativeSamplingAgent
+from metaspore.algos.twotower.dssm.sampled_softmax import hash_item_ids
+from metaspore.algos.twotower.dssm.sampled_softmax import match_id_pairs
+from metaspore.algos.twotower.dssm.sampled_softmax import NegativeQueue
+from metaspore.algos.twotower.dssm.sampled_softmax import StreamingFrequencyEstimator
+
+def dense_remove_accidental_hits(targets, candidate_ids, logits, all_candidate_ids):
+    # The former implementation, comparing all the pairs of ids.
+    labels = torch.zeros(logits.shape)
+    labels[torch.arange(len(logits)), targets] = 1
+    positive_candidate_ids = torch.unsqueeze(candidate_ids[targets], 1)
+    duplicate = torch.eq(positive_candidate_ids, torch.unsqueeze(all_candidate_ids, 0)).type(labels.type())
+    duplicate = duplicate - labels
+    return logits + duplicate * MIN_FLOAT
+
+def make_batch(rng, batch_size, queue_size, item_count):
+    # Few distinct items, so that most rows have accidental hits.
+    ids = rng.integers(0, item_count, size=batch_size + queue_size)
+    candidate_ids = torch.from_numpy(hash_item_ids(['item%d' % i for i in ids]))
+    logits = torch.from_numpy(rng.normal(size=(batch_size, batch_size + queue_size)).astype(numpy.float32))
+    return candidate_ids[:batch_size], logits, candidate_ids
+
+def test_match_id_pairs():
+    rng = numpy.random.default_rng(0)
+    query_ids = torch.from_numpy(rng.integers(0, 10, size=50))
+    key_ids = torch.from_numpy(rng.integers(0, 10, size=70))
+    rows, cols = match_id_pairs(query_ids, key_ids)
+    expected = torch.nonzero(torch.eq(query_ids[:, None], key_ids[None, :]))
+    assert sorted(zip(rows.tolist(), cols.tolist())) == sorted(map(tuple, expected.tolist()))
+
+def test_remove_accidental_hits():
+    rng = numpy.random.default_rng(1)
+    agent = TwoTowerBatchNegativeSamplingAgent()
+    for batch_size, queue_size, item_count in (64, 0, 8), (64, 32, 20), (16, 48, 1):
+        candidate_ids, logits, all_candidate_ids = make_batch(rng, batch_size, queue_size, item_count)
+        targets = torch.arange(batch_size)
+        expected = dense_remove_accidental_hits(targets, candidate_ids, logits, all_candidate_ids)
+        result = agent.remove_accidental_hits(targets, candidate_ids, logits, all_candidate_ids)
+        assert torch.equal(result, expected), (batch_size, queue_size, item_count)
+        # The positives are never masked.
+        assert torch.equal(result.diag(), logits.diag())
+
+def test_remove_accidental_hits_without_queue():
+    agent = TwoTowerBatchNegativeSamplingAgent()
+    item_ids = numpy.array([3, 5, 3, 7, 5, 3])
+    logits = torch.zeros((6, 6))
+    targets = torch.arange(6)
+    result = agent.remove_accidental_hits(targets, item_ids, logits)
+    candidate_ids = torch.from_numpy(hash_item_ids(item_ids))
+    expected = dense_remove_accidental_hits(targets, candidate_ids, logits, candidate_ids)
+    assert torch.equal(result, expected)
+    assert (result[0] < 0).tolist() == [False, False, True, False, False, True]
+
+def test_negative_queue():
+    queue = NegativeQueue(5)
+    embeddings = torch.arange(6, dtype=torch.float32).reshape(3, 2).requires_grad_()
+    queue.push(embeddings, torch.tensor([0, 1, 2]), torch.tensor([-0.0, -1.0, -2.0]))
+    assert queue.item_ids.tolist() == [0, 1, 2]
+    assert not queue.embeddings.requires_grad
+    # The oldest items are dropped first when the capacity is exceeded.
+    embeddings = torch.arange(6, 14, dtype=torch.float32).reshape(4, 2)
+    queue.push(embeddings, torch.tensor([3, 4, 5, 6]), torch.tensor([-3.0, -4.0, -5.0, -6.0]))
+    assert queue.item_ids.tolist() == [2, 3, 4, 5, 6]
+    assert queue.embeddings[:, 0].tolist() == [4.0, 6.0, 8.0, 10.0, 12.0]
+    assert queue.log_probabilities.tolist() == [-2.0, -3.0, -4.0, -5.0, -6.0]
+    # A batch larger than the capacity keeps its last items only.
+    embeddings = torch.arange(14, dtype=torch.float32).reshape(7, 2)
+    queue.push(embeddings, torch.arange(10, 17), None)
+    assert queue.item_ids.tolist() == [12, 13, 14, 15, 16]
+    assert queue.embeddings.shape == (5, 2)
+    assert queue.log_probabilities is None
+
+def test_frequency_estimator():
+    estimator = StreamingFrequencyEstimator(hash_size=16, alpha=0.1)
+    # Item 1 occurs in every batch, twice in some; item 2 in every 4th
+    # batch. The intervals start at one step.
+    probabilities = estimator.update(numpy.array([1, 1]))
+    assert probabilities.tolist() == [1.0, 1.0]
+    for step in range(2, 5):
+        probabilities = estimator.update(numpy.array([1, 2] if step == 4 else [1]))
+    # Item 2 is first seen at step 4: 0.9 * 1 + 0.1 * 4 steps.
+    assert numpy.allclose(probabilities, [1.0, 1.0 / 1.3])
+    for step in range(5, 1001):
+        probabilities = estimator.update(numpy.array([1, 2] if step % 4 == 0 else [1]))
+    assert numpy.allclose(probabilities, [1.0, 0.25])
+    # Id 17 shares the hash bucket of item 1; id 3 is first seen at step
+    # 1001: 0.9 * 1 + 0.1 * 1001 steps.
+    assert numpy.allclose(estimator.update(numpy.array([17, 3])), [1.0, 1.0 / 101.0])
+
+def main():
+    test_match_id_pairs()
+    test_remove_accidental_hits()
+    test_remove_accidental_hits_without_queue()
+    test_negative_queue()
+    test_frequency_estimator()
+    print('sampled softmax passed')
+
+if __name__ == '__main__':
+    main()
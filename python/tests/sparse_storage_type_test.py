@@ -0,0 +1,166 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Train a sparse model stored in float32 and save it as text, then load it
+# into models storing the embeddings in float16, bfloat16 and int8 with a
+# local parameter server. Check that the values pulled and saved are those
+# of the float32 model up to the precision of the storage type, that the
+# models train, and that their binary checkpoints load back unchanged:
+#
+#   python sparse_storage_type_test.py
+
+import os
+import glob
+import tempfile
+import numpy
+import pandas
+import torch
+import metaspore as ms
+
+class DemoModule(torch.nn.Module):
+    def __init__(self, storage_type=None):
+        super().__init__()
+        self.sparse = ms.EmbeddingSumConcat(8, combine_schema_source='user_id\nitem_id\n',
+                                            storage_type=storage_type)
+        # AdaGrad keeps a state per slice, which is stored in float32.
+        self.sparse.updater = ms.AdaGradTensorUpdater(0.05)
+        self.sparse.initializer = ms.NormalTensorInitializer(var=0.01)
+        self.dense = torch.nn.Sequential(
+            torch.nn.Linear(self.sparse.feature_count * 8, 1),
+            torch.nn.Sigmoid(),
+        )
+
+    def forward(self, x):
+        return self.dense(self.sparse(x))
+
+def make_dataframe(round_index, size=500):
+    rng = numpy.random.default_rng(round_index)
+    return pandas.DataFrame({
+        'label': rng.integers(0, 2, size=size).astype(str),
+        'user_id': ['u%d' % i for i in rng.integers(0, 100, size=size)],
+        'item_id': ['i%d' % i for i in rng.integers(0, 30, size=size)],
+    })
+
+def fit(module, spark_session, round_index, **kwargs):
+    estimator = ms.PyTorchEstimator(module=module,
+                                    worker_count=1,
+                                    server_count=1,
+                                    input_label_column_index=0,
+                                    **kwargs)
+    estimator.fit(spark_session.createDataFrame(make_dataframe(round_index)))
+
+def save_predictions(path):
+    # Predictions of the first minibatch of round 0, computed from the
+    # embeddings pulled right after loading.
+    def hook(self):
+        self.model.eval()
+        minibatch, _ = self.preprocess_minibatch(make_dataframe(0).head(100))
+        predictions = self.model(minibatch)
+        numpy.save(path, predictions.detach().numpy())
+    return hook
+
+def dump_as_text(dir_path):
+    # Text mode checkpoints list the decoded values of every key.
+    def hook(self):
+        self.module.sparse.save_as_text = True
+        ms.DistributedTrainer(self.model, updater=self.updater).save(dir_path)
+        self.module.sparse.save_as_text = False
+    return hook
+
+def chain_hooks(*hooks):
+    def hook(self):
+        for h in hooks:
+            h(self)
+    return hook
+
+def read_text_dump(dir_path):
+    rows = dict()
+    for path in glob.glob(os.path.join(dir_path, '*__sparse_*.dat')):
+        with open(path) as fin:
+            for line in fin:
+                key, value = line.rstrip('\n').split('\t')
+                data, state, age = value.split('|')
+                rows[int(key)] = (numpy.array(data.split(','), dtype=numpy.float64),
+                                  numpy.array(state.split(','), dtype=numpy.float64),
+                                  int(age))
+    assert rows, dir_path
+    return rows
+
+def get_tolerance(storage_type, row):
+    # Half a step of the storage type, plus the rounding of the text dumps.
+    if storage_type == 'float16':
+        return (2.0 ** -11 + 1e-6) * numpy.abs(row) + 6e-8
+    if storage_type == 'bfloat16':
+        return (2.0 ** -8 + 1e-6) * numpy.abs(row)
+    # Rows are quantized to 127 steps of their largest magnitude, which
+    # is kept as the per row scale.
+    return numpy.full_like(row, numpy.abs(row).max() * (1.0 / 254.0 + 1e-6))
+
+def assert_close_rows(actual, expected, storage_type, scale=1.0):
+    assert sorted(actual) == sorted(expected)
+    for key, (data, state, age) in expected.items():
+        actual_data, actual_state, actual_age = actual[key]
+        tolerance = get_tolerance(storage_type, data) * scale
+        assert (numpy.abs(actual_data - data) <= tolerance).all(), (key, actual_data, data)
+        # Optimizer states and ages are stored in full precision.
+        assert numpy.allclose(actual_state, state, rtol=1e-6, atol=0.0), key
+        assert actual_age == age, key
+
+def check_storage_type(spark_session, tmp, storage_type, reference, reference_predictions):
+    ref_dir = os.path.join(tmp, 'ref') + '/'
+    out_dir = os.path.join(tmp, storage_type) + '/'
+    loaded_dump = os.path.join(tmp, storage_type + '_loaded') + '/'
+    trained_dump = os.path.join(tmp, storage_type + '_trained') + '/'
+    reloaded_dump = os.path.join(tmp, storage_type + '_reloaded') + '/'
+    predictions_path = os.path.join(tmp, storage_type + '_predictions.npy')
+    # Load the text checkpoint, pull and save as text before training,
+    # then train, which pushes gradients, and save in binary mode.
+    start_hook = chain_hooks(dump_as_text(loaded_dump), save_predictions(predictions_path))
+    fit(DemoModule(storage_type), spark_session, 1, model_in_path=ref_dir, model_out_path=out_dir,
+        worker_start_hook=start_hook, worker_stop_hook=dump_as_text(trained_dump))
+    assert_close_rows(read_text_dump(loaded_dump), reference, storage_type)
+    predictions = numpy.load(predictions_path)
+    assert numpy.allclose(predictions, reference_predictions, atol=0.01), storage_type
+
+    trained = read_text_dump(trained_dump)
+    assert all(numpy.isfinite(data).all() for data, _, _ in trained.values())
+    common = set(reference) & set(trained)
+    assert any(not numpy.array_equal(trained[key][0], reference[key][0]) for key in common)
+
+    # Decoded values encode to the same values again.
+    fit(DemoModule(storage_type), spark_session, 2, model_in_path=out_dir,
+        worker_start_hook=dump_as_text(reloaded_dump))
+    assert_close_rows(read_text_dump(reloaded_dump), trained, storage_type, scale=1e-3)
+
+def main():
+    spark_session = ms.spark.get_session(local=True, batch_size=100,
+                                         worker_count=1, server_count=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        ref_dir = os.path.join(tmp, 'ref') + '/'
+        predictions_path = os.path.join(tmp, 'ref_predictions.npy')
+        module = DemoModule()
+        module.sparse.save_as_text = True
+        fit(module, spark_session, 0, model_out_path=ref_dir)
+        fit(DemoModule(), spark_session, 1, model_in_path=ref_dir,
+            worker_start_hook=save_predictions(predictions_path))
+        reference = read_text_dump(ref_dir)
+        reference_predictions = numpy.load(predictions_path)
+        for storage_type in 'float16', 'bfloat16', 'int8':
+            check_storage_type(spark_session, tmp, storage_type, reference, reference_predictions)
+            print('%s storage passed' % storage_type)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Check that the native kernels of the built-in sparse updaters update the
+# same rows to the same values as their Python code, in float32 and float64,
+# and that arrays the kernels can not update in place are left to the
+# Python code:
+#
+#   python sparse_updater_kernels_test.py
+
+import numpy
+import torch
+from metaspore.updater import SGDTensorUpdater
+from metaspore.updater import AdaGradTensorUpdater
+from metaspore.updater import AdamTensorUpdater
+from metaspore.updater import FTRLTensorUpdater
+
+ROWS = 200
+COLS = 8
+COUNT = 60
+
+def make_updaters():
+    # The updaters and the index of the state holding non-negative values.
+    return [
+        (SGDTensorUpdater(0.1), None),
+        (AdaGradTensorUpdater(0.05, float_stable_eps=1e-6, l2=0.01), 0),
+        (AdamTensorUpdater(0.01, beta1=0.8, beta2=0.99, epsilon=1e-6), 1),
+        (FTRLTensorUpdater(l1=0.1, l2=1.0, alpha=0.5, beta=1.0), 0),
+    ]
+
+def make_blob(rng, dtype, updater, nonneg_state):
+    # Slices of a sparse tensor partition: the data followed by the states
+    # and some padding, so that the rows of param and state are strided.
+    states = updater.states_per_param or 0
+    blob = rng.normal(size=(ROWS, COLS * (1 + states) + 3)).astype(dtype)
+    if nonneg_state is not None:
+        begin = COLS * (1 + nonneg_state)
+        blob[:, begin:begin + COLS] = numpy.abs(blob[:, begin:begin + COLS])
+    return blob
+
+def get_views(blob, updater):
+    states = updater.states_per_param or 0
+    param = blob[:, :COLS]
+    state = blob[:, COLS:COLS * (1 + states)] if states else None
+    return param, state
+
+def make_push(rng, dtype):
+    indices = rng.choice(ROWS, size=COUNT, replace=False).astype(numpy.uint64)
+    keys = indices * 7 + 1
+    grad = rng.normal(size=(COUNT, COLS)).astype(dtype)
+    return grad, indices, keys
+
+def update_with_python(updater, views, grad, indices, keys):
+    param, state = views
+    type(updater).update_sparse(updater, name='t',
+                                param=torch.from_numpy(param),
+                                grad=torch.from_numpy(grad),
+                                state=None if state is None else torch.from_numpy(state),
+                                indices=torch.from_numpy(indices.view(numpy.int64)),
+                                keys=torch.from_numpy(keys.view(numpy.int64)))
+
+def get_tolerance(dtype):
+    if dtype == numpy.float32:
+        return dict(rtol=1e-5, atol=1e-6)
+    return dict(rtol=1e-12, atol=1e-14)
+
+def test_native_kernels():
+    rng = numpy.random.default_rng(0)
+    for dtype in numpy.float32, numpy.float64:
+        for updater, nonneg_state in make_updaters():
+            blob = make_blob(rng, dtype, updater, nonneg_state)
+            initial = blob.copy()
+            expected = blob.copy()
+            # Several pushes, so that the states updated by the first ones
+            # are used by the next ones.
+            for _ in range(3):
+                grad, indices, keys = make_push(rng, dtype)
+                param, state = get_views(blob, updater)
+                assert updater._can_update_sparse_natively(type(updater), param, grad, state, indices)
+                updater('t', param, grad, state, indices, keys)
+                update_with_python(updater, get_views(expected, updater), grad, indices, keys)
+            assert not numpy.array_equal(blob, initial)
+            assert numpy.allclose(blob, expected, **get_tolerance(dtype)), (dtype, updater)
+
+def test_python_fallback():
+    rng = numpy.random.default_rng(1)
+    for updater, nonneg_state in make_updaters():
+        blob = make_blob(rng, numpy.float32, updater, nonneg_state)
+        grad, indices, keys = make_push(rng, numpy.float32)
+        param, state = get_views(blob, updater)
+        # Strided columns, another dtype of grad and read-only params would
+        # be converted to temporary arrays by the kernels.
+        wide = numpy.repeat(blob, 2, axis=1)
+        strided_param = wide[:, :2 * COLS:2]
+        readonly_param = param.copy()
+        readonly_param.flags.writeable = False
+        cases = [
+            (strided_param, grad, state),
+            (param, grad.astype(numpy.float64), state),
+            (readonly_param, grad, state),
+        ]
+        for case_param, case_grad, case_state in cases:
+            assert not updater._can_update_sparse_natively(type(updater), case_param, case_grad,
+                                                           case_state, indices)
+        assert not updater._can_update_sparse_natively(type(updater), param, grad, state,
+                                                       indices.astype(numpy.int64))
+        # Strided columns are still updated in place, by the Python code.
+        expected = blob.copy()
+        update_with_python(updater, get_views(expected, updater), grad, indices, keys)
+        updater('t', strided_param, grad, None if state is None else state.copy(), indices, keys)
+        assert numpy.allclose(strided_param, expected[:, :COLS], **get_tolerance(numpy.float32)), updater
+
+def main():
+    test_native_kernels()
+    test_python_fallback()
+    print('sparse updater kernels passed')
+
+if __name__ == '__main__':
+    main()
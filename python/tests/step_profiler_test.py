@@ -0,0 +1,108 @@
+#
+# Copyright 2022 DMetaSoul
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Check the latency buckets of the step profiler, and that profiles pushed
+# by the workers as states merge on the coordinator into the same profile:
+#
+#   python step_profiler_test.py
+
+import numpy
+from metaspore.step_profiler import StepProfiler
+from metaspore.step_profiler import profile_phase
+
+def get_counts(profiler, name):
+    return profiler._phases[name][0]
+
+def test_buckets():
+    profiler = StepProfiler()
+    # Bucket i counts latencies in [2**(i-1), 2**i) microseconds.
+    cases = [(0, 0), (999, 0), (1000, 1), (1999, 1), (2000, 2), (3999, 2),
+             (4000, 3), (1000 * 2 ** 20, 21), (1000 * 2 ** 40, 31)]
+    for elapsed_ns, bucket in cases:
+        profiler.clear()
+        profiler.record('step', elapsed_ns)
+        counts = get_counts(profiler, 'step')
+        assert counts.sum() == 1 and counts[bucket] == 1, (elapsed_ns, bucket)
+        assert profiler._phases['step'][1] == elapsed_ns
+
+def test_percentiles():
+    profiler = StepProfiler()
+    for _ in range(98):
+        profiler.record('pull', 1500)
+    for _ in range(2):
+        profiler.record('pull', 50000)
+    counts = get_counts(profiler, 'pull')
+    # The upper bounds in milliseconds of buckets 1 and 6.
+    assert profiler._get_percentile(counts, 0.5) == 0.002
+    assert profiler._get_percentile(counts, 0.99) == 0.064
+    assert numpy.isnan(profiler._get_percentile(numpy.zeros_like(counts), 0.5))
+    assert 'pull: n=100 ' in profiler.format()
+
+def make_profiler(seed):
+    rng = numpy.random.default_rng(seed)
+    profiler = StepProfiler()
+    for name in 'pull', 'forward', 'push':
+        for elapsed_ns in rng.integers(0, 10 ** 8, size=50):
+            with profile_phase(profiler, name):
+                pass
+            profiler.record(name, int(elapsed_ns))
+    profiler.add_pulled_bytes(1000 * (seed + 1))
+    profiler.add_pushed_bytes(10 * (seed + 1))
+    return profiler
+
+def test_merge_states():
+    workers = [make_profiler(seed) for seed in range(3)]
+    coordinator = StepProfiler()
+    for worker in workers:
+        names, states = worker.get_states()
+        assert names == ('pull', 'forward', 'push')
+        coordinator.merge_states(names, states)
+    for name in 'pull', 'forward', 'push':
+        expected = sum(get_counts(worker, name) for worker in workers)
+        assert (get_counts(coordinator, name) == expected).all()
+        assert get_counts(coordinator, name).sum() == 300
+        total = sum(worker._phases[name][1] for worker in workers)
+        assert coordinator._phases[name][1] == total
+    assert coordinator.pulled_bytes == 6000
+    assert coordinator.pushed_bytes == 60
+    # Phases a worker has not seen yet are added on merging.
+    late = StepProfiler()
+    late.record('export', 1000)
+    coordinator.merge_states(*late.get_states())
+    assert coordinator.phase_names == ('pull', 'forward', 'push', 'export')
+
+def test_clear():
+    profiler = make_profiler(0)
+    assert not profiler.is_empty
+    names, states = profiler.get_states(clear=True)
+    assert names and profiler.is_empty
+    assert profiler.pulled_bytes == 0 and profiler.pushed_bytes == 0
+    # Transfer bytes alone keep the profile from being empty.
+    profiler.add_pushed_bytes(1)
+    assert not profiler.is_empty and not profiler.phase_names
+    profiler.clear()
+    assert profiler.is_empty
+    assert profiler.get_states()[0] == ()
+
+def main():
+    test_buckets()
+    test_percentiles()
+    test_merge_states()
+    test_clear()
+    print('step profiler passed')
+
+if __name__ == '__main__':
+    main()